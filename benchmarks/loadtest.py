@@ -0,0 +1,710 @@
+"""Multi-session load test of the running app.
+
+Launches the app with `streamlit run` on a local port and drives N concurrent
+sessions over Streamlit's websocket protocol, the way browsers do, through the
+flows analysts use: upload a CSV in Data_Manipulation, move its filters,
+reproject it in CRS, and batch geocode addresses against a stub Nominatim
+served from this process. The browser's own rendering is not measured.
+
+Records how long every rerun takes on the server and how long each action
+takes to settle (percentiles per step), the server's resident memory per
+session and its CPU saturation including the background job workers, and
+writes the report to benchmarks/results/loadtest-<commit>.json so runs can be
+compared across versions:
+
+    python benchmarks/loadtest.py --sessions 8
+    python benchmarks/loadtest.py --sessions 4 --flows data,filters --rows 100k
+    python benchmarks/loadtest.py --compare benchmarks/results/loadtest-<commit>.json
+"""
+import argparse
+import asyncio
+import base64
+import datetime
+import hashlib
+import http.server
+import json
+import os
+import platform
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import parse_qs, urljoin, urlsplit
+
+import numpy as np
+
+from suite import RESULTS_DIR, git_commit, parse_size, synthetic_points
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FLOWS = ("data", "filters", "crs", "geocode")
+SAMPLE_SECONDS = 0.5
+PERCENTILES = (50, 90, 95, 99)
+STARTUP_SECONDS = 60
+# Longest wait for one action, including the background jobs it starts
+ACTION_SECONDS = 600
+
+
+class StubNominatim(http.server.BaseHTTPRequestHandler):
+    # Answers /search like Nominatim with a position derived from the query,
+    # after a fixed delay standing in for the network round trip
+    delay = 0.05
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query).get("q", [""])[0]
+        time.sleep(self.delay)
+        if url.path.rstrip("/") != "/search":
+            self.send_error(404)
+            return
+        digest = hashlib.sha1(query.encode()).digest()
+        lat = 25 + digest[0] / 255 * 24
+        lon = -124 + digest[1] / 255 * 57
+        body = json.dumps(
+            [{"place_id": int.from_bytes(digest[:4], "big"), "lat": f"{lat:.6f}", "lon": f"{lon:.6f}", "display_name": query}]
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_nominatim(delay):
+    handler = type("Handler", (StubNominatim,), {"delay": delay})
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def addresses_csv(n, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = ["street,city,zip"]
+    for number, zip_code in zip(rng.integers(1, 9999, n), rng.integers(10000, 99999, n)):
+        rows.append(f"{number} Main St,Baltimore,{zip_code}")
+    return ("\n".join(rows) + "\n").encode()
+
+
+# App server
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_app(port, env, log):
+    # XSRF protection is off so the harness can upload without a browser cookie
+    command = [
+        sys.executable, "-m", "streamlit", "run", "home.py",
+        "--server.headless", "true",
+        "--server.port", str(port),
+        "--server.address", "127.0.0.1",
+        "--server.enableXsrfProtection", "false",
+        "--server.fileWatcherType", "none",
+        "--browser.gatherUsageStats", "false",
+    ]
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    import requests
+
+    deadline = time.time() + STARTUP_SECONDS
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The app exited with code {process.returncode}; see {log.name}")
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/_stcore/health", timeout=1).ok:
+                return process
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"The app did not start within {STARTUP_SECONDS} s; see {log.name}")
+
+
+# Websocket client: just enough of RFC 6455 for Streamlit's binary protobuf
+# stream, so the harness needs nothing beyond the app's own requirements
+
+
+class WebSocket:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host, port, path, subprotocol):
+        reader, writer = await asyncio.open_connection(host, port, limit=2**24)
+        key = base64.b64encode(os.urandom(16)).decode()
+        writer.write(
+            (
+                f"GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\nSec-WebSocket-Protocol: {subprotocol}\r\n"
+                f"Origin: http://{host}:{port}\r\n\r\n"
+            ).encode()
+        )
+        await writer.drain()
+        response = await reader.readuntil(b"\r\n\r\n")
+        if not response.startswith(b"HTTP/1.1 101"):
+            writer.close()
+            raise ConnectionError(f"Websocket upgrade refused: {response.splitlines()[0].decode()}")
+        return cls(reader, writer)
+
+    async def send(self, data, opcode=0x2):
+        header = bytearray([0x80 | opcode])
+        if len(data) < 126:
+            header.append(0x80 | len(data))
+        elif len(data) < 2**16:
+            header += struct.pack("!BH", 0x80 | 126, len(data))
+        else:
+            header += struct.pack("!BQ", 0x80 | 127, len(data))
+        mask = os.urandom(4)
+        masked = (np.frombuffer(data, dtype=np.uint8) ^ np.resize(np.frombuffer(mask, dtype=np.uint8), len(data))).tobytes()
+        self.writer.write(bytes(header) + mask + masked)
+        await self.writer.drain()
+
+    async def receive(self):
+        # The next complete message, or None once the server closes
+        message = b""
+        while True:
+            first, second = await self.reader.readexactly(2)
+            opcode, length = first & 0x0F, second & 0x7F
+            if length == 126:
+                (length,) = struct.unpack("!H", await self.reader.readexactly(2))
+            elif length == 127:
+                (length,) = struct.unpack("!Q", await self.reader.readexactly(8))
+            payload = await self.reader.readexactly(length)
+            if opcode == 0x8:
+                return None
+            if opcode == 0x9:
+                await self.send(payload, opcode=0xA)
+                continue
+            if opcode in (0x0, 0x1, 0x2):
+                message += payload
+                if first & 0x80:
+                    return message
+
+    async def close(self):
+        try:
+            await self.send(b"", opcode=0x8)
+        except ConnectionError:
+            pass
+        self.writer.close()
+
+
+# Sessions
+
+
+class Session:
+    # One simulated analyst: a websocket session that sets widget values and
+    # reruns the page like the browser does, timing every script run
+    def __init__(self, number, host, port, config, data):
+        self.number = number
+        self.host = host
+        self.port = port
+        self.config = config
+        self.data = data
+        self.socket = None
+        self.session_id = None
+        self.pages = {}
+        self.page_hash = ""
+        self.elements = []
+        self.widgets = {}
+        self.finished = asyncio.Queue()
+        self.file_urls = {}
+        self.run_started = None
+        self.runs = []
+        self.actions = []
+        self.errors = []
+        self.step = "connect"
+
+    async def connect(self):
+        self.socket = await WebSocket.connect(self.host, self.port, "/_stcore/stream", "streamlit")
+        self.listener = asyncio.create_task(self._listen())
+
+    async def close(self):
+        await self.socket.close()
+        self.listener.cancel()
+
+    async def _listen(self):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        while True:
+            data = await self.socket.receive()
+            if data is None:
+                self.finished.put_nowait(None)
+                return
+            msg = ForwardMsg()
+            msg.ParseFromString(data)
+            kind = msg.WhichOneof("type")
+            if kind == "new_session":
+                if msg.new_session.HasField("initialize"):
+                    self.session_id = msg.new_session.initialize.session_id
+                self._note_pages(msg.new_session.app_pages)
+                self.elements = []
+                self.run_started = time.perf_counter()
+            elif kind == "navigation":
+                # Newer Streamlit versions list the pages here instead
+                self._note_pages(msg.navigation.app_pages)
+            elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                element = msg.delta.new_element
+                self.elements.append((element.WhichOneof("type"), element))
+            elif kind == "script_finished":
+                if self.run_started is not None:
+                    self.runs.append((self.step, time.perf_counter() - self.run_started))
+                    self.run_started = None
+                self.finished.put_nowait(ForwardMsg.ScriptFinishedStatus.Name(msg.script_finished))
+            elif kind == "file_urls_response":
+                self.file_urls.pop(msg.file_urls_response.response_id).set_result(list(msg.file_urls_response.file_urls))
+
+    def _note_pages(self, app_pages):
+        # Page names are the script names, shown with spaces by newer versions
+        pages = {page.page_name.replace(" ", "_"): page.page_script_hash for page in app_pages}
+        self.pages.update({name: page_hash for name, page_hash in pages.items() if name})
+
+    def find(self, kind, label=None, key=None):
+        for element_type, element in reversed(self.elements):
+            if element_type != kind:
+                continue
+            widget = getattr(element, kind)
+            if (label is None or widget.label == label) and (key is None or widget.id.endswith(f"-{key}")):
+                return widget
+        raise LookupError(f"no {kind} {label or key!r} on the page")
+
+    def texts(self, kind, alert_format=None):
+        from streamlit.proto.Alert_pb2 import Alert
+
+        if kind == "alert":
+            wanted = Alert.Format.Value(alert_format)
+            return [element.alert.body for element_type, element in self.elements if element_type == "alert" and element.alert.format == wanted]
+        return [element.exception.message for element_type, element in self.elements if element_type == "exception"]
+
+    async def rerun(self, step, page=None):
+        # Sends the widget values and waits until the page settles, following
+        # the reruns the app makes itself while its background jobs run
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+
+        self.step = step
+        if page is not None:
+            self.page_hash = self.pages[page]
+        msg = BackMsg()
+        msg.rerun_script.page_script_hash = self.page_hash
+        msg.rerun_script.widget_states.widgets.extend(self.widgets.values())
+        # Button clicks are sent with one rerun only
+        self.widgets = {id_: state for id_, state in self.widgets.items() if state.WhichOneof("value") != "trigger_value"}
+        while not self.finished.empty():
+            self.finished.get_nowait()
+        start = time.perf_counter()
+        await self.socket.send(msg.SerializeToString())
+        while True:
+            status = await asyncio.wait_for(self.finished.get(), ACTION_SECONDS)
+            if status is None:
+                raise ConnectionError("the server closed the session")
+            if status == "FINISHED_SUCCESSFULLY":
+                break
+            if status == "FINISHED_WITH_COMPILE_ERROR":
+                raise RuntimeError("the page failed to compile")
+        self.actions.append((step, time.perf_counter() - start))
+        exceptions = self.texts("exception")
+        if exceptions:
+            raise RuntimeError(exceptions[0])
+
+    def expect(self, text):
+        if not any(text in body for body in self.texts("alert", "SUCCESS")):
+            errors = self.texts("alert", "ERROR")
+            raise RuntimeError(f"expected '{text}', got {errors or 'no message'}")
+
+    def _state(self, widget):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        state = WidgetState(id=widget.id)
+        self.widgets[widget.id] = state
+        return state
+
+    def choose(self, kind, option, label=None, key=None):
+        widget = self.find(kind, label, key)
+        # Newer Streamlit versions send the option itself, older ones its index
+        if "raw_value" in widget.DESCRIPTOR.fields_by_name:
+            self._state(widget).string_value = option
+        else:
+            self._state(widget).int_value = list(widget.options).index(option)
+
+    def set_range(self, low, high, label=None, key=None):
+        self._state(self.find("slider", label, key)).double_array_value.data[:] = [low, high]
+
+    def type_text(self, text, label):
+        self._state(self.find("text_input", label)).string_value = text
+
+    def click(self, label):
+        self._state(self.find("button", label)).trigger_value = True
+
+    async def upload(self, label, name, data, mime="text/csv"):
+        import requests
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+
+        widget = self.find("file_uploader", label)
+        request_id = uuid.uuid4().hex
+        response = self.file_urls[request_id] = asyncio.get_running_loop().create_future()
+        msg = BackMsg()
+        msg.file_urls_request.request_id = request_id
+        msg.file_urls_request.file_names.append(name)
+        msg.file_urls_request.session_id = self.session_id
+        await self.socket.send(msg.SerializeToString())
+        (urls,) = await asyncio.wait_for(response, ACTION_SECONDS)
+        url = urljoin(f"http://{self.host}:{self.port}/", urls.upload_url)
+        start = time.perf_counter()
+        uploaded = await asyncio.to_thread(requests.put, url, files={"file": (name, data, mime)}, timeout=ACTION_SECONDS)
+        uploaded.raise_for_status()
+        self.actions.append((f"{self.step.split(':')[0]}:transfer", time.perf_counter() - start))
+        info = self._state(widget).file_uploader_state_value.uploaded_file_info.add()
+        info.name, info.size, info.file_id = name, len(data), urls.file_id
+        info.file_urls.CopyFrom(urls)
+
+    # Flows
+
+    async def run(self, flows):
+        try:
+            await self.connect()
+            await self.rerun("home")
+            for flow in flows:
+                await getattr(self, f"_{flow}")()
+        except Exception as e:
+            self.errors.append(f"{self.step}: {type(e).__name__}: {e}")
+
+    async def _data(self):
+        await self.rerun("data:open", page="Data_Manipulation")
+        await self.upload("Upload one or more files", "points.csv", self.data["points"])
+        await self.rerun("data:upload")
+
+    async def _filters(self):
+        if "data" not in self.config["flows"]:
+            await self._data()
+        self.choose("selectbox", "pop", label="Choose column:")
+        await self.rerun("filters:column")
+        rng = np.random.default_rng(self.number + 1)
+        for _ in range(self.config["filter_moves"]):
+            low, high = sorted(rng.uniform(0, 1_000_000, 2))
+            self.set_range(float(low), float(high), label="Select a range of values")
+            await self.rerun("filters:range")
+
+    async def _crs(self):
+        await self.rerun("crs:open", page="CRS")
+        await self.upload("Upload one or more files", "points.csv", self.data["points"])
+        await self.rerun("crs:upload")
+        self.choose("radio", "CRS Transformer", label="Select Page")
+        await self.rerun("crs:transformer")
+        self.type_text(self.config["target_crs"], "Or enter new CRS (e.g., EPSG:4326):")
+        await self.rerun("crs:reproject")
+        self.expect("Successfully transformed")
+
+    async def _geocode(self):
+        await self.rerun("geocode:open", page="Geocoder")
+        await self.upload("Upload CSV", "addresses.csv", self.data["addresses"])
+        await self.rerun("geocode:upload")
+        self.click("Geocode")
+        await self.rerun("geocode:batch")
+        self.expect("Geocoding completed")
+
+
+async def drive(host, port, config, data):
+    sessions = [Session(number, host, port, config, data) for number in range(config["sessions"])]
+
+    async def start(session, delay):
+        await asyncio.sleep(delay)
+        await session.run(config["flows"])
+
+    delays = [config["ramp"] * number / len(sessions) for number in range(len(sessions))]
+    await asyncio.gather(*(start(session, delay) for session, delay in zip(sessions, delays)))
+    return sessions
+
+
+# Sampling the server and its job workers
+
+
+def rss_bytes(pid):
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def cpu_seconds(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+def process_tree(pid):
+    # The pid and every process descended from it, e.g. the job pool workers
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, []))
+    return tree
+
+
+class Sampler:
+    # Polls CPU time and resident memory of the server and its descendants;
+    # only available where /proc is (Linux)
+    def __init__(self, pid, interval=SAMPLE_SECONDS):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self.stopped = threading.Event()
+        self.supported = os.path.exists(f"/proc/{pid}/stat")
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        if self.supported:
+            self.thread.start()
+        return self
+
+    def _run(self):
+        previous = {pid: cpu_seconds(pid) for pid in process_tree(self.pid)}
+        previous_time = time.perf_counter()
+        while not self.stopped.wait(self.interval):
+            now = time.perf_counter()
+            tree = process_tree(self.pid)
+            current = {pid: cpu_seconds(pid) for pid in tree}
+            # Workers that exited during the interval are not counted
+            used = sum(seconds - previous.get(pid, 0.0) for pid, seconds in current.items())
+            self.samples.append(
+                {
+                    "time": round(now - self.started, 3),
+                    "cpu": round(max(used, 0.0) / ((now - previous_time) * (os.cpu_count() or 1)), 4),
+                    "server_rss": rss_bytes(self.pid) or 0,
+                    "workers_rss": sum(rss_bytes(pid) or 0 for pid in tree if pid != self.pid),
+                    "processes": len(tree),
+                }
+            )
+            previous, previous_time = current, now
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+
+# Report
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = np.asarray(values)
+    row = {f"p{p}": round(float(np.percentile(values, p)), 4) for p in PERCENTILES}
+    row.update(count=len(values), mean=round(float(values.mean()), 4), max=round(float(values.max()), 4))
+    return row
+
+
+def by_step(pairs):
+    steps = {}
+    for step, seconds in pairs:
+        steps.setdefault(step, []).append(seconds)
+    return {step: percentiles(values) for step, values in sorted(steps.items())}
+
+
+def summarize(config, sessions, samples, baseline, settled, wall):
+    runs = [run for session in sessions for run in session.runs]
+    actions = [action for session in sessions for action in session.actions]
+    cpu = [sample["cpu"] for sample in samples]
+    memory = {
+        "baseline_rss": baseline,
+        "settled_rss": settled,
+        "peak_server_rss": max((sample["server_rss"] for sample in samples), default=None),
+        "peak_workers_rss": max((sample["workers_rss"] for sample in samples), default=None),
+        "rss_per_session": None if None in (baseline, settled) else (settled - baseline) / config["sessions"],
+    }
+    if memory["peak_server_rss"] and baseline is not None:
+        memory["peak_rss_per_session"] = (memory["peak_server_rss"] - baseline) / config["sessions"]
+    return {
+        "wall_seconds": round(wall, 3),
+        "reruns": len(runs),
+        "errors": [{"session": session.number, "error": error} for session in sessions for error in session.errors],
+        "reruns_by_step": by_step(runs),
+        "all_reruns": percentiles([seconds for _, seconds in runs]),
+        "actions": by_step(actions),
+        "memory": memory,
+        "cpu": {
+            "mean": round(float(np.mean(cpu)), 4) if cpu else None,
+            "p95": round(float(np.percentile(cpu, 95)), 4) if cpu else None,
+            "saturated_fraction": round(float(np.mean(np.asarray(cpu) >= 0.9)), 4) if cpu else None,
+        },
+        "samples": samples,
+    }
+
+
+def _print_table(title, steps):
+    print(f"\n  {title:<22}{'count':>6}" + "".join(f"{f'p{p}':>9}" for p in PERCENTILES) + f"{'max':>9}")
+    for step, row in steps.items():
+        print(f"  {step:<22}{row['count']:>6}" + "".join(f"{row[f'p{p}']:9.3f}" for p in PERCENTILES) + f"{row['max']:9.3f}")
+
+
+def print_summary(report):
+    print(f"{report['config']['sessions']} sessions, {report['reruns']} reruns in {report['wall_seconds']:.1f} s")
+    _print_table("rerun (s)", report["reruns_by_step"])
+    _print_table("action to settled (s)", report["actions"])
+    memory = report["memory"]
+    if memory["rss_per_session"] is not None:
+        print(
+            f"\n  memory: {memory['baseline_rss'] / 2**20:.0f} MB before sessions, "
+            f"{memory['rss_per_session'] / 2**20:.1f} MB per session after, "
+            f"{(memory.get('peak_rss_per_session') or 0) / 2**20:.1f} MB per session at peak, "
+            f"{(memory['peak_workers_rss'] or 0) / 2**20:.0f} MB in job workers at peak"
+        )
+    if report["cpu"]["mean"] is not None:
+        print(
+            f"  cpu: {report['cpu']['mean']:.0%} of {report['cpu_count']} cores on average, "
+            f"p95 {report['cpu']['p95']:.0%}, saturated {report['cpu']['saturated_fraction']:.0%} of the time"
+        )
+    for error in report["errors"]:
+        print(f"  session {error['session']} failed: {error['error']}")
+
+
+def compare(base_path, report, threshold):
+    with open(base_path) as f:
+        base = json.load(f)
+    regressions = 0
+    print(f"\nCompared with {base_path} (ratios new/base, flagged above {threshold:.2f}):")
+    if base["config"] != report["config"]:
+        print("  note: the runs used different settings")
+    for step, row in report["reruns_by_step"].items():
+        previous = base["reruns_by_step"].get(step)
+        if not previous or not previous["p95"]:
+            continue
+        p50_ratio = row["p50"] / previous["p50"] if previous["p50"] else float("inf")
+        p95_ratio = row["p95"] / previous["p95"]
+        flag = "REGRESSION" if p95_ratio > threshold else ""
+        regressions += bool(flag)
+        print(f"  {step:<22}p50 x{p50_ratio:5.2f}  p95 x{p95_ratio:5.2f}  {flag}")
+    per_session, previous = report["memory"]["rss_per_session"], base["memory"].get("rss_per_session")
+    if per_session is not None and previous:
+        ratio = per_session / previous
+        flag = "REGRESSION" if ratio > threshold else ""
+        regressions += bool(flag)
+        print(f"  {'memory/session':<22}x{ratio:5.2f}  {flag}")
+    return regressions
+
+
+async def _load_test(port, config, data, pid):
+    host = "127.0.0.1"
+    # A first session imports the pages' libraries and warms the shared
+    # caches, so the baseline holds what every later session reuses
+    warmup = Session(-1, host, port, config, data)
+    await warmup.run(config["flows"])
+    if warmup.errors:
+        raise RuntimeError(f"Warm-up session failed: {warmup.errors[0]}")
+    await warmup.close()
+    await asyncio.sleep(1)
+    baseline = rss_bytes(pid)
+
+    sampler = Sampler(pid).start()
+    start = time.perf_counter()
+    sessions = await drive(host, port, config, data)
+    wall = time.perf_counter() - start
+    # Sessions stay connected until their memory has been counted
+    settled = rss_bytes(pid)
+    sampler.stop()
+    for session in sessions:
+        if session.socket is not None:
+            await session.close()
+    return sessions, sampler.samples, baseline, settled, wall
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--flows", default=",".join(FLOWS), help="comma separated subset of: " + ", ".join(FLOWS))
+    parser.add_argument("--rows", default="10k", help="rows in each uploaded CSV, e.g. 10k or 1M")
+    parser.add_argument("--addresses", type=int, default=20, help="rows in each geocoding upload")
+    parser.add_argument("--filter-moves", type=int, default=5, help="filter changes per session")
+    parser.add_argument("--target-crs", default="EPSG:3857")
+    parser.add_argument("--ramp", type=float, default=2.0, help="seconds over which sessions start")
+    parser.add_argument("--geocode-delay", type=float, default=0.05, help="stub Nominatim response time in seconds")
+    parser.add_argument("--output", help="defaults to benchmarks/results/loadtest-<commit>.json")
+    parser.add_argument("--compare", help="earlier report to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="ratio that counts as a regression")
+    args = parser.parse_args(argv)
+
+    flows = [flow.strip() for flow in args.flows.split(",")]
+    unknown = [flow for flow in flows if flow not in FLOWS]
+    if unknown:
+        parser.error(f"unknown flows: {', '.join(unknown)}")
+    config = {
+        "sessions": args.sessions,
+        "flows": flows,
+        "rows": parse_size(args.rows),
+        "addresses": args.addresses,
+        "filter_moves": args.filter_moves,
+        "target_crs": args.target_crs,
+        "ramp": args.ramp,
+        "geocode_delay": args.geocode_delay,
+    }
+    data = {
+        "points": synthetic_points(config["rows"]).to_csv(index=False).encode(),
+        "addresses": addresses_csv(config["addresses"]),
+    }
+
+    # The app and its job workers send geocoding requests to the stub
+    stub, url = start_stub_nominatim(args.geocode_delay)
+    env = {**os.environ, "OS_ST_GIS_NOMINATIM": url}
+    port = free_port()
+    log = tempfile.NamedTemporaryFile("w", prefix="os_st_gis_loadtest_", suffix=".log", delete=False)
+    app = start_app(port, env, log)
+    try:
+        sessions, samples, baseline, settled, wall = asyncio.run(_load_test(port, config, data, app.pid))
+    finally:
+        app.terminate()
+        try:
+            app.wait(30)
+        except subprocess.TimeoutExpired:
+            app.kill()
+        stub.shutdown()
+        log.close()
+
+    commit, dirty = git_commit()
+    report = {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": config,
+        **summarize(config, sessions, samples, baseline, settled, wall),
+    }
+    print_summary(report)
+    output = args.output or os.path.join(RESULTS_DIR, f"loadtest-{commit}{'-dirty' if dirty else ''}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {output} (app log: {log.name})")
+
+    if args.compare and compare(args.compare, report, args.threshold):
+        return 1
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
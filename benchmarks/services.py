@@ -0,0 +1,226 @@
+"""Incremental refresh of service layers against a local mock service.
+
+Serves a synthetic polygon layer as an ArcGIS REST FeatureServer layer, with
+and without editor tracking and in pages of at most MAX_RECORDS features, and
+as a WFS GeoJSON endpoint and an ArcGIS Hub style GeoJSON download, both
+answering conditional requests. After a full fetch, each round edits the layer on the
+server, refreshes the snapshot and checks that it matches the server feature
+for feature. The report compares full and incremental fetch times and the
+requests and bytes each refresh needed, and the script exits non-zero when a
+refreshed snapshot differs from the server:
+
+    python benchmarks/services.py [--size 10k] [--rounds 5] [--edits 20]
+"""
+import argparse
+import datetime
+import email.utils
+import http.server
+import json
+import re
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from suite import parse_size, synthetic_polygons
+
+from core import services
+
+LAYER_PATH = "/arcgis/rest/services/Parcels/FeatureServer/0"
+TRACKED_PATH = "/tracked" + LAYER_PATH
+UNTRACKED_PATH = "/untracked" + LAYER_PATH
+# An ArcGIS Hub download: an arcgis URL that is not a feature layer
+HUB_PATH = "/arcgis/api/v3/datasets/parcels_0/downloads/data"
+QUERY = "/query?where=1%3D1&outFields=*&f=geojson"
+TIMESTAMP = re.compile(r"EditDate >= TIMESTAMP '([^']+)'")
+OBJECT_ID = re.compile(r"OBJECTID > (\d+)")
+# Features per response, as a FeatureServer's maxRecordCount
+MAX_RECORDS = 1000
+
+
+class MockLayer:
+    # The server side: one layer, edited in place, and the traffic it served
+    def __init__(self, n, seed=0):
+        gdf = synthetic_polygons(n, seed)
+        gdf.insert(0, "OBJECTID", np.arange(1, n + 1))
+        self.rng = np.random.default_rng(seed)
+        # Last edited at some point over the past year
+        now = int(time.time() * 1000)
+        gdf["EditDate"] = self.rng.integers(now - 365 * 86_400_000, now, n)
+        self.gdf = gdf
+        self.modified = time.time()
+        self.version = 0
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes = 0
+
+    def edit(self, updates, inserts, deletes):
+        with self.lock:
+            now = int(time.time() * 1000)
+            gdf = self.gdf
+            rows = self.rng.choice(len(gdf), updates + deletes, replace=False)
+            updated, deleted = rows[:updates], rows[updates:]
+            gdf.iloc[updated, gdf.columns.get_loc("pop")] = self.rng.integers(0, 1_000_000, updates)
+            gdf.iloc[updated, gdf.columns.get_loc("EditDate")] = now
+            gdf.loc[gdf.index[updated], "geometry"] = gdf.geometry.iloc[updated].translate(0.001, 0.001).to_numpy()
+            added = synthetic_polygons(inserts, seed=int(self.rng.integers(1 << 31)))
+            added.insert(0, "OBJECTID", np.arange(inserts) + int(gdf["OBJECTID"].max()) + 1)
+            added["EditDate"] = now
+            self.gdf = type(gdf)(pd.concat([gdf.drop(gdf.index[deleted]), added], ignore_index=True), crs=gdf.crs)
+            self.modified = time.time()
+            self.version += 1
+
+    def query(self, params, tracked):
+        gdf = self.gdf
+        where = params.get("where", "1=1")
+        match = TIMESTAMP.search(where)
+        if match:
+            since = datetime.datetime.strptime(match.group(1), "%Y-%m-%d %H:%M:%S.%f").replace(tzinfo=datetime.timezone.utc)
+            gdf = gdf[gdf["EditDate"] >= round(since.timestamp() * 1000)]
+        match = OBJECT_ID.search(where)
+        if match:
+            gdf = gdf[gdf["OBJECTID"] > int(match.group(1))]
+        if "objectIds" in params:
+            gdf = gdf[gdf["OBJECTID"].isin([int(oid) for oid in params["objectIds"].split(",")])]
+        if params.get("returnCountOnly") == "true":
+            return {"count": len(gdf)}
+        if params.get("returnIdsOnly") == "true":
+            return {"objectIdFieldName": "OBJECTID", "objectIds": gdf["OBJECTID"].tolist()}
+        if not tracked:
+            gdf = gdf.drop(columns="EditDate")
+        offset = int(params.get("resultOffset", 0))
+        page = gdf.sort_values(params.get("orderByFields", "OBJECTID")).iloc[offset:offset + MAX_RECORDS]
+        geojson = json.loads(page.to_json())
+        for feature in geojson["features"]:
+            feature["id"] = feature["properties"]["OBJECTID"]
+        if offset + MAX_RECORDS < len(gdf):
+            geojson["properties"] = {"exceededTransferLimit": True}
+        return geojson
+
+
+class MockService(http.server.BaseHTTPRequestHandler):
+    layer = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        layer = self.layer
+        with layer.lock:
+            if url.path in (TRACKED_PATH, UNTRACKED_PATH):
+                info = {"objectIdField": "OBJECTID", "editFieldsInfo": None}
+                if url.path == TRACKED_PATH:
+                    info["editFieldsInfo"] = {"editDateField": "EditDate"}
+                self.reply(200, json.dumps(info).encode())
+            elif url.path in (TRACKED_PATH + "/query", UNTRACKED_PATH + "/query"):
+                self.reply(200, json.dumps(layer.query(params, url.path.startswith("/tracked"))).encode())
+            elif url.path in ("/wfs", HUB_PATH):
+                etag = f'"{layer.version}"'
+                headers = {"ETag": etag, "Last-Modified": email.utils.formatdate(layer.modified, usegmt=True)}
+                if self.headers.get("If-None-Match") == etag:
+                    self.reply(304, b"", headers)
+                else:
+                    # Feature ids stay the same across edits, as WFS servers and Hub keep them
+                    body = layer.gdf.drop(columns="EditDate").set_index(layer.gdf["OBJECTID"].to_numpy()).to_json()
+                    self.reply(200, body.encode(), headers)
+            else:
+                self.send_error(404)
+
+    def reply(self, status, body, headers=None):
+        self.layer.requests += 1
+        self.layer.bytes += len(body)
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_service(layer):
+    handler = type("Handler", (MockService,), {"layer": layer})
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def matches(snapshot, layer):
+    # The snapshot holds the server's features, attributes and geometries
+    expected = layer.gdf.sort_values("OBJECTID").reset_index(drop=True)
+    actual = snapshot.gdf.sort_values("OBJECTID").reset_index(drop=True)
+    if len(actual) != len(expected) or not (actual["OBJECTID"].to_numpy() == expected["OBJECTID"].to_numpy()).all():
+        return False
+    if not (actual["pop"].to_numpy() == expected["pop"].to_numpy()).all():
+        return False
+    if not actual.geometry.geom_equals_exact(expected.geometry, tolerance=1e-9).all():
+        return False
+    return len(snapshot.bounds) == len(snapshot.gdf)
+
+
+def run(name, kind, path, args):
+    layer = MockLayer(args.size)
+    server, base = start_service(layer)
+    url = f"{base}{path}"
+    # Without editor tracking only inserts and deletes can be found
+    updates = 0 if name == "arcrest (object ids)" else args.edits
+    rows, failed = [], False
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            store = services.SnapshotStore(directory)
+
+            def step(label, max_age=0, store=store):
+                requests_before, bytes_before = layer.requests, layer.bytes
+                start = time.perf_counter()
+                snapshot = store.get(url, kind, max_age)
+                seconds = time.perf_counter() - start
+                ok = matches(snapshot, layer)
+                rows.append((label, seconds, layer.requests - requests_before, layer.bytes - bytes_before, snapshot.last_refresh, ok))
+                return ok
+
+            ok = step("full fetch")
+            ok &= step("no changes")
+            for _ in range(args.rounds):
+                layer.edit(updates, args.edits, args.edits)
+                ok &= step(f"+{args.edits} -{args.edits} ~{updates}")
+            ok &= step("reopen from disk", max_age=float("inf"), store=services.SnapshotStore(directory))
+            failed = not ok
+    finally:
+        server.shutdown()
+    print(f"{name}: {args.size} features")
+    for label, seconds, requests, size, refresh, ok in rows:
+        print(
+            f"    {label:<20} {seconds * 1000:8.1f} ms  {requests:3d} requests  {size / 1e6:7.2f} MB  "
+            f"{services.describe(refresh):<50} {'ok' if ok else 'MISMATCH'}"
+        )
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--size", type=parse_size, default=parse_size("10k"))
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--edits", type=int, default=20, help="features added, removed and changed per round")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for name, kind, path in (
+        ("arcrest (edit dates)", "arcrest", TRACKED_PATH + QUERY),
+        ("arcrest (object ids)", "arcrest", UNTRACKED_PATH + QUERY),
+        ("wfs (conditional requests)", "wfs", "/wfs"),
+        # Fetched as a plain URL, as before snapshots, and refreshed like WFS
+        ("arcgis hub download", "arcrest", HUB_PATH + "?format=geojson&spatialRefId=4326"),
+    ):
+        failed |= run(name, kind, path, args)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
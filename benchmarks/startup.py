@@ -0,0 +1,89 @@
+"""Import cost of the app entry points on a cold interpreter.
+
+Each page's top-level imports run in a fresh process under ``-X importtime``
+after ``streamlit`` itself, which the server has always loaded already. The
+report lists the most expensive modules per page, and the script exits non-zero
+when a page goes over its budget:
+
+    python benchmarks/startup.py [--repeat 3] [--top 8]
+"""
+import argparse
+import ast
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MARKER = "--- page imports ---"
+
+# Milliseconds on top of streamlit, measured on a single cold CPU
+BUDGETS = {
+    "home.py": 50,
+    "pages/Geocoder.py": 50,
+    "pages/CRS.py": 1600,
+    "pages/Data_Manipulation.py": 1600,
+    "pages/Geospatial_Data_Visualization.py": 1600,
+    "pages/Web_Services.py": 1600,
+    "pages/Spatial_Analysis.py": 1600,
+}
+
+
+def page_imports(path):
+    with open(os.path.join(ROOT, path)) as f:
+        tree = ast.parse(f.read(), path)
+    statements = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+    return "\n".join(ast.unparse(node) for node in statements)
+
+
+def import_times(code):
+    # Returns {top-level module: cumulative microseconds} for the page imports
+    script = f"import streamlit\nimport sys\nprint({MARKER!r}, file=sys.stderr, flush=True)\n{code}"
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script], cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if result.returncode:
+        raise RuntimeError(result.stderr)
+    lines = result.stderr.split(MARKER, 1)[1].splitlines()
+    times = {}
+    for line in lines:
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nested imports are indented; only count each top-level import once
+        if not name.startswith(" ") or name[1] == " ":
+            continue
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def measure(path, repeat):
+    code = page_imports(path)
+    runs = [import_times(code) for _ in range(repeat)]
+    best = min(runs, key=lambda times: sum(times.values()))
+    return sum(best.values()) / 1000, best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("pages", nargs="*", default=list(BUDGETS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    over_budget = []
+    for path in args.pages:
+        total, times = measure(path, args.repeat)
+        budget = BUDGETS.get(path)
+        status = "" if budget is None else ("ok" if total <= budget else "OVER BUDGET")
+        print(f"{path}: {total:.0f} ms (budget {budget} ms) {status}")
+        for name, cost in sorted(times.items(), key=lambda item: -item[1])[: args.top]:
+            print(f"    {cost / 1000:8.1f} ms  {name}")
+        if budget is not None and total > budget:
+            over_budget.append(path)
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
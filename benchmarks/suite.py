@@ -0,0 +1,514 @@
+"""Headless benchmarks of the data paths behind the pages.
+
+Runs without Streamlit or network access: datasets are synthetic points and
+polygons, and geocoding goes through a stub. Each case runs in its own process
+and records wall time (best of --repeat), peak traced memory and output size.
+Results are written to benchmarks/results/<commit>.json so runs can be compared
+across commits:
+
+    python benchmarks/suite.py --sizes 10k,100k,1M
+    python benchmarks/suite.py --cases markers,geojson --sizes 10k
+    python benchmarks/suite.py --compare benchmarks/results/<commit>.json
+"""
+import argparse
+import datetime
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+DEFAULT_SIZES = "10k,100k"
+UNITS = {"k": 1_000, "m": 1_000_000}
+CATEGORIES = ("residential", "commercial", "industrial", "park", "school", "hospital", "farm", "water")
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    if text[-1] in UNITS:
+        return int(float(text[:-1]) * UNITS[text[-1]])
+    return int(text)
+
+
+def synthetic_points(n, seed=0):
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "name": pd.Series(np.arange(n)).astype(str).radd("site "),
+            "lat": rng.uniform(25, 49, n).round(6),
+            "lng": rng.uniform(-124, -67, n).round(6),
+            "pop": rng.integers(0, 1_000_000, n),
+            "category": pd.Categorical.from_codes(rng.integers(0, len(CATEGORIES), n), CATEGORIES).astype(str),
+        }
+    )
+
+
+def synthetic_polygons(n, seed=0):
+    import geopandas as gpd
+    import shapely
+
+    df = synthetic_points(n, seed)
+    size = 0.01
+    geometry = shapely.box(df["lng"] - size, df["lat"] - size, df["lng"] + size, df["lat"] + size)
+    return gpd.GeoDataFrame(df.drop(columns=["lat", "lng"]), geometry=geometry, crs="EPSG:4326")
+
+
+def synthetic_boundaries(n, seed=0):
+    # Adjacent polygons with detailed shared borders, like administrative areas
+    import geopandas as gpd
+    import numpy as np
+    import shapely
+
+    df = synthetic_points(n, seed)
+    extent = shapely.box(-124, 25, -67, 49)
+    cells = shapely.get_parts(shapely.voronoi_polygons(shapely.multipoints(np.column_stack([df["lng"], df["lat"]])), extend_to=extent))
+    cells = shapely.segmentize(shapely.intersection(cells, extent), 0.05)
+    # Cells come back in arbitrary order; match them to their seed points
+    order = shapely.STRtree(cells).query(shapely.points(df["lng"], df["lat"]), predicate="intersects")
+    geometry = np.empty(n, dtype=object)
+    geometry[order[0]] = cells[order[1]]
+    return gpd.GeoDataFrame(df.drop(columns=["lat", "lng"]), geometry=geometry, crs="EPSG:4326")
+
+
+def point_layer(n):
+    from core import io
+
+    return io.points_from_columns(synthetic_points(n), "lat", "lng")
+
+
+class CountingSink:
+    # Measures export size without holding the output in memory
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        return len(data)
+
+
+class StubGeocoder:
+    class Location:
+        latitude = 39.2904
+        longitude = -76.6122
+
+    def geocode(self, address):
+        return self.Location() if len(address) % 10 else None
+
+
+# Each case is (setup, run, largest size it is run at). setup builds the input
+# outside the timed region; run returns the output size in bytes, or None.
+_scratch = tempfile.TemporaryDirectory(prefix="os_st_gis_bench_")
+
+
+def _setup_csv(n):
+    path = os.path.join(_scratch.name, f"points_{n}.csv")
+    synthetic_points(n).to_csv(path, index=False)
+    return path
+
+
+def _run_load_tabular(path):
+    # Data_Manipulation._load_tabular_data: read the file, then clean the coordinates into points
+    from core import coords, io
+
+    df = io.read_tabular(path, "csv")
+    latitude_column, longitude_column = coords.detect_lat_long(df)
+    gdf, _ = io.clean_points(df, latitude_column, longitude_column)
+    return int(gdf.memory_usage(deep=True).sum())
+
+
+def _run_markers(gdf):
+    from core import layers
+
+    map_ = layers.new_map([37, -95], zoom_start=4)
+    layers.add_markers(map_, layers.marker_data(gdf, "lat", "lng"), "points")
+    return len(map_.get_root().render())
+
+
+def _run_geojson(gdf):
+    from core import layers
+
+    map_ = layers.new_map([37, -95], zoom_start=4)
+    layers.add_geojson_layer(map_, json.loads(gdf.to_json()), "polygons")
+    return len(map_.get_root().render())
+
+
+def _run_geojson_transport(gdf):
+    # views.add_geojson_layer: the smallest encoding is picked for the layer
+    from core import layers, topology
+
+    data = json.loads(gdf.to_json())
+    map_ = layers.new_map([37, -95], zoom_start=4)
+    encoding, payload, _ = topology.encode_layer(data, overhead=len(layers.COMPACT_LAYER_SCRIPT))
+    layers.add_geojson_layer(map_, data, "boundaries", transport=(encoding, payload))
+    return len(map_.get_root().render())
+
+
+def _run_filter(gdf):
+    # The two branches of views.filter_dataframe: a value list and a numeric range
+    selected = gdf[gdf["category"].isin(["park", "school"])]
+    selected = selected[(selected["pop"] >= 100_000) & (selected["pop"] <= 500_000)]
+    return int(selected.memory_usage(deep=True).sum())
+
+
+def _run_table_page(gdf):
+    from core.table import TableIndex
+
+    index = TableIndex(gdf)
+    window, _ = index.window(0, 100, None, "pop", True, "name", "12")
+    return int(window.memory_usage(deep=True).sum())
+
+
+def _run_to_crs(gdf):
+    return int(gdf.to_crs("EPSG:3857").memory_usage(deep=True).sum())
+
+
+def _run_aggregate(gdf):
+    from core import aggregate
+
+    bins = aggregate.bin_points(gdf["lng"], gdf["lat"], 8, "hexagon", gdf["pop"], "sum")
+    return int(bins.memory_usage(deep=True).sum())
+
+
+def _run_export_csv(gdf):
+    from core.combine import CombinedView
+
+    sink = CountingSink()
+    CombinedView([gdf], ["points"]).export(sink, "csv")
+    return sink.size
+
+
+def _setup_mixed_layers(n):
+    # CSV points and GeoJSON-style polygons sharing no attribute columns, with
+    # integer and boolean columns that only one of them has
+    points = point_layer(n)
+    polygons = synthetic_polygons(max(n // 10, 1), seed=1).drop(columns=["name", "pop", "category"])
+    polygons["zoned"] = polygons.index % 2 == 0
+    polygons["parcel"] = polygons.index.astype("int64")
+    return points, polygons
+
+
+def _run_export_mixed(layers):
+    # Every format must export the union, with the columns a layer lacks left empty
+    import geopandas as gpd
+    import pandas as pd
+
+    from core.combine import CombinedView
+
+    points, polygons = layers
+    size = 0
+    for extension in ("csv", "geojson", "parquet"):
+        path = os.path.join(_scratch.name, f"mixed.{extension}")
+        with open(path, "wb") as sink:
+            CombinedView(layers, ["points", "polygons"]).export(sink, extension)
+        size += os.path.getsize(path)
+        result = gpd.read_file(path) if extension == "geojson" else pd.read_csv(path) if extension == "csv" else gpd.read_parquet(path)
+        counts = result["layer"].value_counts()
+        if len(result) != len(points) + len(polygons) or counts.get("polygons") != len(polygons):
+            raise AssertionError(f"{extension}: expected {len(points)} + {len(polygons)} rows, got {counts.to_dict()}")
+        if result.loc[result["layer"] == "points", ["zoned", "parcel"]].notna().any().any():
+            raise AssertionError(f"{extension}: polygon-only columns filled in for points")
+        if result.loc[result["layer"] == "polygons", "pop"].notna().any():
+            raise AssertionError(f"{extension}: point-only columns filled in for polygons")
+    # Formats that carry a CRS must read back in the one they were written in
+    for extension in ("geojson", "parquet"):
+        path = os.path.join(_scratch.name, f"mercator.{extension}")
+        with open(path, "wb") as sink:
+            CombinedView([polygons], ["polygons"], crs="EPSG:3857", layer_column=False).export(sink, extension)
+        result = gpd.read_file(path) if extension == "geojson" else gpd.read_parquet(path)
+        if result.crs is None or result.crs.to_epsg() != 3857 or "layer" in result.columns:
+            raise AssertionError(f"{extension}: expected EPSG:3857 without a layer column, got {result.crs} {list(result.columns)}")
+    return size
+
+
+def _run_export_out_of_core(path):
+    # Data_Manipulation's out-of-core export: a filtered query streamed into
+    # every format; an area keeps part of the rows, an empty one none, and
+    # CSV still gets its header
+    import tempfile
+
+    import geopandas as gpd
+    import pandas as pd
+
+    from core import backend
+
+    query = backend.DuckDBBackend(tempfile.mkdtemp(dir=_scratch.name))
+    query.register("points", path, "lat", "lng")
+    size = 0
+    for predicates in ([("bbox", -100, 30, -80, 40)], [("bbox", 0, 0, 1, 1)]):
+        expected = query.count("points", predicates)
+        for extension in ("csv", "geojson", "parquet"):
+            out = os.path.join(_scratch.name, f"out_of_core.{extension}")
+            with open(out, "wb") as sink:
+                query.export("points", sink, predicates, extension)
+            size += os.path.getsize(out)
+            result = pd.read_csv(out) if extension == "csv" else gpd.read_file(out) if extension == "geojson" else gpd.read_parquet(out)
+            if len(result) != expected:
+                raise AssertionError(f"{extension}: expected {expected} rows in {predicates}, got {len(result)}")
+            if extension == "csv" and "lat" not in result.columns:
+                raise AssertionError(f"csv: no header in {list(result.columns)}")
+        if not (result.geometry.x.between(-100, -80) & result.geometry.y.between(30, 40)).all():
+            raise AssertionError(f"parquet: rows outside {predicates}")
+    return size
+
+
+# Queries from the CRS page and the system each should list first
+CRS_QUERIES = (
+    ("UTM zone 18N", "EPSG:32618"),
+    ("utm 33n", "EPSG:32633"),
+    ("4326", "EPSG:4326"),
+    ("wgs 84", "EPSG:4326"),
+    ("pseudo-mercator", "EPSG:3857"),
+    ("british national grid", "EPSG:27700"),
+    ("NAD83 / UTM zone 10N", "EPSG:26910"),
+)
+
+
+def _setup_crs_index(n):
+    # The index is the same at every size, so the case only runs at the smallest
+    from core.crs import CRSIndex
+
+    return CRSIndex()
+
+
+def _run_crs_search(index):
+    for query, expected in CRS_QUERIES:
+        hits = index.search(query)
+        if not hits or index.code(hits[0]) != expected:
+            raise AssertionError(f"{query!r}: expected {expected} first, got {[index.code(info) for info in hits[:5]]}")
+    return None
+
+
+def _setup_layer_pair(n):
+    # Points against a tenth as many polygons, as in a point-in-polygon join
+    return point_layer(n), synthetic_polygons(max(n // 10, 1), seed=1)
+
+
+def _run_spatial_join(layers):
+    from core import analysis
+
+    result = analysis.spatial_join(*layers, predicate="within")
+    return int(result.memory_usage(deep=True).sum())
+
+
+def _run_nearest(layers):
+    from core import analysis
+
+    result = analysis.nearest(*layers)
+    return int(result.memory_usage(deep=True).sum())
+
+
+def _setup_addresses(n):
+    import pandas as pd
+
+    df = synthetic_points(n)
+    return pd.DataFrame({"street": df["name"], "city": df["category"], "zip": df["pop"] % 100_000})
+
+
+def _run_geocode(df):
+    # The job behind pages/Geocoder.py, one request per row, against a stub
+    from core import geocode
+
+    df = geocode.geocode_addresses(df, StubGeocoder())
+    return int(df.memory_usage(deep=True).sum())
+
+
+def _setup_reverse_geocode(n):
+    from core import geocode
+    import geopandas as gpd
+
+    return synthetic_points(n), geocode.PlaceIndex(gpd.read_file(geocode.DEFAULT_PLACES))
+
+
+def _run_reverse_geocode(data):
+    from core import geocode
+
+    df, index = data
+    df = geocode.reverse_geocode(df, index, "lat", "lng")
+    return int(df.memory_usage(deep=True).sum())
+
+
+def _setup_raster(n):
+    # A square single-band GeoTIFF with n pixels and overviews, like a DEM
+    import numpy as np
+    import rasterio
+    from rasterio.enums import Resampling
+    from rasterio.transform import from_origin
+
+    side = int(n ** 0.5)
+    path = os.path.join(_scratch.name, f"raster_{n}.tif")
+    profile = {
+        "driver": "GTiff", "width": side, "height": side, "count": 1, "dtype": "uint16", "crs": "EPSG:32618",
+        "transform": from_origin(300000, 4500000, 10, 10), "tiled": True, "compress": "deflate", "nodata": 0,
+    }
+    with rasterio.open(path, "w", **profile) as dst:
+        rows, columns = np.ogrid[0:side, 0:side]
+        dst.write((1000 + 500 * np.sin(columns / 700) + 300 * np.cos(rows / 900)).astype("uint16"), 1)
+        dst.build_overviews([factor for factor in (2, 4, 8, 16, 32, 64) if side // factor >= 256], Resampling.average)
+    return path
+
+
+def _run_raster(path):
+    from core import raster
+
+    raster.TILE_CACHE = raster.TileCache()
+    layer = raster.RasterLayer(path)
+    layer.statistics()
+    image, _ = layer.render(layer.auto_zoom(), [1], "viridis")
+    return len(image)
+
+
+CASES = {
+    "load_tabular": (_setup_csv, _run_load_tabular, 10_000_000),
+    "markers": (point_layer, _run_markers, 1_000_000),
+    "geojson": (synthetic_polygons, _run_geojson, 1_000_000),
+    "boundaries": (synthetic_boundaries, _run_geojson, 100_000),
+    "boundaries_transport": (synthetic_boundaries, _run_geojson_transport, 100_000),
+    "filter": (point_layer, _run_filter, 10_000_000),
+    "table_page": (point_layer, _run_table_page, 10_000_000),
+    "to_crs": (point_layer, _run_to_crs, 10_000_000),
+    "aggregate": (point_layer, _run_aggregate, 10_000_000),
+    "export_csv": (point_layer, _run_export_csv, 10_000_000),
+    "export_mixed": (_setup_mixed_layers, _run_export_mixed, 100_000),
+    "export_out_of_core": (_setup_csv, _run_export_out_of_core, 10_000_000),
+    "crs_search": (_setup_crs_index, _run_crs_search, 10_000),
+    "spatial_join": (_setup_layer_pair, _run_spatial_join, 10_000_000),
+    "nearest": (_setup_layer_pair, _run_nearest, 1_000_000),
+    "geocode": (_setup_addresses, _run_geocode, 100_000),
+    "reverse_geocode": (_setup_reverse_geocode, _run_reverse_geocode, 10_000_000),
+    "raster": (_setup_raster, _run_raster, 100_000_000),
+}
+
+
+def run_case(name, size, repeat):
+    setup, run, _ = CASES[name]
+    times = []
+    output = None
+    for _ in range(repeat):
+        data = setup(size)
+        gc.collect()
+        start = time.perf_counter()
+        output = run(data)
+        times.append(time.perf_counter() - start)
+        del data
+
+    # Memory is measured in a separate pass; tracing slows the run down
+    data = setup(size)
+    gc.collect()
+    tracemalloc.start()
+    run(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "case": name,
+        "size": size,
+        "seconds": min(times),
+        "mean_seconds": sum(times) / len(times),
+        "peak_memory": peak,
+        "output_bytes": output,
+    }
+
+
+def _run_isolated(args):
+    name, size, repeat = args
+    try:
+        return run_case(name, size, repeat)
+    except Exception as e:
+        return {"case": name, "size": size, "error": f"{type(e).__name__}: {e}"}
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--", "core", "pages"], cwd=ROOT, capture_output=True, text=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+    return commit, bool(dirty.strip())
+
+
+def compare(base_path, results, threshold):
+    with open(base_path) as f:
+        base = {(row["case"], row["size"]): row for row in json.load(f)["results"] if "error" not in row}
+    regressions = 0
+    print(f"\nCompared with {base_path} (ratios new/base, flagged above {threshold:.2f}):")
+    for row in results:
+        previous = base.get((row["case"], row["size"]))
+        if previous is None or "error" in row:
+            continue
+        time_ratio = row["seconds"] / previous["seconds"] if previous["seconds"] else float("inf")
+        memory_ratio = row["peak_memory"] / previous["peak_memory"] if previous["peak_memory"] else float("inf")
+        flag = "REGRESSION" if max(time_ratio, memory_ratio) > threshold else ""
+        regressions += bool(flag)
+        print(f"  {row['case']:<14}{row['size']:>10,}  time x{time_ratio:5.2f}  memory x{memory_ratio:5.2f}  {flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma separated, e.g. 10k,100k,1M,10M")
+    parser.add_argument("--cases", default=",".join(CASES), help="comma separated subset of: " + ", ".join(CASES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="defaults to benchmarks/results/<commit>.json")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="ratio that counts as a regression")
+    args = parser.parse_args(argv)
+
+    sizes = [parse_size(size) for size in args.sizes.split(",")]
+    cases = [case.strip() for case in args.cases.split(",")]
+    unknown = [case for case in cases if case not in CASES]
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(unknown)}")
+    jobs = [(case, size, args.repeat) for case in cases for size in sizes if size <= CASES[case][2]]
+
+    # A fresh process per case keeps caches and allocator state from leaking between them
+    results = []
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        for row in pool.imap(_run_isolated, jobs):
+            results.append(row)
+            if "error" in row:
+                print(f"{row['case']:<14}{row['size']:>10,}  {row['error']}")
+                continue
+            output = "" if row["output_bytes"] is None else f"{row['output_bytes'] / 2**20:10.1f} MB out"
+            print(
+                f"{row['case']:<14}{row['size']:>10,}  {row['seconds']:8.3f} s"
+                f"  {row['peak_memory'] / 2**20:9.1f} MB peak  {output}"
+            )
+
+    commit, dirty = git_commit()
+    report = {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}{'-dirty' if dirty else ''}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {output}")
+
+    if args.compare and compare(args.compare, results, args.threshold):
+        return 1
+    return 1 if any("error" in row for row in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS = 6378137.0
+MAX_LATITUDE = 85.0511
+CELL_PIXELS = 40
+AGGREGATIONS = ("count", "sum", "mean")
+BIN_KINDS = ("hexagon", "grid")
+
+
+def cell_size(zoom, cell_pixels=CELL_PIXELS):
+    # Web Mercator metres covered by `cell_pixels` screen pixels at this zoom
+    return cell_pixels * 2 * np.pi * EARTH_RADIUS / 256 / 2 ** zoom
+
+
+def to_mercator(lon, lat):
+    lat = np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE)
+    x = np.radians(lon) * EARTH_RADIUS
+    y = np.log(np.tan(np.pi / 4 + np.radians(lat) / 2)) * EARTH_RADIUS
+    return x, y
+
+
+def from_mercator(x, y):
+    lon = np.degrees(x / EARTH_RADIUS)
+    lat = np.degrees(2 * np.arctan(np.exp(y / EARTH_RADIUS)) - np.pi / 2)
+    return lon, lat
+
+
+def _hex_cells(x, y, size):
+    # Pointy-top axial coordinates with cube rounding, all vectorized
+    q = (np.sqrt(3) / 3 * x - y / 3) / size
+    r = (2 / 3 * y) / size
+    s = -q - r
+    rq, rr, rs = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+    return rq.astype(np.int64), rr.astype(np.int64)
+
+
+def _hex_polygons(q, r, size):
+    cx = size * np.sqrt(3) * (q + r / 2)
+    cy = size * 1.5 * r
+    angles = np.radians(30 + 60 * np.arange(7))
+    xs = cx[:, None] + size * np.cos(angles)[None, :]
+    ys = cy[:, None] + size * np.sin(angles)[None, :]
+    return xs, ys
+
+
+def _grid_polygons(i, j, size):
+    corners_x = np.array([0, 1, 1, 0, 0])
+    corners_y = np.array([0, 0, 1, 1, 0])
+    xs = (i[:, None] + corners_x[None, :]) * size
+    ys = (j[:, None] + corners_y[None, :]) * size
+    return xs, ys
+
+
+def bin_points(lon, lat, zoom, kind="hexagon", values=None, how="count"):
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    valid = np.isfinite(lon) & np.isfinite(lat)
+    if values is not None:
+        values = pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype=float)[valid]
+    x, y = to_mercator(lon[valid], lat[valid])
+    size = cell_size(zoom)
+
+    if kind == "hexagon":
+        a, b = _hex_cells(x, y, size)
+    else:
+        a, b = np.floor(x / size).astype(np.int64), np.floor(y / size).astype(np.int64)
+
+    # Pack both cell coordinates into one int64 so grouping is a single np.unique
+    keys = (a << 32) + (b & 0xFFFFFFFF)
+    cells, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    a, b = a[first], b[first]
+    counts = np.bincount(inverse, minlength=len(cells))
+
+    data = {"count": counts}
+    if values is not None and how != "count":
+        present = ~np.isnan(values)
+        totals = np.bincount(inverse, weights=np.where(present, values, 0), minlength=len(cells))
+        if how == "sum":
+            data["sum"] = totals
+        else:
+            seen = np.bincount(inverse, weights=present, minlength=len(cells))
+            with np.errstate(invalid="ignore", divide="ignore"):
+                data["mean"] = totals / seen
+
+    if kind == "hexagon":
+        xs, ys = _hex_polygons(a, b, size)
+    else:
+        xs, ys = _grid_polygons(a, b, size)
+    import geopandas as gpd
+    import shapely
+
+    lons, lats = from_mercator(xs, ys)
+    geometry = shapely.polygons(np.stack([lons, lats], axis=-1))
+    return gpd.GeoDataFrame(data, geometry=geometry, crs="EPSG:4326")
+
+
+def numeric_columns(df):
+    return [
+        column for column in df.columns
+        if column != "geometry" and pd.to_numeric(df[column].head(1000), errors="coerce").notna().any()
+    ]
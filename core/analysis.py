@@ -0,0 +1,221 @@
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from core import jobs
+
+OPERATIONS = ("Spatial join", "Buffer", "Within distance", "Nearest")
+PREDICATES = ("intersects", "within", "contains", "covers", "covered_by", "touches", "crosses", "overlaps")
+# The same relationship with the two layers swapped
+CONVERSE = {"within": "contains", "contains": "within", "covers": "covered_by", "covered_by": "covers"}
+JOIN_TYPES = ("inner", "left")
+# Inputs smaller than this are queried in-process; larger ones are split into
+# chunks that run on a process pool when there is more than one core
+PARALLEL_ROWS = 200000
+CHUNK_ROWS = 250000
+
+
+def _geometries(gdf):
+    return np.asarray(gdf.geometry.values, dtype=object)
+
+
+def _is_points(geometries):
+    import shapely
+
+    return len(geometries) > 0 and bool(np.all(shapely.get_type_id(geometries) == 0))
+
+
+def _present(geometries):
+    import shapely
+
+    return ~(shapely.is_missing(geometries) | shapely.is_empty(geometries))
+
+
+def analysis_crs(*frames):
+    # Distances are measured in metres: projected layers keep their CRS, and
+    # geographic ones use an azimuthal equidistant projection centred on the
+    # inputs, which keeps distances close to true across a region
+    from pyproj import CRS
+
+    crs = frames[0].crs
+    if crs is not None and crs.is_projected:
+        return crs
+    bounds = np.array([frame.to_crs("EPSG:4326").total_bounds for frame in frames if len(frame)])
+    if not len(bounds) or not np.isfinite(bounds).all():
+        return CRS.from_epsg(3857)
+    lon = (bounds[:, 0].min() + bounds[:, 2].max()) / 2
+    lat = (bounds[:, 1].min() + bounds[:, 3].max()) / 2
+    return CRS.from_proj4(f"+proj=aeqd +lat_0={lat:.6f} +lon_0={lon:.6f} +datum=WGS84 +units=m +no_defs")
+
+
+def _projected(gdf, crs):
+    if gdf.crs is None or gdf.crs.equals(crs):
+        return gdf
+    return gdf.to_crs(crs)
+
+
+def _query(chunk, tree_geometries, task, options):
+    # Runs on one chunk of query geometries, in-process or in a pool worker;
+    # returns positions into the chunk and into the tree geometries
+    import shapely
+
+    jobs.checkpoint()
+    tree = shapely.STRtree(tree_geometries)
+    if task == "predicate":
+        return tree.query(chunk, predicate=options["predicate"])
+    if task == "dwithin":
+        return tree.query(chunk, predicate="dwithin", distance=options["distance"])
+    return _knn(tree, chunk, tree_geometries, options["k"], options.get("max_distance"))
+
+
+def _knn(tree, chunk, tree_geometries, k, max_distance=None):
+    # Exact k nearest: a bulk dwithin query at a radius sized from the tree's
+    # density, doubled for the geometries with fewer than k candidates inside
+    # it. This is much faster than query_nearest for polygons.
+    import shapely
+
+    if not len(tree_geometries):
+        return np.empty((2, 0), dtype=np.intp)
+    xmin, ymin, xmax, ymax = shapely.total_bounds(tree_geometries)
+    spacing = math.sqrt(max((xmax - xmin) * (ymax - ymin), 1.0) / len(tree_geometries))
+    radius = np.full(len(chunk), spacing * math.sqrt(k))
+    if max_distance is not None:
+        radius = np.minimum(radius, max_distance)
+
+    # Missing and empty geometries have no neighbours and would never finish
+    pending = np.flatnonzero(_present(chunk))
+    k_found = min(k, int(_present(tree_geometries).sum()))
+    left, right = [], []
+    while len(pending):
+        pairs = tree.query(chunk[pending], predicate="dwithin", distance=radius[pending])
+        counts = np.bincount(pairs[0], minlength=len(pending))
+        done = (counts >= k_found) | (max_distance is not None and radius[pending] >= max_distance)
+        keep = done[pairs[0]]
+        left.append(pending[pairs[0][keep]])
+        right.append(pairs[1][keep])
+        pending = pending[~done]
+        radius[pending] *= 2
+        if max_distance is not None:
+            radius[pending] = np.minimum(radius[pending], max_distance)
+    if not left:
+        return np.empty((2, 0), dtype=np.intp)
+
+    left, right = np.concatenate(left), np.concatenate(right)
+    order = np.lexsort((shapely.distance(chunk[left], tree_geometries[right]), left))
+    left, right = left[order], right[order]
+    starts = np.searchsorted(left, left, side="left")
+    rank = np.arange(len(left)) - starts
+    keep = rank < k
+    return np.vstack([left[keep], right[keep]])
+
+
+def _bulk_query(geometries, tree_geometries, task, options, max_workers=None, chunk_rows=CHUNK_ROWS):
+    n = len(geometries)
+    workers = min(jobs.pool_workers(max_workers), math.ceil(n / chunk_rows))
+    if n < PARALLEL_ROWS or workers <= 1:
+        return _query(geometries, tree_geometries, task, options)
+
+    # Each worker builds its own tree over the (smaller) tree side once per chunk
+    starts = range(0, n, chunk_rows)
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context) as pool:
+        futures = [
+            pool.submit(_query, geometries[start:start + chunk_rows], tree_geometries, task, options) for start in starts
+        ]
+        results = []
+        for start, future in zip(starts, futures):
+            jobs.checkpoint(len(results) / len(futures))
+            pairs = future.result()
+            results.append(np.vstack([pairs[0] + start, pairs[1]]))
+    return np.hstack(results) if results else np.empty((2, 0), dtype=np.intp)
+
+
+def _attach(left, right, pairs, how="inner"):
+    # Left rows (repeated per match) with the matched right attributes, the
+    # same shape as geopandas.sjoin: the right index goes to "index_right"
+    left_index, right_index = pairs
+    attributes = right.drop(columns=right.geometry.name).iloc[right_index]
+    attributes = attributes.rename(columns={column: f"{column}_right" for column in attributes.columns if column in left.columns})
+    attributes.insert(0, "index_right", right.index[right_index])
+    attributes.index = left.index[left_index]
+    result = left.iloc[left_index]
+    if how == "left":
+        unmatched = np.setdiff1d(np.arange(len(left)), left_index)
+        result = pd.concat([result, left.iloc[unmatched]])
+        attributes = pd.concat([attributes, pd.DataFrame(index=left.index[unmatched], columns=attributes.columns)])
+        order = np.argsort(np.concatenate([left_index, unmatched]), kind="stable")
+        result, attributes = result.iloc[order], attributes.iloc[order]
+    return result.assign(**{column: attributes[column].values for column in attributes.columns})
+
+
+def spatial_join(left, right, predicate="intersects", how="inner", max_workers=None):
+    # Topological predicates do not depend on the CRS, only on both layers sharing one
+    right = _projected(right, left.crs)
+    left_geometries, right_geometries = _geometries(left), _geometries(right)
+    if predicate not in CONVERSE and predicate not in ("touches", "crosses", "overlaps", "intersects"):
+        raise ValueError(f"Unsupported predicate: {predicate}")
+
+    # Querying prepared polygons against a tree of points is much faster than
+    # testing each point against unprepared polygons, so points go in the tree
+    if _is_points(left_geometries) and not _is_points(right_geometries):
+        pairs = _bulk_query(right_geometries, left_geometries, "predicate", {"predicate": CONVERSE.get(predicate, predicate)}, max_workers)
+        pairs = pairs[::-1]
+    else:
+        pairs = _bulk_query(left_geometries, right_geometries, "predicate", {"predicate": predicate}, max_workers)
+    order = np.lexsort((pairs[1], pairs[0]))
+    return _attach(left, right, pairs[:, order], how)
+
+
+def buffer(gdf, distance, resolution=8):
+    crs = analysis_crs(gdf)
+    projected = _projected(gdf, crs)
+    result = projected.copy()
+    result.geometry = projected.geometry.buffer(distance, resolution=resolution)
+    return result if gdf.crs is None else result.to_crs(gdf.crs)
+
+
+def _distances(left, right, pairs):
+    import shapely
+
+    return shapely.distance(_geometries(left)[pairs[0]], _geometries(right)[pairs[1]])
+
+
+def within_distance(left, right, distance, max_workers=None):
+    crs = analysis_crs(left, right)
+    left_projected, right_projected = _projected(left, crs), _projected(right, crs)
+    pairs = _bulk_query(_geometries(left_projected), _geometries(right_projected), "dwithin", {"distance": distance}, max_workers)
+    pairs = pairs[:, np.lexsort((pairs[1], pairs[0]))]
+    result = _attach(left, right, pairs)
+    result["distance_m"] = _distances(left_projected, right_projected, pairs)
+    return result
+
+
+def nearest(left, right, k=1, max_distance=None, max_workers=None):
+    crs = analysis_crs(left, right)
+    left_projected, right_projected = _projected(left, crs), _projected(right, crs)
+    options = {"k": k, "max_distance": max_distance}
+    pairs = _bulk_query(_geometries(left_projected), _geometries(right_projected), "knn", options, max_workers)
+    distance = _distances(left_projected, right_projected, pairs)
+    order = np.lexsort((distance, pairs[0]))
+    pairs, distance = pairs[:, order], distance[order]
+    result = _attach(left, right, pairs)
+    result["distance_m"] = distance
+    if k > 1:
+        result["rank"] = np.arange(len(pairs[0])) - np.searchsorted(pairs[0], pairs[0]) + 1
+    return result
+
+
+def run(operation, left, right=None, **options):
+    # Entry point for background jobs, dispatching on the page's operation name
+    if operation == "Spatial join":
+        return spatial_join(left, right, **options)
+    if operation == "Buffer":
+        return buffer(left, **options)
+    if operation == "Within distance":
+        return within_distance(left, right, **options)
+    if operation == "Nearest":
+        return nearest(left, right, **options)
+    raise ValueError(f"Unknown operation: {operation}")
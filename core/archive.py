@@ -0,0 +1,85 @@
+import multiprocessing
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from core import jobs
+
+VECTOR_MEMBERS = ("shp", "gpkg", "geojson", "json")
+LAYER_EXTENSION = "arrow"
+
+
+def _list_layers(path):
+    try:
+        import pyogrio
+    except ImportError:
+        import fiona
+
+        return list(fiona.listlayers(path))
+    return [name for name, _ in pyogrio.list_layers(path)]
+
+
+def archive_members(path):
+    with zipfile.ZipFile(path) as archive:
+        return [
+            info.filename
+            for info in archive.infolist()
+            if not info.is_dir()
+            and not info.filename.startswith("__MACOSX/")
+            and info.filename.rsplit(".", 1)[-1].lower() in VECTOR_MEMBERS
+        ]
+
+
+def archive_layers(path):
+    # One entry per readable layer; GeoPackages can hold several
+    layers = []
+    for member in archive_members(path):
+        if member.lower().endswith(".gpkg"):
+            layers.extend((member, layer) for layer in _list_layers(f"/vsizip/{path}/{member}"))
+        else:
+            layers.append((member, None))
+    return layers
+
+
+def layer_file_name(path, member, layer=None):
+    parts = [os.path.basename(path).rsplit(".", 1)[0], os.path.basename(member).rsplit(".", 1)[0]]
+    if layer:
+        parts.append(layer)
+    return re.sub(r"[^\w-]", "_", "_".join(parts)) + f".{LAYER_EXTENSION}"
+
+
+def _read_layer(path, member, layer, out_path):
+    # GDAL reads the member straight out of the archive; the result is written
+    # as uncompressed Arrow IPC so the caller can memory-map it
+    import geopandas as gpd
+
+    gdf = gpd.read_file(f"/vsizip/{path}/{member}", layer=layer)
+    if gdf.empty:
+        return None
+    gdf.to_feather(out_path, compression="uncompressed")
+    return out_path
+
+
+def extract_layers(path, out_dir, max_workers=None):
+    tasks = [
+        (path, member, layer, os.path.join(out_dir, layer_file_name(path, member, layer)))
+        for member, layer in archive_layers(path)
+    ]
+    pending = [task for task in tasks if not os.path.exists(task[-1])]
+    workers = min(len(pending), jobs.pool_workers(max_workers))
+    if workers > 1:
+        # Workers only receive paths, so no layer data crosses the process boundary
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(workers, mp_context=context) as pool:
+            list(pool.map(_read_layer, *zip(*pending)))
+    else:
+        for task in pending:
+            _read_layer(*task)
+    return [task[-1] for task in tasks if os.path.exists(task[-1])]
+
+
+def read_layer(path):
+    import geopandas as gpd
+
+    return gpd.read_feather(path, memory_map=True)
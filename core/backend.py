@@ -0,0 +1,258 @@
+import hashlib
+import importlib.util
+import os
+
+from core import combine, io, jobs
+
+CHUNK_ROWS = 100000
+VECTOR_EXTENSIONS = {"geojson", "json", "zip", "shp", "gpkg"}
+NUMERIC_TYPES = ("TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT", "FLOAT", "DOUBLE", "DECIMAL", "UBIGINT", "UINTEGER")
+
+
+def available():
+    return importlib.util.find_spec("duckdb") is not None
+
+
+def _duckdb():
+    try:
+        import duckdb
+    except ImportError as e:
+        raise ImportError("The out-of-core backend needs the optional 'duckdb' package.") from e
+    return duckdb
+
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _literal(text):
+    return "'" + text.replace("'", "''") + "'"
+
+
+def vector_to_parquet(path, parquet_path, chunk_rows=CHUNK_ROWS):
+    # Stream a vector file into Parquet chunk by chunk, storing geometry as WKB
+    # next to its bounding box so bbox filters are plain column comparisons.
+    # One reader walks the file once; only the current chunk is in memory.
+    import geopandas as gpd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyogrio
+    from pyproj import CRS
+
+    written = False
+    with pyogrio.open_arrow(path, batch_size=chunk_rows, use_pyarrow=True) as (meta, reader):
+        geometry_name = meta["geometry_name"] or "wkb_geometry"
+        crs = meta["crs"]
+        reproject = crs is not None and not CRS.from_user_input(crs).equals("EPSG:4326")
+        writer = None
+        try:
+            for batch in reader:
+                if not batch.num_rows:
+                    continue
+                chunk = pa.Table.from_batches([batch])
+                geometry = gpd.GeoSeries.from_wkb(chunk.column(geometry_name).to_numpy(zero_copy_only=False), crs=crs)
+                if reproject:
+                    geometry = geometry.to_crs("EPSG:4326")
+                chunk = chunk.drop_columns([geometry_name])
+                for column, values in zip(("minx", "miny", "maxx", "maxy"), geometry.bounds.to_numpy().T):
+                    chunk = chunk.append_column(column, pa.array(values))
+                chunk = chunk.append_column("geometry", pa.array(geometry.to_wkb().to_numpy(), pa.binary()))
+                if writer is None:
+                    writer = pq.ParquetWriter(parquet_path, chunk.schema)
+                writer.write_table(chunk.cast(writer.schema))
+                written = True
+        finally:
+            if writer is not None:
+                writer.close()
+    return written
+
+
+class Table:
+    def __init__(self, name, view, latitude_column=None, longitude_column=None, has_geometry=False):
+        self.name = name
+        self.view = view
+        self.latitude_column = latitude_column
+        self.longitude_column = longitude_column
+        self.has_geometry = has_geometry
+
+
+class DuckDBBackend:
+    def __init__(self, cache_dir, database=":memory:"):
+        self.connection = _duckdb().connect(database)
+        self.cache_dir = cache_dir
+        self.tables = {}
+
+    def _cursor(self):
+        # DuckDB connections are not shared across threads; each query gets its own cursor
+        return self.connection.cursor()
+
+    def register(self, name, path, latitude_column=None, longitude_column=None):
+        extension = io.file_extension(path)
+        view = "t_" + hashlib.sha1(name.encode()).hexdigest()[:16]
+        has_geometry = False
+        if extension == "csv":
+            source = f"read_csv_auto({_literal(path)})"
+        elif extension == "parquet":
+            source = f"read_parquet({_literal(path)})"
+        elif extension in VECTOR_EXTENSIONS:
+            parquet_path = os.path.join(self.cache_dir, f"{view}.parquet")
+            if not os.path.exists(parquet_path):
+                source_path = f"/vsizip/{path}" if extension == "zip" else path
+                if not vector_to_parquet(source_path, parquet_path):
+                    raise ValueError(f"{name} contains no features.")
+            source = f"read_parquet({_literal(parquet_path)})"
+            has_geometry = True
+        else:
+            raise ValueError(f"Unsupported format for the out-of-core backend: {extension}")
+
+        self._cursor().execute(f"CREATE OR REPLACE VIEW {view} AS SELECT * FROM {source}")
+        table = Table(name, view, latitude_column, longitude_column, has_geometry)
+        self.tables[name] = table
+        return table
+
+    def columns(self, name):
+        table = self.tables[name]
+        rows = self._cursor().execute(f"DESCRIBE {table.view}").fetchall()
+        hidden = {"geometry", "minx", "miny", "maxx", "maxy"} if table.has_geometry else set()
+        return {row[0]: row[1] for row in rows if row[0] not in hidden}
+
+    def is_numeric(self, name, column):
+        return self.columns(name)[column].startswith(NUMERIC_TYPES)
+
+    def _where(self, table, predicates):
+        clauses, params = [], []
+        for predicate in predicates:
+            kind = predicate[0]
+            if kind == "in":
+                _, column, values = predicate
+                if not values:
+                    continue
+                clauses.append(f"{_quote(column)} IN ({', '.join('?' * len(values))})")
+                params.extend(values)
+            elif kind == "between":
+                _, column, low, high = predicate
+                clauses.append(f"{_quote(column)} BETWEEN ? AND ?")
+                params.extend([low, high])
+            elif kind == "contains":
+                _, column, text = predicate
+                escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                clauses.append(f"CAST({_quote(column)} AS VARCHAR) ILIKE ? ESCAPE '\\'")
+                params.append(f"%{escaped}%")
+            elif kind == "bbox":
+                _, minx, miny, maxx, maxy = predicate
+                if table.has_geometry:
+                    clauses.append("maxx >= ? AND minx <= ? AND maxy >= ? AND miny <= ?")
+                    params.extend([minx, maxx, miny, maxy])
+                else:
+                    clauses.append(
+                        f"{_quote(table.longitude_column)} BETWEEN ? AND ? "
+                        f"AND {_quote(table.latitude_column)} BETWEEN ? AND ?"
+                    )
+                    params.extend([minx, maxx, miny, maxy])
+            else:
+                raise ValueError(f"Unknown predicate: {kind}")
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    def _select(self, table, predicates, columns=None):
+        where, params = self._where(table, predicates)
+        selected = ", ".join(_quote(column) for column in columns) if columns else "*"
+        if columns is None and table.has_geometry:
+            selected = "* EXCLUDE (minx, miny, maxx, maxy)"
+        return f"SELECT {selected} FROM {table.view}{where}", params
+
+    def count(self, name, predicates=()):
+        table = self.tables[name]
+        where, params = self._where(table, predicates)
+        return self._cursor().execute(f"SELECT count(*) FROM {table.view}{where}", params).fetchone()[0]
+
+    def distinct(self, name, column, limit=1000):
+        table = self.tables[name]
+        sql = f"SELECT DISTINCT {_quote(column)} FROM {table.view} ORDER BY 1 LIMIT {int(limit)}"
+        return [row[0] for row in self._cursor().execute(sql).fetchall()]
+
+    def value_range(self, name, column):
+        table = self.tables[name]
+        sql = f"SELECT min({_quote(column)}), max({_quote(column)}) FROM {table.view}"
+        return self._cursor().execute(sql).fetchone()
+
+    def page(self, name, predicates=(), offset=0, limit=100, order_by=None, descending=False):
+        # Only the requested window is materialized
+        table = self.tables[name]
+        sql, params = self._select(table, predicates)
+        if order_by:
+            sql += f" ORDER BY {_quote(order_by)} {'DESC' if descending else 'ASC'}"
+        sql += f" LIMIT {int(limit)} OFFSET {int(offset)}"
+        df = self._cursor().execute(sql, params).df()
+        return self._to_geodataframe(table, df)
+
+    def _to_geodataframe(self, table, df):
+        if table.has_geometry:
+            import geopandas as gpd
+
+            geometry = gpd.GeoSeries.from_wkb(df.pop("geometry").map(bytes), crs="EPSG:4326")
+            return gpd.GeoDataFrame(df, geometry=geometry)
+        if table.latitude_column and table.longitude_column:
+            # Rows with invalid coordinates stay, without a geometry, so pages
+            # hold the rows count() counts
+            return io.clean_points(df, table.latitude_column, table.longitude_column, drop_invalid=False)[0]
+        return df
+
+    def batches(self, name, predicates=(), batch_size=CHUNK_ROWS):
+        table = self.tables[name]
+        sql, params = self._select(table, predicates)
+        reader = self._cursor().execute(sql, params).fetch_record_batch(batch_size)
+        yield from reader
+
+    def export(self, name, sink, predicates=(), file_format="csv"):
+        # Stream query results batch by batch into the writer; nothing is
+        # concatenated in memory. CSV is written straight from the Arrow
+        # batches; other formats go through the same writers as layers held
+        # in memory, with points made from the coordinate columns.
+        import pyarrow as pa
+        import pyarrow.csv as csv
+        import shapely
+
+        if file_format != "csv":
+            view = combine.CombinedView([QueryLayer(self, name, predicates)], [name], layer_column=False)
+            return view.export(sink, file_format)
+        table = self.tables[name]
+        sql, params = self._select(table, predicates)
+        reader = self._cursor().execute(sql, params).fetch_record_batch(CHUNK_ROWS)
+        schema = reader.schema
+        index = schema.get_field_index("geometry")
+        if index >= 0:
+            # As WKT, like CSV exports of layers held in memory
+            schema = schema.set(index, pa.field("geometry", pa.string()))
+        # Created up front, so an export matching no rows still has its header
+        with csv.CSVWriter(sink, schema) as writer:
+            for batch in reader:
+                jobs.checkpoint()
+                if index >= 0:
+                    wkt = shapely.to_wkt(shapely.from_wkb(batch.column(index).to_numpy(zero_copy_only=False)))
+                    batch = batch.set_column(index, "geometry", pa.array(wkt, pa.string()))
+                writer.write_batch(batch)
+
+
+class QueryLayer:
+    # A query's rows as a layer CombinedView can export: its dtypes come from
+    # the query's schema, its rows are read batch by batch when written
+    def __init__(self, query, name, predicates=()):
+        self.query = query
+        self.table = query.tables[name]
+        self.predicates = predicates
+        sql, params = query._select(self.table, predicates)
+        schema = query._cursor().execute(sql + " LIMIT 0", params).fetch_record_batch().schema
+        empty = schema.empty_table().to_pandas().astype(combine.arrow_dtypes(schema))
+        frame = query._to_geodataframe(self.table, empty)
+        self.dtypes = frame.dtypes.drop("geometry", errors="ignore")
+        self.columns = list(self.dtypes.index)
+        self.rows = query.count(name, predicates)
+
+    def __len__(self):
+        return self.rows
+
+    def chunks(self, batch_size):
+        for batch in self.query.batches(self.table.name, self.predicates, batch_size):
+            jobs.checkpoint()
+            yield self.query._to_geodataframe(self.table, batch.to_pandas())
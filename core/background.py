@@ -0,0 +1,61 @@
+import time
+import uuid
+
+import streamlit as st
+
+from core import jobs
+
+POLL_SECONDS = 1.0
+
+
+@st.cache_resource(show_spinner=False)
+def job_manager():
+    return jobs.JobManager()
+
+
+def session_owner():
+    if "job_owner" not in st.session_state:
+        st.session_state["job_owner"] = uuid.uuid4().hex
+    return st.session_state["job_owner"]
+
+
+def run(key, label, func, *args, container=None, in_process=False, **kwargs):
+    # Returns the job's result once it is done. Until then the job's state is
+    # shown with a cancel button, and poll() reruns the page to check again.
+    container = container or st
+    manager = job_manager()
+    job = manager.get(key, session_owner())
+    if job is None:
+        try:
+            job = manager.submit(session_owner(), key, label, func, *args, in_process=in_process, **kwargs)
+        except jobs.QuotaExceeded as e:
+            container.warning(str(e))
+            st.session_state["jobs_pending"] = True
+            return None
+
+    status = job.status
+    if status == "done":
+        return job.result()
+    if status in ("failed", "cancelled"):
+        if status == "failed":
+            container.error(f"{label} failed: {job.error()}")
+        else:
+            container.info(f"{label} was cancelled.")
+        if container.button("Retry", key=f"retry_{key}"):
+            manager.forget(key, session_owner())
+            st.rerun()
+        return None
+
+    progress = job.progress
+    container.progress(progress or 0.0, text=f"{label}: {status}" + (f" ({progress:.0%})" if progress else ""))
+    if container.button("Cancel", key=f"cancel_{key}"):
+        manager.cancel(key)
+    st.session_state["jobs_pending"] = True
+    return None
+
+
+def poll():
+    # Called at the end of a page; reruns it while any of its jobs is unfinished
+    if st.session_state.pop("jobs_pending", False):
+        time.sleep(POLL_SECONDS)
+        st.rerun()
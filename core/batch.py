@@ -0,0 +1,304 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from core import archive, combine, coords, geocode, io
+
+GEOCODE_CHUNK_ROWS = 100
+READ_CHUNK_ROWS = 50000
+OUTPUT_FORMATS = tuple(extension for extension, _ in combine.EXPORT_FORMATS.values())
+
+
+def expand_inputs(patterns):
+    # Files named directly must exist; globs may match nothing
+    paths = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            paths.extend(sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path)))
+        elif os.path.isfile(pattern):
+            paths.append(pattern)
+        else:
+            raise FileNotFoundError(f"No such file: {pattern}")
+    return list(dict.fromkeys(paths))
+
+
+def output_path(path, out_dir, extension):
+    return os.path.join(out_dir, f"{os.path.splitext(os.path.basename(path))[0]}.{extension}")
+
+
+def _progress(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+class TabularLayer:
+    # Points from a CSV's detected coordinate columns, read chunk by chunk:
+    # a first pass settles the columns' dtypes over every chunk, the second
+    # produces the points. Rows without valid coordinates are counted in
+    # dropped as they are skipped.
+    def __init__(self, path, chunk_rows=READ_CHUNK_ROWS):
+        import numpy as np
+        import pandas as pd
+
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.extension = io.file_extension(path)
+        self.rows = 0
+        self.dropped = 0
+        found = {}
+        self.latitude_column = self.longitude_column = None
+        for chunk in self._read():
+            if not self.rows:
+                self.latitude_column, self.longitude_column = coords.detect_lat_long(chunk)
+                if self.latitude_column is None or self.longitude_column is None:
+                    raise ValueError("no latitude and longitude columns found")
+            self.rows += len(chunk)
+            for column, dtype in chunk.dtypes.items():
+                found.setdefault(column, []).append(dtype)
+        if not found:
+            raise ValueError("no rows to read")
+        dtypes = {column: combine._unified_dtype(values) for column, values in found.items()}
+        dtypes[self.latitude_column] = dtypes[self.longitude_column] = np.dtype("float64")
+        self.dtypes = pd.Series(dtypes, dtype=object)
+        self.columns = list(dtypes)
+
+    def __len__(self):
+        return self.rows
+
+    def _read(self):
+        import pandas as pd
+
+        if self.extension == "csv":
+            return pd.read_csv(self.path, chunksize=self.chunk_rows)
+        # Workbooks have no streaming reader, they are read whole
+        return [io.read_tabular(self.path, self.extension)]
+
+    def chunks(self, batch_size):
+        self.dropped = 0
+        for chunk in self._read():
+            points, report = io.clean_points(chunk, self.latitude_column, self.longitude_column)
+            self.dropped += report["rows"] - report["valid"]
+            for start in range(0, len(points), batch_size):
+                yield points.iloc[start:start + batch_size]
+
+
+class VectorLayer:
+    # A vector layer streamed through pyogrio's Arrow reader; its schema and
+    # feature count come from the source without reading any features
+    def __init__(self, path, layer=None):
+        import pyogrio
+
+        self.path = path
+        self.layer = layer
+        self.dropped = 0
+        with pyogrio.open_arrow(path, layer=layer, batch_size=1, use_pyarrow=True) as (meta, reader):
+            self.crs = meta["crs"]
+            self.geometry_name = meta["geometry_name"] or "wkb_geometry"
+            self.dtypes = combine.arrow_dtypes(reader.schema).drop(self.geometry_name)
+        self.rows = max(pyogrio.read_info(path, layer=layer)["features"], 0)
+        self.columns = list(self.dtypes.index)
+
+    def __len__(self):
+        return self.rows
+
+    def chunks(self, batch_size):
+        import geopandas as gpd
+        import pyogrio
+
+        with pyogrio.open_arrow(self.path, layer=self.layer, batch_size=batch_size, use_pyarrow=True) as (_, reader):
+            for batch in reader:
+                if not batch.num_rows:
+                    continue
+                frame = batch.drop_columns([self.geometry_name]).to_pandas()
+                geometry = gpd.GeoSeries.from_wkb(batch.column(self.geometry_name).to_numpy(zero_copy_only=False), crs=self.crs)
+                yield gpd.GeoDataFrame(frame, geometry=geometry.values, crs=self.crs)
+
+
+def read_layers(path):
+    # One (layer, name) pair per layer: tabular files become points from
+    # their detected coordinate columns, archives hold one or more layers.
+    # Layers are read lazily, chunk by chunk, when they are written.
+    extension = io.file_extension(path)
+    if extension in io.TABULAR_EXTENSIONS:
+        return [(TabularLayer(path), io.layer_name(path))]
+    if extension == "zip":
+        path = os.path.abspath(path)
+        return [
+            (VectorLayer(f"/vsizip/{path}/{member}", layer), layer or io.layer_name(member))
+            for member, layer in archive.archive_layers(path)
+        ]
+    if extension == archive.LAYER_EXTENSION:
+        return [(io.read_vector(path), io.layer_name(path))]
+    return [(VectorLayer(path), io.layer_name(path))]
+
+
+def convert_file(path, out_path, file_format, crs="EPSG:4326"):
+    # Each input is streamed once into a partial file that only replaces
+    # out_path when it is complete. Outputs name their layers in a "layer"
+    # column only when they combine several.
+    layers, names = zip(*read_layers(path))
+    view = combine.CombinedView(layers, names, crs=crs, layer_column=len(layers) > 1)
+    part = out_path + ".part"
+    combine.export_file(view, part, file_format)
+    os.replace(part, out_path)
+    dropped = sum(getattr(layer, "dropped", 0) for layer in layers)
+    if dropped:
+        _progress(f"  {os.path.basename(path)}: skipped {dropped} rows without valid coordinates")
+    return len(view) - dropped
+
+
+def _save_state(path, state):
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
+
+
+def geocode_file(path, out_path, nominatim_url=geocode.NOMINATIM_URL, chunk_rows=GEOCODE_CHUNK_ROWS):
+    # Geocodes chunk by chunk, appending to a partial file and recording how
+    # many rows and bytes are done after each chunk, so an interrupted run
+    # resumes at the last complete chunk instead of re-sending every request
+    import pandas as pd
+
+    part, state_path = out_path + ".part", out_path + ".part.json"
+    done, offset = 0, 0
+    if os.path.exists(part) and os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+        done, offset = state["rows"], state["bytes"]
+    columns = list(pd.read_csv(path, nrows=0).columns)
+    missing = [column for column in geocode.ADDRESS_COLUMNS if column not in columns]
+    if missing:
+        raise ValueError(f"missing address columns: {', '.join(missing)}")
+    geolocator = geocode.nominatim(nominatim_url)
+    with open(part, "r+b" if done else "wb") as sink:
+        sink.truncate(offset)
+        sink.seek(offset)
+        if not done:
+            sink.write(pd.DataFrame(columns=columns + ["latitude", "longitude"]).to_csv(index=False).encode("utf-8"))
+        for chunk in pd.read_csv(path, chunksize=chunk_rows, skiprows=range(1, done + 1)):
+            result = geocode.geocode_addresses(chunk, geolocator)
+            sink.write(result.to_csv(index=False, header=False).encode("utf-8"))
+            sink.flush()
+            done += len(chunk)
+            _save_state(state_path, {"rows": done, "bytes": sink.tell()})
+            _progress(f"  {os.path.basename(path)}: {done} rows geocoded")
+    os.replace(part, out_path)
+    os.remove(state_path)
+    return done
+
+
+def _run(func, path, out_path, *args):
+    start = time.perf_counter()
+    rows = func(path, out_path, *args)
+    return rows, time.perf_counter() - start
+
+
+def run_tasks(tasks, workers=None, overwrite=False):
+    # tasks are (func, path, out_path, *args); finished outputs are skipped
+    # unless overwrite is set, so rerunning a command resumes the batch.
+    # Returns the number of inputs that failed.
+    pending = []
+    for task in tasks:
+        if os.path.exists(task[2]) and not overwrite:
+            _progress(f"skipping {task[1]}: {task[2]} exists")
+        else:
+            pending.append(task)
+    failures = 0
+
+    def report(n, task, outcome):
+        nonlocal failures
+        try:
+            rows, seconds = outcome()
+        except Exception as e:
+            failures += 1
+            _progress(f"[{n}/{len(pending)}] {task[1]} failed: {e}")
+        else:
+            _progress(f"[{n}/{len(pending)}] {task[1]} -> {task[2]} ({rows} rows, {seconds:.1f} s)")
+
+    workers = min(len(pending), workers or os.cpu_count() or 1)
+    if workers > 1:
+        # Workers receive paths and options only, and write their own outputs
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(workers, mp_context=context) as pool:
+            futures = {pool.submit(_run, *task): task for task in pending}
+            for n, future in enumerate(as_completed(futures), 1):
+                report(n, futures[future], future.result)
+    else:
+        for n, task in enumerate(pending, 1):
+            report(n, task, lambda: _run(*task))
+    return failures
+
+
+def _parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m core.batch",
+        description="Geocode, reproject or convert many files without the Streamlit app.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def command(name, help):
+        sub = commands.add_parser(name, help=help)
+        sub.add_argument("inputs", nargs="+", help="files or glob patterns, e.g. 'data/**/*.zip'")
+        sub.add_argument("-o", "--output-dir", required=True)
+        sub.add_argument("--workers", type=int, help="processes to use, defaults to one per core")
+        sub.add_argument("--overwrite", action="store_true", help="redo inputs whose output already exists")
+        return sub
+
+    sub = command("geocode", "add latitude and longitude to CSVs of street, city and zip")
+    sub.add_argument("--nominatim", default=geocode.NOMINATIM_URL, help="Nominatim URL, defaults to the public server")
+    sub.add_argument("--chunk-rows", type=int, default=GEOCODE_CHUNK_ROWS, help="rows geocoded between resume points")
+    sub = command("reproject", "write layers in another CRS")
+    sub.add_argument("--crs", required=True, help="target CRS, e.g. EPSG:3857")
+    sub.add_argument("--format", choices=OUTPUT_FORMATS, default="geojson")
+    sub = command("convert", "write layers in another format, combining the layers of archives")
+    sub.add_argument("--format", choices=OUTPUT_FORMATS, required=True)
+    sub.add_argument("--crs", default="EPSG:4326")
+    return parser
+
+
+def main(argv=None):
+    parser = _parser()
+    args = parser.parse_args(argv)
+    try:
+        paths = expand_inputs(args.inputs)
+    except FileNotFoundError as e:
+        parser.error(str(e))
+    if not paths:
+        parser.error("no input files matched")
+
+    extension = "csv" if args.command == "geocode" else args.format
+    outputs = [output_path(path, args.output_dir, extension) for path in paths]
+    clashes = sorted({out for out in outputs if outputs.count(out) > 1})
+    if clashes:
+        parser.error(f"several inputs would write {', '.join(clashes)}; process them into separate directories")
+    overwritten = [path for path, out in zip(paths, outputs) if os.path.abspath(path) == os.path.abspath(out)]
+    if overwritten:
+        parser.error(f"the output would replace the input {overwritten[0]}; choose another output directory")
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    workers = args.workers
+    if args.command == "geocode":
+        if not args.nominatim:
+            # The public server's usage policy allows one client at a time
+            workers = 1
+        tasks = [(geocode_file, path, out, args.nominatim, args.chunk_rows) for path, out in zip(paths, outputs)]
+    else:
+        from core.crs import validate_crs
+
+        crs, error = validate_crs(args.crs)
+        if crs is None:
+            parser.error(f"invalid CRS: {error}")
+        tasks = [(convert_file, path, out, args.format, crs.to_string()) for path, out in zip(paths, outputs)]
+
+    failures = run_tasks(tasks, workers, args.overwrite)
+    if failures:
+        _progress(f"{failures} of {len(paths)} inputs failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import pandas as pd
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+CACHE_DIR = os.path.join(tempfile.gettempdir(), "os-st-gis-catalog")
+CATALOG_EXTENSIONS = ("csv", "xlsx", "zip", "geojson", "json", "gpkg", "shp")
+
+
+class Entry:
+    def __init__(self, name, path, cache_path):
+        self.name = name
+        self.path = path
+        self.cache_path = cache_path
+
+
+class Catalog:
+    # Files under data/ are converted once into uncompressed Arrow IPC, which
+    # is memory-mapped, so every session and every server process shares the
+    # same pages instead of parsing the source.
+    def __init__(self, data_dir=DATA_DIR, cache_dir=CACHE_DIR):
+        self.data_dir = data_dir
+        self.cache_dir = cache_dir
+        self.entries = {}
+
+    def scan(self):
+        if not os.path.isdir(self.data_dir):
+            return self.entries
+        for name in sorted(os.listdir(self.data_dir)):
+            path = os.path.join(self.data_dir, name)
+            if os.path.isfile(path) and name.rsplit(".", 1)[-1].lower() in CATALOG_EXTENSIONS:
+                self.entries[name] = self._entry(name, path)
+        return self.entries
+
+    def _entry(self, name, path):
+        # The cache file name changes whenever the source does
+        stat = os.stat(path)
+        digest = hashlib.sha1(f"{path}:{stat.st_mtime_ns}:{stat.st_size}".encode()).hexdigest()[:16]
+        stem = os.path.join(self.cache_dir, f"{name.rsplit('.', 1)[0]}-{digest}")
+        return Entry(name, path, f"{stem}.arrow")
+
+    def entry(self, path):
+        name = os.path.basename(path)
+        entry = self.entries.get(name)
+        if entry is not None and os.path.abspath(entry.path) == os.path.abspath(path):
+            return entry
+        return None
+
+    def build(self, entry):
+        if os.path.exists(entry.cache_path):
+            return entry
+        import geopandas as gpd
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        extension = entry.name.rsplit(".", 1)[-1].lower()
+        if extension == "csv":
+            frame = pd.read_csv(entry.path)
+        elif extension == "xlsx":
+            frame = pd.read_excel(entry.path, engine="openpyxl")
+        else:
+            frame = gpd.read_file(entry.path)
+
+        # Written under a temporary name first; another process may be building
+        # the same entry, and readers must never see a partial file
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        frame.to_feather(entry.cache_path + suffix, compression="uncompressed")
+        os.replace(entry.cache_path + suffix, entry.cache_path)
+        return entry
+
+    def build_all(self):
+        # Converts every scanned entry that isn't converted yet
+        for entry in list(self.entries.values()):
+            try:
+                self.build(entry)
+            except Exception:
+                # Left to fail, with its error, when it is read
+                continue
+        return self.entries
+
+    def read(self, path, columns=None):
+        # Only the requested columns are converted, and numeric columns
+        # without nulls stay views of the mapped pages rather than copies
+        import pyarrow.feather as feather
+
+        entry = self.build(self.entry(path))
+        return _to_frame(feather.read_table(entry.cache_path, columns=columns, memory_map=True))
+
+
+def _to_frame(table):
+    import geopandas as gpd
+    from pyproj import CRS
+
+    metadata = table.schema.metadata or {}
+    if b"geo" not in metadata:
+        return table.to_pandas(split_blocks=True)
+    geo = json.loads(metadata[b"geo"])
+    column = geo["primary_column"]
+    if column not in table.column_names:
+        return table.to_pandas(split_blocks=True)
+    df = table.drop([column]).to_pandas(split_blocks=True)
+    geometry = gpd.GeoSeries.from_wkb(table.column(column).to_numpy(zero_copy_only=False), index=df.index)
+    # GeoParquet metadata stores the CRS as PROJJSON and omits it for WGS 84;
+    # an explicit null means the CRS is unknown
+    columns = geo["columns"][column]
+    if "crs" not in columns:
+        crs = "EPSG:4326"
+    else:
+        crs = columns["crs"] and CRS.from_user_input(columns["crs"])
+    return gpd.GeoDataFrame(df, geometry=geometry, crs=crs)
@@ -0,0 +1,178 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from core import jobs
+
+BATCH_ROWS = 50000
+EXPORT_FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "GeoJSON": ("geojson", "application/geo+json"),
+    "Parquet": ("parquet", "application/octet-stream"),
+}
+
+
+def _unified_dtype(dtypes, missing=False):
+    # missing: some layers lack the column, so it has to hold NA for their rows
+    if all(dtype == dtypes[0] for dtype in dtypes):
+        dtype = dtypes[0]
+    elif all(pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype) for dtype in dtypes):
+        dtype = np.dtype("float64") if any(pd.api.types.is_float_dtype(dtype) for dtype in dtypes) else pd.Int64Dtype()
+    else:
+        return np.dtype("object")
+    # numpy integers and booleans have no NA; their nullable dtypes do
+    if missing and isinstance(dtype, np.dtype) and dtype.kind == "b":
+        return pd.BooleanDtype()
+    if missing and isinstance(dtype, np.dtype) and dtype.kind in "iu":
+        return pd.Int64Dtype()
+    return dtype
+
+
+def arrow_dtypes(schema):
+    # The dtypes of an Arrow schema's batches as frames: integer and boolean
+    # columns are nullable, as any batch of them may hold nulls
+    import pyarrow as pa
+
+    dtypes = schema.empty_table().to_pandas().dtypes
+    for field in schema:
+        if pa.types.is_integer(field.type):
+            dtypes[field.name] = pd.Int64Dtype()
+        elif pa.types.is_boolean(field.type):
+            dtypes[field.name] = pd.BooleanDtype()
+    return dtypes
+
+
+def _chunks(frame, batch_size):
+    # Frames are sliced; sources read lazily, such as the batch command's
+    # file readers, produce their own chunks
+    if hasattr(frame, "chunks"):
+        yield from frame.chunks(batch_size)
+        return
+    for start in range(0, len(frame), batch_size):
+        yield frame.iloc[start:start + batch_size]
+
+
+def _geojson_crs(crs):
+    # GeoJSON is WGS 84 unless it names its CRS the way GDAL writes and reads
+    # it, as an authority code
+    from pyproj import CRS
+
+    crs = CRS.from_user_input(crs)
+    if crs.equals("EPSG:4326"):
+        return None
+    authority = crs.to_authority()
+    if authority is None:
+        raise ValueError(f"GeoJSON can only name a CRS with an authority code, not {crs.name}")
+    return {"type": "name", "properties": {"name": "urn:ogc:def:crs:{}::{}".format(*authority)}}
+
+
+def _geo_metadata(crs):
+    # GeoParquet metadata, so the geometry column reads back with its CRS
+    from pyproj import CRS
+
+    column = {"encoding": "WKB", "geometry_types": [], "crs": None if crs is None else CRS.from_user_input(crs).to_json_dict()}
+    return {"version": "1.0.0", "primary_column": "geometry", "columns": {"geometry": column}}
+
+
+class CombinedView:
+    # A lazy union of several layers: the combined schema is worked out up
+    # front, rows are only produced batch by batch when something is exported.
+    # layer_column adds each row's layer name, for outputs combining layers.
+    def __init__(self, frames, names=None, crs="EPSG:4326", layer_column=True):
+        self.frames = list(frames)
+        self.names = list(names) if names is not None else [str(i) for i in range(len(self.frames))]
+        self.crs = crs
+        self.layer_column = layer_column
+        dtypes = {}
+        for frame in self.frames:
+            for column, dtype in frame.dtypes.items():
+                if column != "geometry":
+                    dtypes.setdefault(column, []).append(dtype)
+        self.dtypes = {
+            column: _unified_dtype(found, missing=any(len(frame) and column not in frame.columns for frame in self.frames))
+            for column, found in dtypes.items()
+        }
+        self.columns = (["layer"] if layer_column else []) + list(self.dtypes)
+
+    def __len__(self):
+        return sum(len(frame) for frame in self.frames)
+
+    def batches(self, batch_size=BATCH_ROWS):
+        import geopandas as gpd
+
+        done, total = 0, max(len(self), 1)
+        for name, frame in zip(self.names, self.frames):
+            for chunk in _chunks(frame, batch_size):
+                jobs.checkpoint(min(done / total, 1.0))
+                done += len(chunk)
+                has_geometry = isinstance(chunk, gpd.GeoDataFrame) and "geometry" in chunk.columns
+                if has_geometry and chunk.crs is not None and self.crs is not None and not chunk.crs.equals(self.crs):
+                    chunk = chunk.to_crs(self.crs)
+                batch = pd.DataFrame(index=chunk.index)
+                if self.layer_column:
+                    batch["layer"] = name
+                for column, dtype in self.dtypes.items():
+                    if column in chunk.columns:
+                        batch[column] = chunk[column].astype(dtype, copy=False)
+                    else:
+                        # All missing, as NA, NaN or NaT depending on the dtype
+                        batch[column] = pd.Series(index=chunk.index, dtype=dtype)
+                geometry = chunk.geometry.values if has_geometry else np.full(len(chunk), None)
+                yield batch, geometry
+
+    def to_csv(self, sink, batch_size=BATCH_ROWS):
+        import shapely
+
+        header = True
+        for batch, geometry in self.batches(batch_size):
+            batch["geometry"] = shapely.to_wkt(geometry)
+            sink.write(batch.to_csv(index=False, header=header).encode("utf-8"))
+            header = False
+        if header:
+            sink.write((",".join(self.columns + ["geometry"]) + "\n").encode("utf-8"))
+
+    def to_geojson(self, sink, batch_size=BATCH_ROWS):
+        import geopandas as gpd
+
+        crs = None if self.crs is None else _geojson_crs(self.crs)
+        sink.write(b'{"type": "FeatureCollection", ')
+        if crs is not None:
+            sink.write(b'"crs": ' + json.dumps(crs).encode("utf-8") + b", ")
+        sink.write(b'"features": [')
+        first = True
+        for batch, geometry in self.batches(batch_size):
+            chunk = gpd.GeoDataFrame(batch, geometry=geometry, crs=self.crs)
+            for feature in chunk.iterfeatures(na="null", drop_id=True):
+                sink.write((b"" if first else b", ") + json.dumps(feature, default=str).encode("utf-8"))
+                first = False
+        sink.write(b"]}")
+
+    def to_parquet(self, sink, batch_size=BATCH_ROWS):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        import shapely
+
+        # The schema is fixed up front: a layer's batches may be all NA in a
+        # column, and object columns mixing types are written as text
+        text = [column for column, dtype in self.dtypes.items() if dtype == np.dtype("object")]
+        empty = pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in self.dtypes.items()})
+        if self.layer_column:
+            empty.insert(0, "layer", pd.Series(dtype="string"))
+        empty = empty.astype({column: "string" for column in text})
+        schema = pa.Schema.from_pandas(empty, preserve_index=False).append(pa.field("geometry", pa.binary()))
+        schema = schema.with_metadata({**schema.metadata, b"geo": json.dumps(_geo_metadata(self.crs)).encode("utf-8")})
+        with pq.ParquetWriter(sink, schema) as writer:
+            for batch, geometry in self.batches(batch_size):
+                batch = batch.astype({column: "string" for column in text})
+                batch["geometry"] = shapely.to_wkb(geometry)
+                writer.write_table(pa.Table.from_pandas(batch, preserve_index=False).cast(schema))
+
+    def export(self, sink, file_format="csv"):
+        getattr(self, f"to_{file_format}")(sink)
+
+
+def export_file(view, path, file_format):
+    with open(path, "wb") as sink:
+        view.export(sink, file_format)
+    return path
@@ -0,0 +1,128 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+SAMPLE_ROWS = 10000
+# "lat" and "lon" only count as whole words so that e.g. "population" does not match
+LATITUDE_NAMES = re.compile(r"latitude|(?:^|[\W_])(?:lat|y|ycoord|point_y)(?:$|[\W_])", re.IGNORECASE)
+LONGITUDE_NAMES = re.compile(r"longitude|(?:^|[\W_])(?:lon|lng|long|x|xcoord|point_x)(?:$|[\W_])", re.IGNORECASE)
+
+# Degrees with optional minutes and seconds, e.g. 39°17'26.5"N, 76 36 45 W, N39:17:26
+_DMS = re.compile(
+    r"^\s*(?P<lead>[NSEW])?\s*(?P<deg>[-+]?\d+(?:\.\d+)?)\s*(?:°|º|d|:|\s)?\s*"
+    r"(?:(?P<min>\d+(?:\.\d+)?)\s*(?:'|′|m|:|\s)?\s*)?"
+    r"(?:(?P<sec>\d+(?:\.\d+)?)\s*(?:\"|″|''|s)?\s*)?(?P<trail>[NSEW])?\s*$",
+    re.IGNORECASE,
+)
+_COMMA_DECIMAL = re.compile(r"^\s*[-+]?\d+,\d+\s*$")
+
+
+def _parse_text(text):
+    text = text.str.strip()
+    comma_decimal = text.str.match(_COMMA_DECIMAL).to_numpy(dtype=bool)
+    text = text.where(~comma_decimal, text.str.replace(",", ".", regex=False))
+    parsed = pd.to_numeric(text, errors="coerce").to_numpy(dtype=float, copy=True)
+
+    pending = np.isnan(parsed)
+    if pending.any():
+        parts = text[pending].str.extract(_DMS)
+        degrees = pd.to_numeric(parts["deg"], errors="coerce").to_numpy(dtype=float)
+        minutes = pd.to_numeric(parts["min"], errors="coerce").fillna(0).to_numpy(dtype=float)
+        seconds = pd.to_numeric(parts["sec"], errors="coerce").fillna(0).to_numpy(dtype=float)
+        hemisphere = parts["lead"].fillna(parts["trail"]).str.upper()
+        negative = (degrees < 0) | hemisphere.isin(["S", "W"]).to_numpy()
+        magnitude = np.abs(degrees) + minutes / 60 + seconds / 3600
+        valid_minutes = (minutes < 60) & (seconds < 60)
+        parsed[pending] = np.where(valid_minutes, np.where(negative, -magnitude, magnitude), np.nan)
+    return parsed
+
+
+def parse_coordinates(values):
+    series = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(series):
+        return series.to_numpy(dtype=float)
+
+    # Plain numbers take the fast path; only what is left is treated as text,
+    # and each distinct string is parsed once
+    parsed = pd.to_numeric(series, errors="coerce").to_numpy(dtype=float, copy=True)
+    pending = np.isnan(parsed) & series.notna().to_numpy()
+    if pending.any():
+        codes, uniques = pd.factorize(series[pending].astype(str))
+        parsed[pending] = _parse_text(pd.Series(uniques, dtype=object))[codes]
+    return parsed
+
+
+def _score(values, limit):
+    present = ~np.isnan(values)
+    if not present.any():
+        return 0.0
+    return float((np.abs(values[present]) <= limit).mean() * present.mean())
+
+
+def _coordinate_like(values):
+    # Ids, counts and percentages are whole non-negative numbers; coordinates
+    # have decimals or, for whole degrees, signs
+    present = values[~np.isnan(values)]
+    if not len(present):
+        return False
+    return bool((present != np.round(present)).mean() >= 0.5 or (present < 0).any())
+
+
+def score_columns(df, sample_rows=SAMPLE_ROWS):
+    # Rank columns by how much of a sample parses into valid latitudes and
+    # longitudes, with a bonus for a telling column name
+    sample = df.sample(sample_rows, random_state=0) if len(df) > sample_rows else df
+    scores = {}
+    for column in df.columns:
+        if column == "geometry":
+            continue
+        values = parse_coordinates(sample[column])
+        latitude = _score(values, 90)
+        longitude = _score(values, 180)
+        if latitude == 0 and longitude == 0:
+            continue
+        # Values beyond +/-90 can only be longitudes; the more of them, the
+        # likelier a longitude column, as long as it looks like coordinates
+        beyond = longitude - latitude if _coordinate_like(values) else 0.0
+        scores[column] = (
+            latitude + (0.5 if LATITUDE_NAMES.search(str(column)) else 0),
+            longitude + (0.5 if LONGITUDE_NAMES.search(str(column)) else 0) + 0.25 * beyond,
+        )
+    return scores
+
+
+def detect_lat_long(df, sample_rows=SAMPLE_ROWS):
+    scores = score_columns(df, sample_rows)
+    if not scores:
+        return None, None
+    latitude_column = max(scores, key=lambda column: scores[column][0])
+    others = {column: score for column, score in scores.items() if column != latitude_column}
+    if not others:
+        return latitude_column, None
+    longitude_column = max(others, key=lambda column: others[column][1])
+    return latitude_column, longitude_column
+
+
+def clean_coordinates(latitudes, longitudes):
+    latitude = parse_coordinates(latitudes)
+    longitude = parse_coordinates(longitudes)
+    unparseable = np.isnan(latitude) | np.isnan(longitude)
+
+    # Rows whose latitude is out of range but would fit as a longitude, and
+    # vice versa, were entered the wrong way round
+    swapped = ~unparseable & (np.abs(latitude) > 90) & (np.abs(longitude) <= 90) & (np.abs(latitude) <= 180)
+    latitude, longitude = np.where(swapped, longitude, latitude), np.where(swapped, latitude, longitude)
+
+    out_of_range = ~unparseable & ((np.abs(latitude) > 90) | (np.abs(longitude) > 180))
+    null_island = ~unparseable & (latitude == 0) & (longitude == 0)
+    invalid = unparseable | out_of_range | null_island
+    report = {
+        "rows": len(latitude),
+        "valid": int((~invalid).sum()),
+        "unparseable": int(unparseable.sum()),
+        "out_of_range": int(out_of_range.sum()),
+        "null_island": int(null_island.sum()),
+        "swapped": int(swapped.sum()),
+    }
+    return latitude, longitude, invalid, report
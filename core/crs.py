@@ -0,0 +1,173 @@
+import difflib
+import re
+from functools import lru_cache
+
+from pyproj import CRS, Transformer
+from pyproj.enums import PJType
+from pyproj.exceptions import CRSError
+
+from core import jobs
+
+REPROJECT_CHUNK_ROWS = 50000
+_NON_WORD = re.compile(r"[^0-9a-z:]+")
+
+CRS_TYPES = (
+    PJType.PROJECTED_CRS,
+    PJType.GEOGRAPHIC_2D_CRS,
+    PJType.GEOGRAPHIC_3D_CRS,
+    PJType.COMPOUND_CRS,
+)
+
+
+def _normalize(text):
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+
+def _area_extent(info):
+    area = info.area_of_use
+    if area is None:
+        return float("inf")
+    east = area.east if area.east >= area.west else area.east + 360
+    return (east - area.west) * (area.north - area.south)
+
+
+def _rank(info, query, tokens):
+    # How well a hit matches, best first: the name itself, the query as whole
+    # words of the name, every query word in the name, and only then words
+    # of the area or parts of words. Within each, WGS 84 based systems come
+    # first and compound (with height) systems last, then the most local
+    # areas of use and the shortest names.
+    name = _normalize(info.name)
+    words = name.replace(":", " ").split()
+    if name == query:
+        quality = 0
+    elif f" {query.replace(':', ' ')} " in f" {' '.join(words)} ":
+        quality = 1
+    elif all(token in words for token in tokens):
+        quality = 2
+    else:
+        quality = 3
+    compound = info.type == PJType.COMPOUND_CRS
+    return quality, not name.startswith("wgs 84"), compound, _area_extent(info), len(name)
+
+
+class CRSIndex:
+    def __init__(self, auth_name="EPSG"):
+        from pyproj.database import query_crs_info
+
+        self.entries = [
+            info for info in query_crs_info(auth_name=auth_name, pj_types=CRS_TYPES)
+            if not info.deprecated
+        ]
+        self._by_code = {self.code(info): info for info in self.entries}
+        self._names = [_normalize(info.name) for info in self.entries]
+        self._by_name = {}
+        for info, name in zip(self.entries, self._names):
+            self._by_name.setdefault(name, []).append(info)
+        self._search_keys = [
+            f"{info.code} {name} {_normalize(info.area_of_use.name) if info.area_of_use else ''}"
+            for info, name in zip(self.entries, self._names)
+        ]
+
+    @staticmethod
+    def code(info):
+        return f"{info.auth_name}:{info.code}"
+
+    @staticmethod
+    def label(info):
+        area = ""
+        if info.area_of_use:
+            name = info.area_of_use.name.rstrip(".")
+            area = f" ({name[:57] + '...' if len(name) > 60 else name})"
+        return f"{info.auth_name}:{info.code} - {info.name}{area}"
+
+    def get(self, code):
+        return self._by_code.get(code.strip().upper())
+
+    def search(self, text, limit=20):
+        query = _normalize(text)
+        if not query:
+            return []
+
+        exact = self._by_code.get(query.upper()) or self._by_code.get(f"EPSG:{query}")
+        tokens = query.replace(":", " ").split()
+        hits = [
+            info for info, key in zip(self.entries, self._search_keys)
+            if all(token in key for token in tokens)
+        ]
+        hits.sort(key=lambda info: _rank(info, query, tokens))
+
+        if len(hits) < limit:
+            close = difflib.get_close_matches(query, self._by_name.keys(), n=limit, cutoff=0.6)
+            seen = {id(info) for info in hits}
+            for name in close:
+                for info in self._by_name[name]:
+                    if id(info) not in seen:
+                        hits.append(info)
+                        seen.add(id(info))
+
+        if exact is not None:
+            hits = [exact] + [info for info in hits if info is not exact]
+        return hits[:limit]
+
+    def suggest(self, bounds, crs="EPSG:4326", limit=10):
+        west, south, east, north = _lonlat_bounds(bounds, crs)
+        suggestions = []
+
+        # UTM only stays accurate for layers spanning a zone or two
+        utm = self.get(utm_code(west, south, east, north)) if east - west <= 12 else None
+        if utm is not None:
+            suggestions.append(utm)
+
+        local = []
+        for info in self.entries:
+            area = info.area_of_use
+            if info.type != PJType.PROJECTED_CRS or area is None or info is utm:
+                continue
+            if area.west <= west and area.south <= south and area.east >= east and area.north >= north:
+                local.append(info)
+        local.sort(key=_area_extent)
+        suggestions.extend(local[: limit - len(suggestions)])
+        return suggestions
+
+
+def utm_code(west, south, east, north):
+    lon = (west + east) / 2
+    lat = (south + north) / 2
+    zone = min(int((lon + 180) // 6) + 1, 60)
+    return f"EPSG:{32600 + zone if lat >= 0 else 32700 + zone}"
+
+
+def _lonlat_bounds(bounds, crs):
+    source = CRS.from_user_input(crs) if crs is not None else CRS.from_epsg(4326)
+    if source.is_geographic and source.equals(CRS.from_epsg(4326), ignore_axis_order=True):
+        return tuple(bounds)
+    transformer = Transformer.from_crs(source, "EPSG:4326", always_xy=True)
+    return transformer.transform_bounds(*bounds)
+
+
+def validate_crs(text):
+    try:
+        return CRS.from_user_input(text.strip()), None
+    except CRSError as e:
+        return None, str(e)
+
+
+@lru_cache(maxsize=None)
+def get_crs_index():
+    return CRSIndex()
+
+
+def reproject_file(gdf, crs, path, chunk_rows=REPROJECT_CHUNK_ROWS):
+    # Reprojected chunk by chunk, so the job running it reports progress
+    # and can be cancelled between chunks
+    import pandas as pd
+
+    parts = []
+    for start in range(0, len(gdf), chunk_rows):
+        jobs.checkpoint(start / len(gdf))
+        parts.append(gdf.geometry.iloc[start:start + chunk_rows].to_crs(crs))
+    geometry = pd.concat(parts) if parts else gdf.geometry.to_crs(crs)
+    jobs.checkpoint(1.0)
+    gdf.set_geometry(geometry.rename(gdf.geometry.name)).to_file(path, driver="GeoJSON")
+    return path
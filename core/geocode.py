@@ -0,0 +1,120 @@
+import os
+import re
+from urllib.parse import urlsplit
+
+from core import jobs
+
+USER_AGENT = "streamlit_geocoder"
+# Address lookups go to this Nominatim instead of the public one when set,
+# e.g. a self-hosted mirror or the stub started by benchmarks/loadtest.py
+NOMINATIM_URL = os.environ.get("OS_ST_GIS_NOMINATIM", "")
+ADDRESS_COLUMNS = ("street", "city", "zip")
+DEFAULT_PLACES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "us_cities.geojson")
+PLACE_NAME_PATTERN = re.compile(r"\b(name|city|place|town|label)\b", re.IGNORECASE)
+EARTH_RADIUS = 6371008.8
+
+
+def geocode_address(geolocator, address):
+    location = geolocator.geocode(address)
+    if location:
+        return location.latitude, location.longitude
+    return None, None
+
+
+def nominatim(url=NOMINATIM_URL):
+    from geopy.geocoders import Nominatim
+
+    if not url:
+        return Nominatim(user_agent=USER_AGENT)
+    parts = urlsplit(url)
+    return Nominatim(user_agent=USER_AGENT, domain=parts.netloc + parts.path.rstrip("/"), scheme=parts.scheme or "https")
+
+
+def geocode_addresses(df, geolocator=None):
+    # One Nominatim request per row, with progress and cancellation between rows
+    if geolocator is None:
+        geolocator = nominatim()
+    df = df.copy()
+    df["latitude"] = None
+    df["longitude"] = None
+    for n, (i, row) in enumerate(df.iterrows()):
+        jobs.checkpoint(n / len(df))
+        address = f"{row['street']}, {row['city']}, {row['zip']}"
+        df.at[i, "latitude"], df.at[i, "longitude"] = geocode_address(geolocator, address)
+    return df
+
+
+def _unit_vectors(latitude, longitude):
+    import numpy as np
+
+    latitude, longitude = np.radians(latitude), np.radians(longitude)
+    return np.column_stack([np.cos(latitude) * np.cos(longitude), np.cos(latitude) * np.sin(longitude), np.sin(latitude)])
+
+
+class PlaceIndex:
+    # Nearest-place lookups over a reference point layer. Places are stored as
+    # unit vectors in a KD-tree: the straight-line (chord) distance between
+    # them orders neighbours exactly as the great-circle distance does.
+    def __init__(self, places, name_column=None):
+        from scipy.spatial import cKDTree
+
+        places = places[places.geometry.notna() & ~places.geometry.is_empty]
+        if places.crs is not None and not places.crs.equals("EPSG:4326"):
+            places = places.to_crs("EPSG:4326")
+        points = places.geometry.representative_point()
+        self.places = places.drop(columns=places.geometry.name).reset_index(drop=True)
+        self.name_column = name_column or self._guess_name_column()
+        self.tree = cKDTree(_unit_vectors(points.y.to_numpy(), points.x.to_numpy()))
+
+    def _guess_name_column(self):
+        columns = [column for column in self.places.columns if PLACE_NAME_PATTERN.search(str(column))]
+        if columns:
+            return columns[0]
+        from pandas.api.types import is_string_dtype
+
+        text = [column for column in self.places.columns if is_string_dtype(self.places[column])]
+        return text[0] if text else None
+
+    def __len__(self):
+        return len(self.places)
+
+    def query(self, latitude, longitude, max_distance=None):
+        # Positions of the nearest places (-1 where there is none within
+        # max_distance metres, or the coordinates are missing) and distances
+        import numpy as np
+
+        latitude, longitude = np.asarray(latitude, dtype=float), np.asarray(longitude, dtype=float)
+        positions = np.full(len(latitude), -1)
+        distances = np.full(len(latitude), np.nan)
+        valid = np.isfinite(latitude) & np.isfinite(longitude)
+        if not valid.any() or not len(self):
+            return positions, distances
+        bound = np.inf
+        if max_distance is not None:
+            bound = 2 * np.sin(min(max_distance / EARTH_RADIUS, np.pi) / 2)
+        chord, nearest = self.tree.query(_unit_vectors(latitude[valid], longitude[valid]), distance_upper_bound=bound, workers=-1)
+        found = nearest < len(self)
+        positions[np.flatnonzero(valid)[found]] = nearest[found]
+        distances[np.flatnonzero(valid)[found]] = 2 * EARTH_RADIUS * np.arcsin(np.minimum(chord[found] / 2, 1.0))
+        return positions, distances
+
+
+def reverse_geocode(df, index, latitude_column, longitude_column, max_distance=None, columns=(), name_column=None):
+    # Adds the nearest place's name, its distance in metres and any other
+    # requested place columns; rows without a place within max_distance get nulls
+    from core import coords
+
+    name_column = name_column or index.name_column
+    latitude, longitude, invalid, _ = coords.clean_coordinates(df[latitude_column], df[longitude_column])
+    latitude[invalid] = longitude[invalid] = float("nan")
+    positions, distances = index.query(latitude, longitude, max_distance)
+    found = positions >= 0
+    df = df.copy()
+    for column, name in [(name_column, "nearest_place")] + [(column, f"place_{column}") for column in columns]:
+        if column is None:
+            continue
+        values = index.places[column].take(positions.clip(min=0)).to_numpy(dtype=object)
+        values[~found] = None
+        df[name] = values
+    df["place_distance_m"] = distances
+    return df
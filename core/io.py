@@ -0,0 +1,116 @@
+import contextlib
+import os
+
+import pandas as pd
+import requests
+
+from core import archive, coords, jobs
+
+GITHUB_DATA_URL = "https://api.github.com/repos/rmkenv/OS-ST-GIS/contents/data"
+DATA_EXTENSIONS = ("csv", "xlsx", "zip", "geojson")
+TABULAR_EXTENSIONS = {"csv", "xlsx"}
+LATITUDE_PATTERN = "lat|latitude"
+LONGITUDE_PATTERN = "lng|long|longitude"
+READ_CHUNK_ROWS = 100000
+# Seconds to wait for GitHub before falling back to the bundled files
+GITHUB_TIMEOUT = 10
+
+
+def file_extension(name):
+    return name.split(".")[-1].lower()
+
+
+def layer_name(name):
+    return name.split("/")[-1].split(".")[0]
+
+
+def fetch_github_files(url=GITHUB_DATA_URL):
+    response = requests.get(url, timeout=GITHUB_TIMEOUT)
+    response.raise_for_status()
+    return {
+        file_info["name"]: file_info["download_url"]
+        for file_info in response.json()
+        if file_info["name"].endswith(tuple(f".{extension}" for extension in DATA_EXTENSIONS))
+    }
+
+
+def read_tabular(source, extension):
+    # CSVs are read in chunks, so a read running as a job can report its
+    # progress and be cancelled between them
+    if extension != "csv":
+        jobs.checkpoint()
+        return pd.read_excel(source, engine="openpyxl")
+    with contextlib.ExitStack() as stack:
+        size = None
+        if isinstance(source, str) and os.path.isfile(source):
+            size = max(os.path.getsize(source), 1)
+            source = stack.enter_context(open(source, "rb"))
+        chunks = []
+        for chunk in stack.enter_context(pd.read_csv(source, chunksize=READ_CHUNK_ROWS)):
+            chunks.append(chunk)
+            jobs.checkpoint(source.tell() / size if size else None)
+    return pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+
+
+def read_vector(source):
+    import geopandas as gpd
+
+    if isinstance(source, str) and file_extension(source) == archive.LAYER_EXTENSION:
+        return archive.read_layer(source)
+    try:
+        import pyarrow as pa
+        import pyogrio
+    except ImportError:
+        return gpd.read_file(source)
+    # Read batch by batch through pyogrio's Arrow reader, like read_file
+    # does in one go, so a read running as a job can be cancelled
+    total = pyogrio.read_info(source)["features"] if isinstance(source, str) else -1
+    batches, done = [], 0
+    with pyogrio.open_arrow(source, use_pyarrow=True) as (meta, reader):
+        for batch in reader:
+            batches.append(batch)
+            done += batch.num_rows
+            jobs.checkpoint(done / total if total > 0 else None)
+        df = pa.Table.from_batches(batches, schema=reader.schema).to_pandas()
+    geometry = gpd.GeoSeries.from_wkb(df.pop(meta["geometry_name"] or "wkb_geometry"), crs=meta["crs"])
+    return gpd.GeoDataFrame(df, geometry=geometry.values, crs=meta["crs"])
+
+
+def read_wfs(url):
+    import geopandas as gpd
+
+    return gpd.read_file(url)
+
+
+def read_arcrest(url):
+    import geopandas as gpd
+
+    response = requests.get(url)
+    response.raise_for_status()
+    return gpd.GeoDataFrame.from_features(response.json()["features"])
+
+
+def clean_points(df, latitude_column, longitude_column, drop_invalid=True):
+    import geopandas as gpd
+
+    # Parsed coordinates replace the raw columns; invalid rows are dropped, or
+    # kept without a geometry and flagged in an "invalid_coordinates" column
+    latitude, longitude, invalid, report = coords.clean_coordinates(df[latitude_column], df[longitude_column])
+    df = df.assign(**{latitude_column: latitude, longitude_column: longitude})
+    geometry = gpd.points_from_xy(longitude, latitude)
+    if drop_invalid:
+        return gpd.GeoDataFrame(df[~invalid], geometry=geometry[~invalid], crs="wgs84"), report
+    geometry[invalid] = None
+    df["invalid_coordinates"] = invalid
+    return gpd.GeoDataFrame(df, geometry=geometry, crs="wgs84"), report
+
+
+def points_from_columns(df, latitude_column, longitude_column):
+    return clean_points(df, latitude_column, longitude_column)[0]
+
+
+def guess_column_index(columns, pattern):
+    column_guess = columns.str.contains(pattern, case=False)
+    if column_guess.any():
+        return columns.get_loc(columns[column_guess][0])
+    return 0
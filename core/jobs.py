@@ -0,0 +1,195 @@
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+PER_USER_JOBS = 2
+MAX_RESULTS = 32
+
+# Set inside a worker while it runs a job, so long-running code can report
+# progress and notice cancellation through checkpoint(). Thread-local, as
+# in-process jobs share the server process.
+_local = threading.local()
+
+
+class Cancelled(Exception):
+    pass
+
+
+class QuotaExceeded(RuntimeError):
+    pass
+
+
+def _execute(job_dir, job_id, func, args, kwargs):
+    _local.current = (job_dir, job_id)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _local.current = None
+
+
+def checkpoint(progress=None):
+    # Cheap enough to call once per row or batch; a no-op outside a job
+    current = getattr(_local, "current", None)
+    if current is None:
+        return
+    job_dir, job_id = current
+    if os.path.exists(os.path.join(job_dir, f"{job_id}.cancel")):
+        raise Cancelled()
+    if progress is not None:
+        path = os.path.join(job_dir, f"{job_id}.progress")
+        with open(path + ".tmp", "w") as f:
+            f.write(f"{min(max(progress, 0.0), 1.0):.4f}")
+        os.replace(path + ".tmp", path)
+
+
+def pool_workers(max_workers=None):
+    # Processes a pool may start: one per core, but only one inside a job,
+    # as the job manager already runs a job per core
+    if getattr(_local, "current", None) is not None:
+        return 1
+    return max_workers or os.cpu_count() or 1
+
+
+class Job:
+    def __init__(self, job_id, key, owner, label, future, job_dir):
+        self.id = job_id
+        self.key = key
+        self.owner = owner
+        self.label = label
+        self.future = future
+        self.job_dir = job_dir
+        self.submitted = time.time()
+
+    @property
+    def status(self):
+        if self.future.cancelled():
+            return "cancelled"
+        if not self.future.done():
+            return "running" if self.future.running() else "queued"
+        error = self.future.exception()
+        if isinstance(error, Cancelled):
+            return "cancelled"
+        return "failed" if error is not None else "done"
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    @property
+    def progress(self):
+        try:
+            with open(os.path.join(self.job_dir, f"{self.id}.progress")) as f:
+                return float(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def error(self):
+        return self.future.exception()
+
+    def result(self):
+        return self.future.result()
+
+
+class JobManager:
+    # One per server process, shared by all sessions. Work runs on a local
+    # process pool; finished jobs stay available by key until evicted, so
+    # identical requests from other sessions reuse the same result. Failed
+    # jobs are evicted as they fail and kept for their owner only, to show
+    # the error; anyone asking for the key again starts it afresh.
+    def __init__(self, max_workers=None, per_user=PER_USER_JOBS, max_results=MAX_RESULTS):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.per_user = per_user
+        self.max_results = max_results
+        self.job_dir = tempfile.mkdtemp(prefix="os_st_gis_jobs_")
+        self.jobs = {}
+        self.failed = {}
+        # Reentrant: a job that is already done runs its callback in submit
+        self.lock = threading.RLock()
+        self.executor = self._executor()
+        self.threads = ThreadPoolExecutor(self.max_workers, thread_name_prefix="job")
+
+    def _executor(self):
+        return ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def get(self, key, owner=None):
+        return self.jobs.get(key) or self.failed.get((owner, key))
+
+    def active(self, owner):
+        return [job for job in self.jobs.values() if job.owner == owner and job.active]
+
+    def submit(self, owner, key, label, func, *args, in_process=False, **kwargs):
+        # in_process runs the job on a thread of the server process instead,
+        # for jobs whose inputs are too large to copy into a worker
+        with self.lock:
+            job = self.jobs.get(key)
+            if job is not None and job.status in ("queued", "running", "done"):
+                return job
+            if len(self.active(owner)) >= self.per_user:
+                raise QuotaExceeded(f"You already have {self.per_user} jobs running; wait for one to finish or cancel it.")
+            job_id = uuid.uuid4().hex
+            if in_process:
+                future = self.threads.submit(_execute, self.job_dir, job_id, func, args, kwargs)
+            else:
+                future = self._submit(job_id, func, args, kwargs)
+            job = Job(job_id, key, owner, label, future, self.job_dir)
+            self.jobs.pop(key, None)
+            self.failed.pop((owner, key), None)
+            self.jobs[key] = job
+            self._evict()
+            future.add_done_callback(lambda _, job=job: self._finished(job))
+            return job
+
+    def _finished(self, job):
+        if job.status != "failed":
+            return
+        with self.lock:
+            if self.jobs.get(job.key) is job:
+                del self.jobs[job.key]
+            self.failed[(job.owner, job.key)] = job
+            self._evict()
+
+    def _submit(self, job_id, func, args, kwargs):
+        try:
+            return self.executor.submit(_execute, self.job_dir, job_id, func, args, kwargs)
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); start over with a fresh pool
+            self.executor = self._executor()
+            return self.executor.submit(_execute, self.job_dir, job_id, func, args, kwargs)
+
+    def cancel(self, key):
+        job = self.jobs.get(key)
+        if job is None or not job.active:
+            return
+        # Queued jobs never start; running ones stop at their next checkpoint
+        if not job.future.cancel():
+            open(os.path.join(self.job_dir, f"{job.id}.cancel"), "w").close()
+
+    def forget(self, key, owner=None):
+        with self.lock:
+            forgotten = [self.jobs.pop(key, None), self.failed.pop((owner, key), None)]
+        for job in forgotten:
+            if job is not None:
+                self._remove_files(job)
+
+    def _remove_files(self, job):
+        paths = [os.path.join(self.job_dir, f"{job.id}.{suffix}") for suffix in ("cancel", "progress")]
+        # Jobs that write a file into the job directory return its path
+        if job.status == "done" and isinstance(job.result(), str) and job.result().startswith(self.job_dir):
+            paths.append(job.result())
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _evict(self):
+        finished = [key for key, job in self.jobs.items() if not job.active]
+        for key in finished[: max(0, len(finished) - self.max_results)]:
+            self._remove_files(self.jobs.pop(key))
+        for key in list(self.failed)[: max(0, len(self.failed) - self.max_results)]:
+            self._remove_files(self.failed.pop(key))
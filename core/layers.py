@@ -0,0 +1,318 @@
+import json
+
+import folium
+from branca.colormap import linear
+from branca.element import MacroElement
+from jinja2 import Template
+import numpy as np
+import pandas as pd
+
+from core import mapcache
+
+
+def new_map(location, zoom_start):
+    return folium.Map(location, zoom_start=zoom_start)
+
+
+def add_basemaps(map_):
+    folium.TileLayer(
+        "https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}",
+        name="ESRI Satellite",
+        attr="ESRI",
+    ).add_to(map_)
+    folium.TileLayer("CartoDB dark_matter", name="CartoDB Dark").add_to(map_)
+
+
+def fit_bounds(map_, bounds):
+    map_.fit_bounds([[bounds[1], bounds[0]], [bounds[3], bounds[2]]])
+
+
+def combined_bounds(data_frames):
+    bounds = np.array([data_frame.total_bounds for data_frame in data_frames])
+    return [bounds[:, 0].min(), bounds[:, 1].min(), bounds[:, 2].max(), bounds[:, 3].max()]
+
+
+def create_popup_html(properties):
+    html = "<div style='max-height: 200px; overflow-y: auto;'>"
+    for key, value in properties.items():
+        html += f"<b>{key}</b>: {value}<br>"
+    html += "</div>"
+    return html
+
+
+def popup_html_column(df):
+    # Build every popup at once instead of formatting row by row
+    html = pd.Series("<div style='max-height: 200px; overflow-y: auto;'>", index=df.index)
+    for column in df.columns:
+        html = html + f"<b>{column}</b>: " + df[column].astype(str) + "<br>"
+    return (html + "</div>").tolist()
+
+
+MARKER_CALLBACK = """
+function (row) {
+    var marker = L.marker(new L.LatLng(row[0], row[1]), {fid: row[3]});
+    marker.bindPopup(row[2], {maxWidth: 300});
+    return marker;
+}
+"""
+
+
+def marker_data(gdf, latitude_column, longitude_column):
+    # Rows of [lat, lng, popup html, feature id], rendered client-side by a single cluster layer
+    # Rows flagged with invalid coordinates have no position to draw
+    gdf = gdf[gdf.geometry.notna()]
+    popups = popup_html_column(gdf.drop(columns="geometry"))
+    latitudes = gdf[latitude_column].astype(float).tolist()
+    longitudes = gdf[longitude_column].astype(float).tolist()
+    feature_ids = gdf.index.astype(str).tolist()
+    return [list(row) for row in zip(latitudes, longitudes, popups, feature_ids)]
+
+
+def add_markers(map_, rows, layer_name, fingerprint=None, key=None):
+    # fingerprint identifies rows, e.g. by the cache keys they were made from
+    from folium.plugins import FastMarkerCluster
+
+    def build():
+        return tag_layer(FastMarkerCluster(rows, callback=MARKER_CALLBACK, name=layer_name), key)
+
+    return mapcache.add(map_, None if fingerprint is None else ("markers", layer_name, fingerprint, key), build)
+
+
+class LayerKey(MacroElement):
+    # Names a layer on the client so later filter masks can find it
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            {{ this._parent.get_name() }}.options.layerKey = {{ this.key }};
+        {% endmacro %}
+    """)
+
+    def __init__(self, key):
+        super().__init__()
+        self._name = "LayerKey"
+        self.key = json.dumps(key)
+
+
+class FilterMask(MacroElement):
+    # Shows or hides features of an already rendered layer by feature id, so a
+    # filter change only ships the ids instead of the whole layer
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function (map) {
+            var ids = new Set({{ this.ids }});
+            var hide = {{ this.hide }};
+            var visible = function (fid) { return ids.has(String(fid)) !== hide; };
+            map.eachLayer(function (layer) {
+                if (!layer.options || layer.options.layerKey !== {{ this.key }}) {
+                    return;
+                }
+                if (L.MarkerClusterGroup && layer instanceof L.MarkerClusterGroup) {
+                    layer._maskAll = layer._maskAll || layer.getLayers();
+                    layer.clearLayers();
+                    layer.addLayers(layer._maskAll.filter(function (marker) {
+                        return visible(marker.options.fid);
+                    }));
+                } else if (layer.eachLayer) {
+                    var mask = function () {
+                        layer.eachLayer(function (feature) {
+                            var shown = visible(feature.feature.id);
+                            if (feature.setStyle) {
+                                if (shown) {
+                                    layer.resetStyle(feature);
+                                } else {
+                                    feature.setStyle({opacity: 0, fillOpacity: 0});
+                                }
+                            } else if (feature.setOpacity) {
+                                feature.setOpacity(shown ? 1 : 0);
+                            }
+                        });
+                    };
+                    // Compressed layers add their features once decoded
+                    if (layer._loading) {
+                        layer._loading.then(mask);
+                    } else {
+                        mask();
+                    }
+                }
+            });
+        })(window.map);
+        {% endmacro %}
+    """)
+
+    def __init__(self, key, ids, hide):
+        super().__init__()
+        self._name = "FilterMask"
+        self.key = json.dumps(key)
+        self.ids = json.dumps(ids)
+        self.hide = json.dumps(hide)
+
+
+COMPACT_LAYER_SCRIPT = """
+    {% macro script(this, kwargs) %}
+    (function (layer, encoding) {
+        var topology = function (data) {
+            var transform = data.transform, scale = transform.scale, translate = transform.translate;
+            var arcs = data.arcs.map(function (arc) {
+                var x = 0, y = 0;
+                return arc.map(function (delta) {
+                    x += delta[0];
+                    y += delta[1];
+                    return [x * scale[0] + translate[0], y * scale[1] + translate[1]];
+                });
+            });
+            var position = function (point) {
+                return [point[0] * scale[0] + translate[0], point[1] * scale[1] + translate[1]];
+            };
+            var line = function (indexes) {
+                var coordinates = [];
+                indexes.forEach(function (index, n) {
+                    var arc = index < 0 ? arcs[~index].slice().reverse() : arcs[index];
+                    for (var i = n ? 1 : 0; i < arc.length; i++) {
+                        coordinates.push(arc[i]);
+                    }
+                });
+                return coordinates;
+            };
+            var geometry = function (shape) {
+                switch (shape.type) {
+                    case "Point": return {type: shape.type, coordinates: position(shape.coordinates)};
+                    case "MultiPoint": return {type: shape.type, coordinates: shape.coordinates.map(position)};
+                    case "LineString": return {type: shape.type, coordinates: line(shape.arcs)};
+                    case "MultiLineString":
+                    case "Polygon": return {type: shape.type, coordinates: shape.arcs.map(line)};
+                    case "MultiPolygon": return {type: shape.type, coordinates: shape.arcs.map(function (polygon) { return polygon.map(line); })};
+                    case "GeometryCollection": return {type: shape.type, geometries: shape.geometries.map(geometry)};
+                    default: return null;
+                }
+            };
+            var features = Object.values(data.objects)[0].geometries.map(function (shape) {
+                return {type: "Feature", id: shape.id, properties: shape.properties, geometry: geometry(shape)};
+            });
+            return {type: "FeatureCollection", features: features};
+        };
+        var add = function (data) {
+            layer.addData(encoding.indexOf("topojson") === 0 ? topology(data) : data);
+        };
+        {%- if this.compressed %}
+        layer._loading = fetch("data:application/octet-stream;base64," + {{ this.payload }})
+            .then(function (response) {
+                return new Response(response.body.pipeThrough(new DecompressionStream("gzip"))).json();
+            })
+            .then(add);
+        {%- else %}
+        add({{ this.payload }});
+        {%- endif %}
+    })({{ this._parent.get_name() }}, {{ this.encoding }});
+    {% endmacro %}
+"""
+
+
+class CompactLayer(MacroElement):
+    # Adds the features of a GeoJson layer from one of the compact encodings
+    # of core.topology instead of inline GeoJSON; gzip payloads are inflated
+    # by the browser, so those layers fill in asynchronously
+    _template = Template(COMPACT_LAYER_SCRIPT)
+
+    def __init__(self, encoding, payload):
+        super().__init__()
+        self._name = "CompactLayer"
+        self.encoding = json.dumps(encoding)
+        self.compressed = encoding.endswith("+gzip")
+        # Uncompressed TopoJSON is already JSON text, embedded as is
+        self.payload = json.dumps(payload) if self.compressed else payload
+
+
+def tag_layer(layer, key):
+    if key is not None:
+        layer.add_child(LayerKey(key))
+    return layer
+
+
+def filter_mask(key, all_index, filtered_index):
+    # Send whichever id list is shorter: the features kept or the ones removed
+    kept = filtered_index.astype(str)
+    removed = all_index.difference(filtered_index).astype(str)
+    if len(removed) <= len(kept):
+        mask = FilterMask(key, removed.tolist(), hide=True)
+    else:
+        mask = FilterMask(key, kept.tolist(), hide=False)
+    feature_group = folium.FeatureGroup(name=f"{key} filter", control=False)
+    feature_group.add_child(mask)
+    return feature_group
+
+
+def add_geojson_layer(map_, json_data_frame, layer_name, fingerprint=None, transport=None, key=None):
+    # transport is an (encoding, payload) pair from core.topology.encode_layer;
+    # for compact encodings the layer is built around a geometry-less first
+    # feature, which gives folium the popup fields and feature ids it needs.
+    # fingerprint identifies the features, e.g. by the cache key they came from
+    def build():
+        data = json_data_frame
+        compact = transport is not None and transport[0] != "geojson" and data.get("features")
+        if "features" in data and data["features"]:
+            property_keys = list(data["features"][0]["properties"].keys())
+            if compact:
+                first = dict(data["features"][0], geometry=None)
+                data = {"type": "FeatureCollection", "features": [first]}
+            layer = folium.GeoJson(
+                data,
+                name=layer_name,
+                zoom_on_click=True,
+                highlight_function=lambda feature: {"fillColor": "dark gray"},
+                popup=folium.GeoJsonPopup(
+                    fields=property_keys,
+                    aliases=property_keys,
+                    localize=True,
+                    style="max-height: 200px; overflow-y: auto;",
+                ),
+            )
+        else:
+            layer = folium.GeoJson(data, name=layer_name, zoom_on_click=True)
+        if compact:
+            layer.add_child(CompactLayer(*transport))
+        return tag_layer(layer, key)
+
+    encoding = transport and transport[0]
+    return mapcache.add(map_, None if fingerprint is None else ("geojson", layer_name, fingerprint, encoding, key), build)
+
+
+def add_image_layer(map_, image, bounds, layer_name, opacity=0.8):
+    import base64
+
+    url = "data:image/png;base64," + base64.b64encode(image).decode()
+    return folium.raster_layers.ImageOverlay(url, bounds, name=layer_name, opacity=opacity).add_to(map_)
+
+
+def add_aggregate_layer(map_, bins, column, layer_name, heatmap=False, fingerprint=None):
+    # fingerprint identifies bins, e.g. by the arguments of the cached binning
+    values = bins[column].fillna(0)
+    if heatmap:
+        import shapely
+        from folium.plugins import HeatMap
+
+        def build():
+            centers = shapely.centroid(bins.geometry.values)
+            weights = values / values.max() if values.max() > 0 else values
+            rows = np.column_stack([shapely.get_y(centers), shapely.get_x(centers), weights]).tolist()
+            return HeatMap(rows, name=layer_name)
+
+        return mapcache.add(map_, None if fingerprint is None else ("heatmap", layer_name, column, fingerprint), build)
+
+    vmin, vmax = float(values.min()), float(values.max())
+    colormap = linear.YlOrRd_09.scale(vmin, vmax if vmax > vmin else vmin + 1)
+    colormap.caption = f"{layer_name} ({column})"
+    colormap.add_to(map_)
+    fields = ["count"] if column == "count" else ["count", column]
+
+    def build():
+        return folium.GeoJson(
+            bins.to_json(),
+            name=layer_name,
+            style_function=lambda feature: {
+                "fillColor": colormap(feature["properties"][column] or 0),
+                "fillOpacity": 0.6,
+                "weight": 0,
+            },
+            tooltip=folium.GeoJsonTooltip(fields=fields, localize=True),
+        )
+
+    return mapcache.add(map_, None if fingerprint is None else ("bins", layer_name, column, fingerprint), build)
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import threading
+import zlib
+from collections import OrderedDict
+
+from branca.element import CssLink, JavascriptLink
+import folium
+from folium.elements import JSCSSMixin
+from folium.map import Layer
+from jinja2 import Template
+
+MAP_CACHE_BYTES = 64 * 2**20
+PAGE_PARTS = ("header", "html")
+
+
+class RenderCache:
+    # LRU of rendered layers, zlib-compressed JSON and bounded by their
+    # compressed size, shared by every session in the process
+    def __init__(self, max_bytes=MAP_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.payloads = OrderedDict()
+        self.size = 0
+        self.raw_size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.payloads.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.payloads.move_to_end(key)
+        return json.loads(zlib.decompress(entry[0]))
+
+    def put(self, key, payload):
+        try:
+            raw = json.dumps(payload).encode()
+        except (TypeError, ValueError):
+            return None
+        compressed = zlib.compress(raw, 6)
+        with self.lock:
+            if key in self.payloads:
+                return len(compressed)
+            self.payloads[key] = (compressed, len(raw))
+            self.size += len(compressed)
+            self.raw_size += len(raw)
+            while self.size > self.max_bytes and len(self.payloads) > 1:
+                _, (evicted, evicted_raw) = self.payloads.popitem(last=False)
+                self.size -= len(evicted)
+                self.raw_size -= evicted_raw
+        return len(compressed)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "layers": len(self.payloads),
+            "bytes": self.size,
+            "raw_bytes": self.raw_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+MAP_CACHE = RenderCache()
+
+
+class RenderedLayer(JSCSSMixin, Layer):
+    # A layer and its children as folium rendered them once, with the names
+    # they had then swapped for this element's and its map's. st_folium sees
+    # an ordinary overlay that costs nothing to render.
+    _template = Template("""
+        {% macro header(this, kwargs) %}{{ this.part("header") }}{% endmacro %}
+        {% macro html(this, kwargs) %}{{ this.part("html") }}{% endmacro %}
+        {% macro script(this, kwargs) %}{{ this.part("script") }}{% endmacro %}
+    """)
+
+    def __init__(self, rendered, cached=False):
+        super().__init__(name=rendered["layer_name"], overlay=True, control=rendered["control"])
+        self._name = "RenderedLayer"
+        self.rendered = rendered
+        self.cached = cached
+        self.default_js = [tuple(link) for link in rendered["js"]]
+        self.default_css = [tuple(link) for link in rendered["css"]]
+
+    def part(self, name):
+        text = self.rendered[name]
+        return text.replace(self.rendered["name"], self.get_name()).replace(self.rendered["parent"], self._parent.get_name())
+
+
+def _elements(element):
+    yield element
+    for child in element._children.values():
+        yield from _elements(child)
+
+
+def render(layer):
+    # Renders a layer on a scratch map and keeps what it adds to the page:
+    # the scripts of its elements, as st_folium builds them, and the header
+    # and html entries rendering it added. Elements folium adds while
+    # rendering, such as the call adding the layer to its map, are left for
+    # RenderedLayer to add again.
+    scratch = folium.Map(tiles=None)
+    figure = scratch.get_root()
+    figure.render()
+    before = {part: set(getattr(figure, part)._children) for part in PAGE_PARTS}
+    scratch.add_child(layer)
+    elements = list(_elements(layer))
+    figure.render()
+    rendered = {
+        "name": layer.get_name(),
+        "parent": scratch.get_name(),
+        "layer_name": layer.layer_name,
+        "control": layer.control,
+        "js": [],
+        "css": [],
+    }
+    for part in PAGE_PARTS:
+        added = [
+            element.render()
+            for name, element in getattr(figure, part)._children.items()
+            if name not in before[part] and not isinstance(element, (CssLink, JavascriptLink))
+        ]
+        rendered[part] = "\n".join(added)
+    macros = [(element, element._template.module.__dict__.get("script")) for element in elements]
+    rendered["script"] = "\n".join(macro(element, {}) for element, macro in macros if macro is not None)
+    for element in elements:
+        for links in ("js", "css"):
+            for link in getattr(element, f"default_{links}", []):
+                if list(link) not in rendered[links]:
+                    rendered[links].append(list(link))
+    return rendered
+
+
+def add(map_, fingerprint, build):
+    # Adds the layer build() makes, rendered once for every map showing the
+    # same content: fingerprint has to capture all of it, from the cache keys
+    # of the layer's data to its name and options. Without one the layer is
+    # built and rendered as usual.
+    if fingerprint is None:
+        return build().add_to(map_)
+    key = hashlib.sha1(repr(fingerprint).encode()).hexdigest()
+    rendered = MAP_CACHE.get(key)
+    cached = rendered is not None
+    if not cached:
+        rendered = render(build())
+        MAP_CACHE.put(key, rendered)
+    return RenderedLayer(rendered, cached).add_to(map_)
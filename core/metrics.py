@@ -0,0 +1,178 @@
+import contextlib
+import contextvars
+import json
+import threading
+import time
+import tracemalloc
+
+PREFIX = "os_st_gis"
+
+# The recorder for the current script run; nothing is recorded without one,
+# so instrumented code costs one context variable lookup when disabled
+_current = contextvars.ContextVar("metrics_recorder", default=None)
+_null_span = contextlib.nullcontext()
+
+
+class Span:
+    def __init__(self, name, depth):
+        self.name = name
+        self.depth = depth
+        self.seconds = 0.0
+        self.memory = None
+        self.peak_memory = None
+        self._start = None
+
+    def __enter__(self):
+        if tracemalloc.is_tracing():
+            self._memory, self._peak = tracemalloc.get_traced_memory()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._start
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            self.memory = current - self._memory
+            self.peak_memory = peak - self._memory if peak > self._peak else max(self.memory, 0)
+        return False
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "depth": self.depth,
+            "seconds": self.seconds,
+            "memory": self.memory,
+            "peak_memory": self.peak_memory,
+        }
+
+
+class Totals:
+    # Process-wide aggregates across sessions, for monitoring exports
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spans = {}
+        self.counters = {}
+        self.sizes = {}
+
+    def add_span(self, name, seconds):
+        with self.lock:
+            count, total = self.spans.get(name, (0, 0.0))
+            self.spans[name] = (count + 1, total + seconds)
+
+    def add_count(self, name, label, value):
+        with self.lock:
+            self.counters[(name, label)] = self.counters.get((name, label), 0) + value
+
+    def set_size(self, name, nbytes):
+        with self.lock:
+            self.sizes[name] = nbytes
+
+
+TOTALS = Totals()
+
+
+class Recorder:
+    def __init__(self):
+        self.spans = []
+        self.counters = {}
+        self.sizes = {}
+        self._depth = 0
+
+    def reset(self):
+        self.spans = []
+        self.counters = {}
+        self.sizes = {}
+        self._depth = 0
+
+    @contextlib.contextmanager
+    def span(self, name):
+        span = Span(name, self._depth)
+        self.spans.append(span)
+        self._depth += 1
+        try:
+            with span:
+                yield span
+        finally:
+            self._depth -= 1
+            TOTALS.add_span(name, span.seconds)
+
+    def count(self, name, label="", value=1):
+        self.counters[(name, label)] = self.counters.get((name, label), 0) + value
+        TOTALS.add_count(name, label, value)
+
+    def size(self, name, nbytes):
+        self.sizes[name] = nbytes
+        TOTALS.set_size(name, nbytes)
+
+    def to_dict(self):
+        return {
+            "spans": [span.to_dict() for span in self.spans],
+            "counters": [{"name": name, "label": label, "value": value} for (name, label), value in self.counters.items()],
+            "sizes": self.sizes,
+        }
+
+
+def activate(recorder):
+    return _current.set(recorder)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def enabled():
+    return _current.get() is not None
+
+
+def span(name):
+    recorder = _current.get()
+    if recorder is None:
+        return _null_span
+    return recorder.span(name)
+
+
+def count(name, label="", value=1):
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.count(name, label, value)
+
+
+def size(name, payload):
+    # payload may be a callable so that measuring it is skipped when disabled
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.size(name, payload() if callable(payload) else payload)
+
+
+def to_json(recorder=None):
+    data = recorder.to_dict() if recorder is not None else {}
+    with TOTALS.lock:
+        data["totals"] = {
+            "spans": {name: {"count": count, "seconds": seconds} for name, (count, seconds) in TOTALS.spans.items()},
+            "counters": [{"name": name, "label": label, "value": value} for (name, label), value in TOTALS.counters.items()],
+            "sizes": dict(TOTALS.sizes),
+        }
+    return json.dumps(data, indent=2)
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def to_openmetrics():
+    lines = []
+    with TOTALS.lock:
+        lines.append(f"# TYPE {PREFIX}_span_seconds summary")
+        for name, (count, seconds) in sorted(TOTALS.spans.items()):
+            lines.append(f'{PREFIX}_span_seconds_count{{span="{_label(name)}"}} {count}')
+            lines.append(f'{PREFIX}_span_seconds_sum{{span="{_label(name)}"}} {seconds:.6f}')
+        for name in sorted({name for name, _ in TOTALS.counters}):
+            lines.append(f"# TYPE {PREFIX}_{name} counter")
+            for (counter, label), value in sorted(TOTALS.counters.items()):
+                if counter == name:
+                    lines.append(f'{PREFIX}_{name}_total{{label="{_label(label)}"}} {value}')
+        lines.append(f"# TYPE {PREFIX}_payload_bytes gauge")
+        for name, nbytes in sorted(TOTALS.sizes.items()):
+            lines.append(f'{PREFIX}_payload_bytes{{payload="{_label(name)}"}} {nbytes}')
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,95 @@
+import contextlib
+import os
+import tracemalloc
+
+import streamlit as st
+
+from core import metrics
+
+# Recording starts switched on for every session when this is set, e.g. on a
+# staging deployment; otherwise each session opts in from the sidebar panel
+ENABLED_BY_DEFAULT = os.environ.get("OS_ST_GIS_METRICS", "") not in ("", "0")
+
+
+def _recorder():
+    if "metrics_recorder" not in st.session_state:
+        st.session_state["metrics_recorder"] = metrics.Recorder()
+    return st.session_state["metrics_recorder"]
+
+
+@contextlib.contextmanager
+def recording(page):
+    # Wraps a whole page run; the panel is drawn after the page so it shows
+    # the spans of the run that just finished
+    if not st.session_state.get("metrics_enabled", ENABLED_BY_DEFAULT):
+        yield
+        metrics_panel()
+        return
+    recorder = _recorder()
+    recorder.reset()
+    token = metrics.activate(recorder)
+    try:
+        with metrics.span(page):
+            yield
+    finally:
+        metrics.deactivate(token)
+    metrics_panel(recorder)
+
+
+def _toggle_memory():
+    if st.session_state["metrics_memory"]:
+        tracemalloc.start()
+    else:
+        tracemalloc.stop()
+
+
+def metrics_panel(recorder=None):
+    with st.sidebar.expander("Performance"):
+        st.toggle("Record timings", value=ENABLED_BY_DEFAULT, key="metrics_enabled")
+        st.checkbox(
+            "Track memory",
+            value=tracemalloc.is_tracing(),
+            key="metrics_memory",
+            on_change=_toggle_memory,
+            help="Traces Python allocations for the whole server process; this slows every session down.",
+        )
+        if recorder is None:
+            st.caption("Turn on recording and rerun to see where the time goes.")
+            return
+
+        st.dataframe(
+            [
+                {
+                    "stage": "· " * span.depth + span.name,
+                    "ms": round(span.seconds * 1000, 1),
+                    "memory MB": None if span.memory is None else round(span.memory / 2**20, 2),
+                    "peak MB": None if span.peak_memory is None else round(span.peak_memory / 2**20, 2),
+                }
+                for span in recorder.spans
+            ],
+            hide_index=True,
+        )
+        if recorder.counters:
+            st.dataframe(
+                [{"counter": name, "label": label, "value": value} for (name, label), value in recorder.counters.items()],
+                hide_index=True,
+            )
+        # Imported here: it pulls in folium, which pages without a map never need
+        from core import mapcache
+
+        stats = mapcache.MAP_CACHE.stats()
+        if stats["hits"] or stats["misses"]:
+            st.caption(
+                f"Layer render cache (all sessions): {stats['hit_ratio']:.0%} hits over {stats['hits'] + stats['misses']} layers, "
+                f"{stats['layers']} layers in {stats['bytes'] / 2**20:.1f} MB ({stats['raw_bytes'] / 2**20:.1f} MB uncompressed)"
+            )
+        if recorder.sizes:
+            st.dataframe(
+                [{"payload": name, "KB": round(nbytes / 1024, 1)} for name, nbytes in recorder.sizes.items()],
+                hide_index=True,
+            )
+        col1, col2 = st.columns(2)
+        col1.download_button("JSON", metrics.to_json(recorder), "metrics.json", "application/json")
+        col2.download_button(
+            "OpenMetrics", metrics.to_openmetrics(), "metrics.txt", "application/openmetrics-text; version=1.0.0"
+        )
@@ -0,0 +1,232 @@
+import importlib.util
+import io
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+RASTER_EXTENSIONS = {"tif", "tiff"}
+COLORMAPS = ("gray", "viridis", "YlGnBu_09", "YlOrRd_09", "RdYlBu_11")
+TILE_SIZE = 256
+# Web Mercator half-width in metres
+ORIGIN = 20037508.342789244
+# Rendered overlays and statistics are read at no more than this many pixels
+# per side, so GDAL serves them from the nearest overview instead of full resolution
+MAX_OVERLAY_PIXELS = 1024
+# The most detail a whole-raster mosaic may be rendered at, per side; beyond
+# it a large file would be read at full resolution into a single image
+MAX_DETAIL_PIXELS = 4 * MAX_OVERLAY_PIXELS
+STATS_PIXELS = 1024
+TILE_CACHE_BYTES = 256 * 2**20
+
+
+def available():
+    return importlib.util.find_spec("rasterio") is not None
+
+
+def _rasterio():
+    try:
+        import rasterio
+    except ImportError as e:
+        raise ImportError("Raster layers need the optional 'rasterio' package.") from e
+    return rasterio
+
+
+def tile_bounds(z, x, y):
+    size = 2 * ORIGIN / 2 ** z
+    return -ORIGIN + x * size, ORIGIN - (y + 1) * size, -ORIGIN + (x + 1) * size, ORIGIN - y * size
+
+
+def tile_range(bounds, z):
+    # Tiles covering Web Mercator bounds at zoom z, as inclusive x and y ranges
+    size = 2 * ORIGIN / 2 ** z
+    last = 2 ** z - 1
+    xmin, ymin, xmax, ymax = bounds
+    x0, x1 = int((xmin + ORIGIN) // size), int((xmax + ORIGIN) // size)
+    y0, y1 = int((ORIGIN - ymax) // size), int((ORIGIN - ymin) // size)
+    return (min(max(x0, 0), last), min(max(x1, 0), last)), (min(max(y0, 0), last), min(max(y1, 0), last))
+
+
+def mercator_to_lonlat(x, y):
+    lon = np.degrees(np.asarray(x) / 6378137.0)
+    lat = np.degrees(2 * np.arctan(np.exp(np.asarray(y) / 6378137.0)) - np.pi / 2)
+    return lon, lat
+
+
+class TileCache:
+    # LRU of decoded tiles bounded by their total size in bytes, shared by
+    # every raster layer and session in the process
+    def __init__(self, max_bytes=TILE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.tiles = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, load):
+        with self.lock:
+            if key in self.tiles:
+                self.hits += 1
+                self.tiles.move_to_end(key)
+                return self.tiles[key]
+            self.misses += 1
+        tile = load()
+        with self.lock:
+            if key not in self.tiles:
+                self.tiles[key] = tile
+                self.size += tile.data.nbytes + np.ma.getmaskarray(tile).nbytes
+            while self.size > self.max_bytes and len(self.tiles) > 1:
+                _, evicted = self.tiles.popitem(last=False)
+                self.size -= evicted.data.nbytes + np.ma.getmaskarray(evicted).nbytes
+        return tile
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"tiles": len(self.tiles), "bytes": self.size, "hits": self.hits, "misses": self.misses, "hit_ratio": self.hits / total if total else 0.0}
+
+
+TILE_CACHE = TileCache()
+
+
+class RasterLayer:
+    # A GeoTIFF or COG that is only ever read through windows: Web Mercator
+    # tiles come from a warped view at the chosen zoom and statistics from a
+    # decimated read, both of which GDAL serves from overviews. The map gets
+    # no tile endpoint to request them from, as Streamlit serves no routes
+    # of its own; render() stitches the cached tiles covering the raster into
+    # one PNG shown as an image overlay.
+    def __init__(self, path):
+        rasterio = _rasterio()
+        from rasterio.crs import CRS
+        from rasterio.vrt import WarpedVRT
+        from rasterio.warp import transform_bounds
+
+        self.path = path
+        self.lock = threading.Lock()
+        self.dataset = rasterio.open(path)
+        if self.dataset.crs is None:
+            raise ValueError("The raster has no coordinate reference system.")
+        mercator = CRS.from_epsg(3857)
+        self.view = self.dataset if self.dataset.crs == mercator else WarpedVRT(self.dataset, crs=mercator)
+        self.total_bounds = np.array(transform_bounds(self.dataset.crs, "EPSG:4326", *self.dataset.bounds))
+        self.count = self.dataset.count
+        self.nodata = self.dataset.nodata
+        self._statistics = None
+
+    @property
+    def overviews(self):
+        return self.dataset.overviews(1)
+
+    @property
+    def native_zoom(self):
+        # The zoom whose tile pixels are closest to the raster's own resolution
+        return max(0, min(22, round(math.log2(2 * ORIGIN / (TILE_SIZE * self.view.res[0])))))
+
+    def auto_zoom(self, max_pixels=MAX_OVERLAY_PIXELS):
+        for z in range(self.native_zoom, -1, -1):
+            (x0, x1), (y0, y1) = tile_range(self.view.bounds, z)
+            if max(x1 - x0 + 1, y1 - y0 + 1) * TILE_SIZE <= max_pixels:
+                return z
+        return 0
+
+    def _read_tile(self, z, x, y, bands):
+        from rasterio.windows import from_bounds
+
+        # Warped views do not allow boundless reads, so only the part of the
+        # tile inside the raster is read and placed into an empty tile
+        xmin, ymin, xmax, ymax = tile_bounds(z, x, y)
+        left, bottom, right, top = self.view.bounds
+        tile = np.ma.masked_all((len(bands), TILE_SIZE, TILE_SIZE), dtype=self.dataset.dtypes[bands[0] - 1])
+        ixmin, iymin, ixmax, iymax = max(xmin, left), max(ymin, bottom), min(xmax, right), min(ymax, top)
+        scale = TILE_SIZE / (xmax - xmin)
+        col0, col1 = round((ixmin - xmin) * scale), round((ixmax - xmin) * scale)
+        row0, row1 = round((ymax - iymax) * scale), round((ymax - iymin) * scale)
+        if col1 <= col0 or row1 <= row0:
+            return tile
+        window = from_bounds(ixmin, iymin, ixmax, iymax, transform=self.view.transform)
+        with self.lock:
+            data = self.view.read(bands, window=window, out_shape=(len(bands), row1 - row0, col1 - col0), masked=True)
+        tile[:, row0:row1, col0:col1] = data
+        return tile
+
+    def tile(self, z, x, y, bands):
+        return TILE_CACHE.get((self.path, z, x, y, tuple(bands)), lambda: self._read_tile(z, x, y, bands))
+
+    def statistics(self, max_pixels=STATS_PIXELS):
+        # Per-band statistics from a decimated read of the whole raster; with
+        # overviews this touches only the smallest one that is large enough
+        if self._statistics is None:
+            factor = max(1.0, max(self.dataset.width, self.dataset.height) / max_pixels)
+            shape = (self.count, max(1, round(self.dataset.height / factor)), max(1, round(self.dataset.width / factor)))
+            with self.lock:
+                data = self.dataset.read(out_shape=shape, masked=True)
+            rows = []
+            for band, values in enumerate(data, start=1):
+                valid = values.compressed().astype(float)
+                low, high = np.percentile(valid, [2, 98]) if len(valid) else (np.nan, np.nan)
+                rows.append(
+                    {
+                        "band": band,
+                        "min": valid.min() if len(valid) else np.nan,
+                        "max": valid.max() if len(valid) else np.nan,
+                        "mean": valid.mean() if len(valid) else np.nan,
+                        "std": valid.std() if len(valid) else np.nan,
+                        "p2": low,
+                        "p98": high,
+                        "valid": len(valid) / values.size,
+                    }
+                )
+            self._statistics = {"bands": rows, "sample_shape": shape[1:], "decimation": factor}
+        return self._statistics
+
+    def _stretch(self, values, band):
+        stats = self.statistics()["bands"][band - 1]
+        low, high = stats["p2"], stats["p98"]
+        if not np.isfinite(low) or high <= low:
+            low, high = stats["min"], stats["max"] if stats["max"] > stats["min"] else stats["min"] + 1
+        return np.clip((values.astype(float) - low) / (high - low), 0, 1)
+
+    def render(self, z, bands, colormap="gray"):
+        # PNG mosaic of the tiles covering the raster at zoom z, and its
+        # corners as [[south, west], [north, east]] for an image overlay.
+        # The whole raster is sent at once, so z is capped where the mosaic
+        # reaches MAX_DETAIL_PIXELS per side.
+        z = min(z, self.auto_zoom(MAX_DETAIL_PIXELS))
+        (x0, x1), (y0, y1) = tile_range(self.view.bounds, z)
+        mosaic = np.ma.masked_all((len(bands), (y1 - y0 + 1) * TILE_SIZE, (x1 - x0 + 1) * TILE_SIZE), dtype=self.dataset.dtypes[bands[0] - 1])
+        for y in range(y0, y1 + 1):
+            for x in range(x0, x1 + 1):
+                row, col = (y - y0) * TILE_SIZE, (x - x0) * TILE_SIZE
+                mosaic[:, row:row + TILE_SIZE, col:col + TILE_SIZE] = self.tile(z, x, y, bands)
+
+        rgba = np.zeros(mosaic.shape[1:] + (4,), dtype=np.uint8)
+        if len(bands) >= 3:
+            for channel, band in enumerate(bands[:3]):
+                rgba[..., channel] = (self._stretch(mosaic[channel].filled(0), band) * 255).astype(np.uint8)
+        else:
+            lut = colormap_table(colormap)
+            rgba[...] = lut[(self._stretch(mosaic[0].filled(0), bands[0]) * 255).astype(np.uint8)]
+        rgba[..., 3] = np.where(np.ma.getmaskarray(mosaic).any(axis=0), 0, 255)
+
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.fromarray(rgba, "RGBA").save(buffer, format="PNG", optimize=False)
+        west, north = mercator_to_lonlat(*tile_bounds(z, x0, y0)[::3])
+        east, south = mercator_to_lonlat(*tile_bounds(z, x1, y1)[2:0:-1])
+        return buffer.getvalue(), [[float(south), float(west)], [float(north), float(east)]]
+
+
+def colormap_table(name):
+    # 256 RGBA rows sampled from a branca colormap, or a gray ramp
+    table = np.full((256, 4), 255, dtype=np.uint8)
+    if name == "gray":
+        table[:, :3] = np.arange(256)[:, None]
+        return table
+    from branca.colormap import linear
+
+    colormap = getattr(linear, name).scale(0, 255)
+    table[:] = [colormap.rgba_bytes_tuple(value) for value in range(256)]
+    return table
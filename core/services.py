@@ -0,0 +1,413 @@
+import datetime
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from io import BytesIO
+from urllib.parse import parse_qsl, urlsplit, urlunsplit
+
+import numpy as np
+import pandas as pd
+import requests
+
+SNAPSHOT_DIR = os.path.join(tempfile.gettempdir(), "os-st-gis-services")
+REFRESH_SECONDS = 60
+TIMEOUT = 60
+# Object ids per request when features are fetched by id
+ID_BATCH = 500
+# Paths of ArcGIS feature layers, e.g. .../FeatureServer/0 or .../MapServer/3/query
+ARCREST_LAYER = re.compile(r"/(?:FeatureServer|MapServer)/\d+(?:/query)?/?$", re.IGNORECASE)
+# Columns holding the ids WFS servers give features as strings (GeoJSON) or gml:id
+ID_COLUMNS = ("id", "gml_id")
+
+
+class ServiceError(ValueError):
+    pass
+
+
+class Snapshot:
+    # A service layer as last fetched, the bounds of every feature (the
+    # layer's spatial index, as in core.catalog) and what the service needs
+    # to be asked for the changes since
+    def __init__(self, url, kind, gdf, bounds, state):
+        self.url = url
+        self.kind = kind
+        self.gdf = gdf
+        self.bounds = bounds
+        self.state = state
+        self.last_refresh = state.get("last_refresh")
+
+    @property
+    def version(self):
+        return self.state.get("version", 0)
+
+    def query(self, bbox):
+        # Features whose bounds intersect bbox, (minx, miny, maxx, maxy)
+        minx, miny, maxx, maxy = bbox
+        bounds = self.bounds
+        rows = np.flatnonzero(
+            (bounds[:, 0] <= maxx) & (bounds[:, 2] >= minx) & (bounds[:, 1] <= maxy) & (bounds[:, 3] >= miny)
+        )
+        return self.gdf.iloc[rows]
+
+
+def _bounds(gdf):
+    return gdf.geometry.bounds.to_numpy() if len(gdf) else np.empty((0, 4))
+
+
+def _get(url, params=None, headers=None):
+    response = requests.get(url, params=params, headers=headers, timeout=TIMEOUT)
+    response.raise_for_status()
+    return response
+
+
+def _arcrest_json(url, params):
+    data = _get(url, params).json()
+    # ArcGIS reports errors with a 200 status
+    if "error" in data:
+        raise ServiceError(data["error"].get("message", "ArcGIS service error"))
+    return data
+
+
+# ArcGIS REST feature layers
+
+
+def arcrest_query(url):
+    # The layer URL and query parameters of a FeatureServer/MapServer query URL
+    parts = urlsplit(url)
+    path = parts.path.rstrip("/")
+    if path.lower().endswith("/query"):
+        path = path[: -len("/query")]
+    params = dict(parse_qsl(parts.query))
+    params.setdefault("where", "1=1")
+    params.setdefault("outFields", "*")
+    params["f"] = "geojson"
+    return urlunsplit((parts.scheme, parts.netloc, path, "", "")), params
+
+
+def _arcrest_frame(features, oid_field):
+    import geopandas as gpd
+
+    ids = [feature.get("properties", {}).get(oid_field, feature.get("id")) for feature in features]
+    # GeoJSON query results are always in WGS84
+    gdf = gpd.GeoDataFrame.from_features(features, crs="EPSG:4326")
+    gdf.index = pd.Index(ids, name=None)
+    return gdf
+
+
+def _arcrest_pages(layer_url, params, oid_field):
+    # Services return at most maxRecordCount features per request and flag
+    # the rest with exceededTransferLimit; pages follow by resultOffset, in
+    # object id order so that they neither overlap nor skip features
+    params = dict(params)
+    params.setdefault("orderByFields", oid_field)
+    features = []
+    while True:
+        data = _arcrest_json(f"{layer_url}/query", dict(params, resultOffset=len(features)) if features else params)
+        page = data.get("features", [])
+        features += page
+        # At the top level in JSON responses, among the properties in GeoJSON ones
+        exceeded = data.get("exceededTransferLimit") or (data.get("properties") or {}).get("exceededTransferLimit")
+        if not exceeded or not page:
+            return _arcrest_frame(features, oid_field)
+
+
+def _arcrest_features(layer_url, params, oid_field, where=None, object_ids=None):
+    params = dict(params)
+    if where is not None:
+        params["where"] = where
+    if object_ids is None:
+        return _arcrest_pages(layer_url, params, oid_field)
+    frames = []
+    object_ids = sorted(object_ids)
+    for start in range(0, len(object_ids), ID_BATCH):
+        batch = dict(params, objectIds=",".join(str(oid) for oid in object_ids[start:start + ID_BATCH]))
+        frames.append(_arcrest_pages(layer_url, batch, oid_field))
+    return pd.concat(frames) if frames else _arcrest_frame([], oid_field)
+
+
+def _arcrest_count(layer_url, params):
+    return _arcrest_json(f"{layer_url}/query", dict(params, returnCountOnly="true", f="json"))["count"]
+
+
+def _arcrest_ids(layer_url, params):
+    data = _arcrest_json(f"{layer_url}/query", dict(params, returnIdsOnly="true", f="json"))
+    return set(data.get("objectIds") or [])
+
+
+def _timestamp(milliseconds):
+    moment = datetime.datetime.fromtimestamp(milliseconds / 1000, datetime.timezone.utc)
+    return moment.strftime("%Y-%m-%d %H:%M:%S.") + f"{moment.microsecond // 1000:03d}"
+
+
+def _arcrest_marks(gdf, state):
+    # Where the next refresh starts: the latest edit date, else the highest id
+    edit_field = state.get("edit_field")
+    if edit_field and edit_field in gdf.columns and gdf[edit_field].notna().any():
+        state["strategy"] = "edit_date"
+        state["max_edit"] = int(gdf[edit_field].max())
+    else:
+        state["strategy"] = "object_id"
+    state["max_oid"] = int(gdf.index.max()) if len(gdf) else 0
+    return state
+
+
+def _arcrest_layer(url):
+    # The layer URL, query parameters and object id field of a feature layer
+    # query URL, or None for other ArcGIS URLs such as Hub downloads, which
+    # are fetched as they are
+    if not ARCREST_LAYER.search(urlsplit(url).path):
+        return None
+    layer_url, params = arcrest_query(url)
+    try:
+        info = _arcrest_json(layer_url, {"f": "json"})
+    except (requests.RequestException, ServiceError, ValueError):
+        return None
+    if not info.get("objectIdField"):
+        return None
+    return layer_url, params, info
+
+
+def fetch_arcrest(url):
+    layer = _arcrest_layer(url)
+    if layer is None:
+        return fetch_http(url)
+    layer_url, params, info = layer
+    oid_field = info["objectIdField"]
+    edit_field = (info.get("editFieldsInfo") or {}).get("editDateField")
+    gdf = _arcrest_features(layer_url, params, oid_field)
+    return gdf, _arcrest_marks(gdf, {"oid_field": oid_field, "edit_field": edit_field})
+
+
+def refresh_arcrest(snapshot):
+    # Only features edited (or, without editor tracking, added) since the
+    # snapshot are fetched; a count tells whether any were deleted, and only
+    # then are all object ids listed to find which
+    state = dict(snapshot.state)
+    if state["strategy"] == "last_modified":
+        # Not a feature layer: fetched and refreshed as a plain URL
+        return refresh_http(snapshot)
+    layer_url, params = arcrest_query(snapshot.url)
+    oid_field = state["oid_field"]
+    where = params["where"]
+    if state["strategy"] == "edit_date":
+        clause = f"{state['edit_field']} >= TIMESTAMP '{_timestamp(state['max_edit'])}'"
+    else:
+        clause = f"{oid_field} > {state['max_oid']}"
+    changed = _arcrest_features(layer_url, params, oid_field, where=f"({where}) AND {clause}")
+    if state["strategy"] == "edit_date":
+        # The query includes the snapshot's own latest edits, so that edits
+        # made later in the same millisecond are not missed
+        changed = _drop_unchanged(changed, snapshot.gdf)
+
+    local = snapshot.gdf.index
+    known = local.union(changed.index)
+    removed = pd.Index([])
+    count = _arcrest_count(layer_url, params)
+    if count != len(known):
+        server = _arcrest_ids(layer_url, params)
+        removed = local.difference(pd.Index(list(server)))
+        # Features the change query cannot see, e.g. added without an edit date
+        missing = server.difference(known)
+        if missing:
+            changed = pd.concat([changed, _arcrest_features(layer_url, params, oid_field, object_ids=missing)])
+    keep = ~local.isin(changed.index) & ~local.isin(removed)
+    state = _arcrest_marks(pd.concat([snapshot.gdf[keep], changed]) if len(changed) else snapshot.gdf[keep], state)
+    return keep, changed, state
+
+
+def _drop_unchanged(changed, local):
+    common = changed.index.intersection(local.index)
+    if not len(common) or list(changed.columns) != list(local.columns):
+        return changed
+    same = _row_hashes(changed.loc[common]).to_numpy() == _row_hashes(local.loc[common]).to_numpy()
+    return changed.drop(common[same])
+
+
+# WFS and other URLs returning a whole layer
+
+
+def _read_layer(content):
+    # Indexed by the ids the service gave its features, when it gave them:
+    # GDAL reads integer GeoJSON ids as FIDs and others into a column.
+    # Without ids the FIDs just count the features, 0 to n - 1.
+    import geopandas as gpd
+
+    gdf = gpd.read_file(BytesIO(content), engine="pyogrio", fid_as_index=True)
+    for column in ID_COLUMNS:
+        if column in gdf.columns and gdf[column].notna().all() and gdf[column].is_unique:
+            gdf.index = pd.Index(gdf[column].to_numpy())
+            return gdf, True
+    ids = not gdf.index.equals(pd.RangeIndex(len(gdf)))
+    gdf.index = gdf.index.rename(None) if ids else pd.RangeIndex(len(gdf))
+    return gdf, ids
+
+
+def fetch_http(url):
+    response = _get(url)
+    gdf, ids = _read_layer(response.content)
+    state = {"strategy": "last_modified", "ids": ids}
+    return gdf, dict(state, etag=response.headers.get("ETag"), last_modified=response.headers.get("Last-Modified"))
+
+
+def refresh_http(snapshot):
+    # A conditional request: servers that send ETag or Last-Modified answer
+    # 304 when nothing changed. Otherwise the layer is read again and
+    # compared with the snapshot, so unchanged features are kept as they are.
+    state = dict(snapshot.state)
+    headers = {}
+    if state.get("etag"):
+        headers["If-None-Match"] = state["etag"]
+    if state.get("last_modified"):
+        headers["If-Modified-Since"] = state["last_modified"]
+    response = requests.get(snapshot.url, headers=headers, timeout=TIMEOUT)
+    if response.status_code == 304:
+        return None, None, state
+    response.raise_for_status()
+    state.update(etag=response.headers.get("ETag"), last_modified=response.headers.get("Last-Modified"))
+    fresh, ids = _read_layer(response.content)
+    local = snapshot.gdf
+    if list(fresh.columns) != list(local.columns) or ids != state.get("ids", False):
+        return None, fresh, dict(state, ids=ids)
+    if ids:
+        # A feature whose id is in the snapshot replaces it when its content changed
+        changed = _drop_unchanged(fresh, local)
+        return local.index.isin(fresh.index) & ~local.index.isin(changed.index), changed, state
+    # Without ids features are matched by content, so an edited feature is
+    # both a new feature and a removed one
+    fresh_rows, local_rows = _row_hashes(fresh), _row_hashes(local)
+    if fresh_rows.duplicated().any() or local_rows.duplicated().any():
+        return None, fresh, state
+    changed = fresh[~fresh_rows.isin(local_rows).to_numpy()]
+    start = local.index.max() + 1 if len(local) else 0
+    changed.index = pd.RangeIndex(start, start + len(changed))
+    return local_rows.isin(fresh_rows).to_numpy(), changed, state
+
+
+def _row_hashes(gdf):
+    import shapely
+
+    attributes = pd.util.hash_pandas_object(gdf.drop(columns=gdf.geometry.name), index=False).to_numpy()
+    geometry = pd.util.hash_array(np.asarray(shapely.to_wkb(gdf.geometry.values), dtype=object))
+    return pd.Series(attributes ^ geometry)
+
+
+FETCH = {"arcrest": fetch_arcrest, "wfs": fetch_http}
+REFRESH = {"arcrest": refresh_arcrest, "wfs": refresh_http}
+
+
+class SnapshotStore:
+    # Service layers kept on disk between refreshes and shared by every
+    # session in the process. Layers are fetched whole once; later
+    # refreshes merge in only the features that changed.
+    def __init__(self, directory=SNAPSHOT_DIR):
+        self.directory = directory
+        self.snapshots = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def _path(self, url, kind):
+        return os.path.join(self.directory, hashlib.sha1(f"{kind}:{url}".encode()).hexdigest()[:16])
+
+    def _lock(self, key):
+        with self.lock:
+            return self.locks.setdefault(key, threading.Lock())
+
+    def get(self, url, kind, max_age=REFRESH_SECONDS):
+        # The snapshot, refreshed first when it was last checked more than
+        # max_age seconds ago; max_age=0 always asks the service
+        key = (kind, url)
+        with self._lock(key):
+            snapshot = self.snapshots.get(key) or self._load(url, kind)
+            if snapshot is None:
+                snapshot = self._fetch(url, kind)
+            elif time.time() - snapshot.state["checked"] >= max_age:
+                snapshot = self._refresh(snapshot)
+            self.snapshots[key] = snapshot
+            return snapshot
+
+    def _fetch(self, url, kind, version=0):
+        start = time.perf_counter()
+        gdf, state = FETCH[kind](url)
+        state["last_refresh"] = {"strategy": "full", "updated": len(gdf), "removed": 0, "seconds": time.perf_counter() - start}
+        return self._save(Snapshot(url, kind, gdf, _bounds(gdf), state), version=version)
+
+    def _refresh(self, snapshot):
+        start = time.perf_counter()
+        try:
+            keep, changed, state = REFRESH[snapshot.kind](snapshot)
+        except (requests.RequestException, ServiceError, KeyError) as e:
+            # Services that reject change queries are fetched whole instead
+            snapshot = self._fetch(snapshot.url, snapshot.kind, version=snapshot.version + 1)
+            snapshot.last_refresh["error"] = str(e)
+            return snapshot
+        strategy = state["strategy"]
+        if changed is None:
+            state["last_refresh"] = {"strategy": "not_modified", "updated": 0, "removed": 0, "seconds": time.perf_counter() - start}
+            state["checked"] = time.time()
+            snapshot.state = state
+            snapshot.last_refresh = state["last_refresh"]
+            return snapshot
+        if keep is None:
+            # Features added or removed without ids to match them by; the
+            # layer as read replaces the snapshot
+            gdf, bounds, removed, strategy = changed, _bounds(changed), 0, "full"
+        else:
+            import geopandas as gpd
+
+            removed = int((~keep).sum()) - int(snapshot.gdf.index[~keep].isin(changed.index).sum())
+            gdf = gpd.GeoDataFrame(pd.concat([snapshot.gdf[keep], changed]), geometry=snapshot.gdf.geometry.name, crs=snapshot.gdf.crs)
+            # Only the changed features' bounds are computed
+            bounds = np.concatenate([snapshot.bounds[keep], _bounds(changed)])
+        state["last_refresh"] = {"strategy": strategy, "updated": len(changed), "removed": removed, "seconds": time.perf_counter() - start}
+        if keep is not None and not len(changed) and not removed:
+            state["checked"] = time.time()
+            snapshot.state = state
+            snapshot.last_refresh = state["last_refresh"]
+            return snapshot
+        return self._save(Snapshot(snapshot.url, snapshot.kind, gdf, bounds, state), version=snapshot.version + 1)
+
+    def _save(self, snapshot, version):
+        snapshot.state.update(version=version, checked=time.time(), url=snapshot.url, kind=snapshot.kind)
+        snapshot.last_refresh = snapshot.state["last_refresh"]
+        # Written under temporary names first so readers never see a partial snapshot
+        os.makedirs(self.directory, exist_ok=True)
+        path, suffix = self._path(snapshot.url, snapshot.kind), f".{os.getpid()}.tmp"
+        snapshot.gdf.to_feather(f"{path}.arrow{suffix}", compression="uncompressed")
+        with open(f"{path}.bounds.npy{suffix}", "wb") as f:
+            np.save(f, snapshot.bounds)
+        with open(f"{path}.json{suffix}", "w") as f:
+            json.dump(snapshot.state, f)
+        for extension in ("arrow", "bounds.npy", "json"):
+            os.replace(f"{path}.{extension}{suffix}", f"{path}.{extension}")
+        return snapshot
+
+    def _load(self, url, kind):
+        import geopandas as gpd
+
+        path = self._path(url, kind)
+        try:
+            with open(f"{path}.json") as f:
+                state = json.load(f)
+            gdf = gpd.read_feather(f"{path}.arrow")
+            bounds = np.load(f"{path}.bounds.npy")
+        except (OSError, ValueError):
+            return None
+        if state.get("url") != url or len(bounds) != len(gdf):
+            return None
+        return Snapshot(url, kind, gdf, bounds, state)
+
+
+def describe(refresh):
+    if not refresh:
+        return ""
+    if refresh["strategy"] == "not_modified":
+        text = "unchanged (not modified)"
+    elif refresh["strategy"] == "full":
+        text = f"fetched {refresh['updated']} features"
+    else:
+        text = f"{refresh['updated']} changed, {refresh['removed']} removed (by {refresh['strategy'].replace('_', ' ')})"
+    return f"{text} in {refresh['seconds'] * 1000:.0f} ms"
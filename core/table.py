@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+
+class TableIndex:
+    # Sort orders are computed once per column, and each searched column is
+    # factorized once so a search only scans its distinct values; page
+    # requests then stay cheap on very large frames.
+    def __init__(self, df):
+        self.df = df
+        self.columns = [column for column in df.columns if column != "geometry"]
+        self._column_positions = [df.columns.get_loc(column) for column in self.columns]
+        self._codes = {}
+        self._orders = {}
+
+    def codes(self, column):
+        if column not in self._codes:
+            codes, uniques = pd.factorize(self.df[column])
+            self._codes[column] = (codes, pd.Index(uniques))
+        return self._codes[column]
+
+    def order(self, column, descending=False):
+        if (column, descending) not in self._orders:
+            values = self.df[column]
+            if pd.api.types.is_numeric_dtype(values):
+                # NumPy sorts NaN last in both directions
+                key = values.to_numpy(dtype=float)
+                key = -key if descending else key
+            else:
+                codes, uniques = self.codes(column)
+                ranks = np.empty(len(uniques), dtype=np.int64)
+                ranks[uniques.astype(str).argsort()] = np.arange(len(uniques))
+                if descending:
+                    ranks = len(uniques) - 1 - ranks
+                # Missing values (code -1) sort last
+                key = np.where(codes < 0, len(uniques), ranks[codes])
+            self._orders[column, descending] = np.argsort(key)
+        return self._orders[column, descending]
+
+    def search(self, column, text):
+        codes, uniques = self.codes(column)
+        hits = uniques.astype(str).str.lower().str.contains(text.lower(), regex=False)
+        # Code -1 (missing) picks up the trailing False
+        return np.append(hits, False)[codes]
+
+    def positions(self, rows=None, sort_by=None, descending=False, search_column=None, search_text=None):
+        n = len(self.df)
+        keep = None
+        if rows is not None:
+            keep = np.zeros(n, dtype=bool)
+            keep[self.df.index.get_indexer(rows)] = True
+        if search_text:
+            found = self.search(search_column, search_text)
+            keep = found if keep is None else keep & found
+
+        order = self.order(sort_by, descending) if sort_by else np.arange(n)
+        return order if keep is None else order[keep[order]]
+
+    def window(self, offset, limit, rows=None, sort_by=None, descending=False, search_column=None, search_text=None):
+        positions = self.positions(rows, sort_by, descending, search_column, search_text)
+        page = positions[offset:offset + limit]
+        # Select the page and the visible columns together so the geometry
+        # column is never dropped from a full copy of the frame
+        return self.df.iloc[page, self._column_positions], len(positions)
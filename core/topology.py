@@ -0,0 +1,214 @@
+import base64
+import gzip
+import json
+
+import numpy as np
+
+# Distinct positions per axis over the layer's extent; at 1e6 a state-wide
+# layer keeps sub-metre precision and most arc deltas stay one to three digits
+QUANTIZATION = 1_000_000
+ENCODINGS = ("geojson", "topojson", "geojson+gzip", "topojson+gzip")
+
+
+class _Builder:
+    # Collects the lines and rings of every geometry so junctions can be found
+    # across the whole layer, and records where each one belongs
+    def __init__(self):
+        self.parts = []
+        self.points = []
+
+    def part(self, coordinates, ring):
+        coordinates = np.asarray(coordinates, dtype=float)
+        self.parts.append((coordinates[:, :2] if len(coordinates) else np.empty((0, 2)), ring))
+        return len(self.parts) - 1
+
+    def point(self, coordinates):
+        self.points.append(coordinates[:2])
+        return len(self.points) - 1
+
+    def geometry(self, geometry):
+        # The GeoJSON geometry with its coordinates replaced by part or point numbers
+        if not geometry:
+            return None
+        kind = geometry["type"]
+        if kind == "GeometryCollection":
+            return {"type": kind, "geometries": [self.geometry(member) for member in geometry["geometries"]]}
+        coordinates = geometry["coordinates"]
+        if kind == "Point":
+            shape = self.point(coordinates)
+        elif kind == "MultiPoint":
+            shape = [self.point(point) for point in coordinates]
+        elif kind == "LineString":
+            shape = self.part(coordinates, False)
+        elif kind == "MultiLineString":
+            shape = [self.part(line, False) for line in coordinates]
+        elif kind == "Polygon":
+            shape = [self.part(ring, True) for ring in coordinates]
+        elif kind == "MultiPolygon":
+            shape = [[self.part(ring, True) for ring in polygon] for polygon in coordinates]
+        else:
+            raise ValueError(f"Unsupported geometry type: {kind}")
+        return {"type": kind, "shape": shape}
+
+
+def _quantizer(builder, quantization):
+    arrays = [coordinates for coordinates, _ in builder.parts if len(coordinates)]
+    if builder.points:
+        arrays.append(np.asarray(builder.points, dtype=float))
+    if not arrays:
+        return np.zeros(2), np.ones(2)
+    coordinates = np.concatenate(arrays)
+    low, high = coordinates.min(axis=0), coordinates.max(axis=0)
+    span = high - low
+    scale = np.where(span > 0, span / (quantization - 1), 1.0)
+    return low, scale
+
+
+def _clean(quantized, ring):
+    # Quantizing can merge neighbouring vertices; rings are handled open
+    keep = np.ones(len(quantized), dtype=bool)
+    keep[1:] = (quantized[1:] != quantized[:-1]).any(axis=1)
+    quantized = quantized[keep]
+    if ring and len(quantized) > 1 and (quantized[0] == quantized[-1]).all():
+        quantized = quantized[:-1]
+    if not ring and len(quantized) == 1:
+        quantized = np.repeat(quantized, 2, axis=0)
+    return quantized
+
+
+def _junctions(parts, keys):
+    # A vertex is a junction where lines end, or where the boundaries passing
+    # through it do not all share the same pair of neighbours
+    centre, low, high, ends = [], [], [], []
+    for (coordinates, ring), key in zip(parts, keys):
+        if not len(key):
+            continue
+        if ring:
+            previous, following = np.roll(key, 1), np.roll(key, -1)
+            centre.append(key)
+        else:
+            ends.append(key[[0, -1]])
+            previous, following = key[:-2], key[2:]
+            centre.append(key[1:-1])
+        low.append(np.minimum(previous, following))
+        high.append(np.maximum(previous, following))
+    if not centre:
+        return np.unique(np.concatenate(ends)) if ends else np.empty(0, dtype=np.int64)
+    triples = np.unique(np.column_stack([np.concatenate(centre), np.concatenate(low), np.concatenate(high)]), axis=0)
+    points, counts = np.unique(triples[:, 0], return_counts=True)
+    junctions = points[counts > 1]
+    if ends:
+        junctions = np.union1d(junctions, np.concatenate(ends))
+    return junctions
+
+
+def _cut(quantized, key, ring, is_junction):
+    # The arcs of one line or ring, each running from junction to junction
+    if not len(key):
+        return []
+    if ring:
+        cuts = np.flatnonzero(is_junction)
+        # Rings without junctions start at their lowest vertex, so the same
+        # ring drawn twice, in either direction, becomes the same arc
+        start = cuts[0] if len(cuts) else int(np.argmin(key))
+        quantized = np.roll(quantized, -start, axis=0)
+        quantized = np.vstack([quantized, quantized[:1]])
+        cuts = np.append((cuts - start) % len(key), len(key)) if len(cuts) else np.array([0, len(key)])
+        cuts = np.unique(cuts)
+    else:
+        cuts = np.unique(np.concatenate([[0], np.flatnonzero(is_junction), [len(key) - 1]]))
+    return [quantized[start:end + 1] for start, end in zip(cuts[:-1], cuts[1:])]
+
+
+def topojson(geojson, quantization=QUANTIZATION, name="layer"):
+    # A quantized TopoJSON topology of a GeoJSON FeatureCollection: boundaries
+    # shared between features are stored once as arcs, and each arc is
+    # delta-encoded so most coordinates become small integers
+    builder = _Builder()
+    features = [(feature, builder.geometry(feature.get("geometry"))) for feature in geojson.get("features", [])]
+    translate, scale = _quantizer(builder, quantization)
+
+    parts = []
+    for coordinates, ring in builder.parts:
+        quantized = np.round((coordinates - translate) / scale).astype(np.int64) if len(coordinates) else np.empty((0, 2), dtype=np.int64)
+        parts.append((_clean(quantized, ring), ring))
+    keys = [quantized[:, 0] * quantization + quantized[:, 1] for quantized, _ in parts]
+    junctions = _junctions(parts, keys)
+    # One lookup for the whole layer, split back into its lines and rings
+    flags = np.split(np.isin(np.concatenate(keys), junctions), np.cumsum([len(key) for key in keys])[:-1]) if keys else []
+
+    arcs, index, references = [], {}, []
+    for (quantized, ring), key, is_junction in zip(parts, keys, flags):
+        part = []
+        for arc in _cut(quantized, key, ring, is_junction):
+            forward = arc.tobytes()
+            if forward in index:
+                part.append(index[forward])
+                continue
+            backward = arc[::-1].tobytes()
+            if backward in index:
+                part.append(~index[backward])
+                continue
+            index[forward] = len(arcs)
+            part.append(len(arcs))
+            arcs.append(np.vstack([arc[:1], np.diff(arc, axis=0)]).tolist())
+        references.append(part)
+
+    points = np.round((np.asarray(builder.points, dtype=float).reshape(-1, 2) - translate) / scale).astype(np.int64).tolist()
+
+    def encode(geometry):
+        if geometry is None:
+            return {"type": None}
+        kind = geometry["type"]
+        if kind == "GeometryCollection":
+            return {"type": kind, "geometries": [encode(member) for member in geometry["geometries"]]}
+        shape = geometry["shape"]
+        if kind == "Point":
+            return {"type": kind, "coordinates": points[shape]}
+        if kind == "MultiPoint":
+            return {"type": kind, "coordinates": [points[point] for point in shape]}
+        if kind == "LineString":
+            return {"type": kind, "arcs": references[shape]}
+        if kind == "MultiPolygon":
+            return {"type": kind, "arcs": [[references[ring] for ring in polygon] for polygon in shape]}
+        return {"type": kind, "arcs": [references[part] for part in shape]}
+
+    geometries = []
+    for feature, geometry in features:
+        encoded = encode(geometry)
+        if "id" in feature:
+            encoded["id"] = feature["id"]
+        encoded["properties"] = feature.get("properties") or {}
+        geometries.append(encoded)
+    return {
+        "type": "Topology",
+        "transform": {"scale": scale.tolist(), "translate": translate.tolist()},
+        "objects": {name: {"type": "GeometryCollection", "geometries": geometries}},
+        "arcs": arcs,
+    }
+
+
+def _gzip_text(text):
+    return base64.b64encode(gzip.compress(text.encode("utf-8"), 6, mtime=0)).decode("ascii")
+
+
+def encode_layer(geojson, overhead=0, encodings=ENCODINGS):
+    # (encoding, payload, sizes): whichever encoding ships the fewest bytes.
+    # Anything but plain GeoJSON pays `overhead` for its client-side decoder.
+    text = json.dumps(geojson)
+    payloads = {"geojson": geojson}
+    sizes = {"geojson": len(text)}
+    compact = {}
+    if "geojson+gzip" in encodings:
+        compact["geojson+gzip"] = _gzip_text(text)
+    if {"topojson", "topojson+gzip"} & set(encodings) and geojson.get("features"):
+        topology = json.dumps(topojson(geojson), separators=(",", ":"))
+        if "topojson" in encodings:
+            compact["topojson"] = topology
+        if "topojson+gzip" in encodings:
+            compact["topojson+gzip"] = _gzip_text(topology)
+    for encoding, payload in compact.items():
+        payloads[encoding] = payload
+        sizes[encoding] = len(payload) + overhead
+    best = min(sizes, key=sizes.get)
+    return best, payloads[best], sizes
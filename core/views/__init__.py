@@ -0,0 +1,75 @@
+# The pages' UI helpers, split by concern; everything public is re-exported
+# here, so pages keep using views.<name>
+from core.views.common import (
+    cached,
+    rewind,
+    source_key,
+    source_name,
+    temp_dir,
+)
+from core.views.loaders import (
+    BACKGROUND_BYTES,
+    SERVICE_TTL,
+    archive_dir,
+    coordinate_report,
+    detect_lat_long,
+    get_files,
+    github_files,
+    github_files_or_error,
+    layer_geojson,
+    load_archive,
+    load_points,
+    load_raster,
+    load_service_layer,
+    load_tabular,
+    load_tabular_layer,
+    load_vector,
+    load_vector_layer,
+    local_catalog,
+    raster_dir,
+    select_lat_long_columns,
+    service_snapshots,
+    vector_sources,
+)
+from core.views.map import (
+    MARKER_LIMIT,
+    POINT_RENDERINGS,
+    add_geojson_layer,
+    add_layer,
+    add_marker_layer,
+    add_point_layer,
+    add_raster_layer,
+    aggregate_points,
+    layer_markers,
+    layer_transport,
+    point_rendering_options,
+    raster_image,
+    raster_options,
+    raster_statistics,
+    render_map,
+)
+from core.views.tables import (
+    TABLE_PAGE_SIZES,
+    data_table,
+    export_combined,
+    filter_dataframe,
+    frame_fingerprint,
+    frame_table,
+    table_index,
+)
+from core.views.out_of_core import (
+    PAGE_SIZE,
+    area_filter,
+    export_out_of_core,
+    load_out_of_core_layer,
+    out_of_core_filters,
+    out_of_core_preview,
+    out_of_core_table,
+    query_backend,
+    register_table,
+    spill_to_disk,
+    table_columns,
+    table_count,
+    table_distinct,
+    table_range,
+)
@@ -0,0 +1,61 @@
+import functools
+import tempfile
+import threading
+
+import streamlit as st
+
+from core import metrics
+
+_cache_state = threading.local()
+
+
+def cached(cache, **options):
+    # st.cache_resource / st.cache_data that, while metrics are recorded,
+    # times every call and counts it as a cache hit or miss
+    def decorate(func):
+        name = func.__name__
+
+        @functools.wraps(func)
+        def compute(*args, **kwargs):
+            _cache_state.missed = True
+            return func(*args, **kwargs)
+
+        cached_func = cache(**options)(compute)
+
+        @functools.wraps(func)
+        def call(*args, **kwargs):
+            if not metrics.enabled():
+                return cached_func(*args, **kwargs)
+            _cache_state.missed = False
+            with metrics.span(name):
+                result = cached_func(*args, **kwargs)
+            metrics.count("cache_misses" if _cache_state.missed else "cache_hits", name)
+            return result
+
+        call.clear = cached_func.clear
+        return call
+
+    return decorate
+
+
+def temp_dir():
+    # One scratch directory per session, reused across reruns
+    if "temp_dir" not in st.session_state:
+        st.session_state["temp_dir"] = tempfile.TemporaryDirectory()
+    return st.session_state["temp_dir"]
+
+
+def source_key(source):
+    if isinstance(source, str):
+        return source
+    return f"{source.name}:{getattr(source, 'file_id', source.size)}"
+
+
+def rewind(source):
+    if not isinstance(source, str):
+        source.seek(0)
+    return source
+
+
+def source_name(source):
+    return source if isinstance(source, str) else source.name
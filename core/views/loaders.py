@@ -0,0 +1,271 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+import requests
+import streamlit as st
+
+from core import archive, background, coords, io, metrics, raster, services
+from core.catalog import Catalog
+from core.views.common import cached, rewind, source_key, source_name
+
+# Uploads at least this large are read on the background job pool
+BACKGROUND_BYTES = 20 * 2**20
+SERVICE_TTL = 300
+
+
+@cached(st.cache_data, ttl=3600, show_spinner=False)
+def github_files():
+    return io.fetch_github_files()
+
+
+@cached(st.cache_data, ttl=60, show_spinner=False)
+def github_files_or_error():
+    # Failures are cached too, briefly, so an unreachable GitHub costs one
+    # timeout a minute rather than one on every rerun
+    try:
+        return github_files(), None
+    except requests.RequestException as e:
+        return {}, str(e)
+
+
+@cached(st.cache_resource, show_spinner=False)
+def local_catalog():
+    # Scanned here and converted on a background thread, so the first page
+    # isn't held up; a file read before its turn is converted by that read
+    catalog = Catalog()
+    catalog.scan()
+    threading.Thread(target=catalog.build_all, name="catalog-build", daemon=True).start()
+    return catalog
+
+
+def _local_entry(source):
+    return local_catalog().entry(source) if isinstance(source, str) else None
+
+
+# Loaded frames and their map payloads are shared read-only across reruns and
+# sessions; the underscore arguments are not hashed, the key identifies them.
+@cached(st.cache_resource, show_spinner="Loading data...", max_entries=32)
+def load_tabular(key, _source, extension):
+    if _local_entry(_source):
+        return local_catalog().read(_source)
+    return io.read_tabular(rewind(_source), extension)
+
+
+@cached(st.cache_resource, show_spinner="Cleaning coordinates...", max_entries=32)
+def load_points(key, _df, latitude_column, longitude_column, drop_invalid=True):
+    return io.clean_points(_df, latitude_column, longitude_column, drop_invalid)
+
+
+@cached(st.cache_resource, show_spinner=False, max_entries=32)
+def detect_lat_long(key, _df):
+    return coords.detect_lat_long(_df)
+
+
+@cached(st.cache_resource, show_spinner="Loading data...", max_entries=32)
+def load_vector(key, _source):
+    if _local_entry(_source):
+        return local_catalog().read(_source)
+    return io.read_vector(rewind(_source))
+
+
+@cached(st.cache_resource, show_spinner=False)
+def archive_dir():
+    return tempfile.mkdtemp(prefix="archives-")
+
+
+@cached(st.cache_resource, show_spinner="Reading archive layers...", max_entries=16)
+def load_archive(key, _source):
+    # Every layer in the archive is read in parallel into its own file, which
+    # is then loaded and cached like any other vector source
+    out_dir = os.path.join(archive_dir(), hashlib.sha1(key.encode()).hexdigest())
+    os.makedirs(out_dir, exist_ok=True)
+    path = _source
+    if not isinstance(_source, str):
+        path = os.path.join(out_dir, "source.zip")
+        with open(path, "wb") as f:
+            f.write(_source.getbuffer())
+    return archive.extract_layers(path, out_dir)
+
+
+@cached(st.cache_resource, show_spinner=False)
+def raster_dir():
+    return tempfile.mkdtemp(prefix="rasters-")
+
+
+@cached(st.cache_resource, show_spinner="Opening raster...", max_entries=16)
+def load_raster(key, _source):
+    # Rasters are opened by path and only read through windows; uploads are
+    # written to disk once so GDAL can seek in them
+    path = _source
+    if not isinstance(_source, str):
+        path = os.path.join(raster_dir(), f"{hashlib.sha1(key.encode()).hexdigest()}.{io.file_extension(_source.name)}")
+        if not os.path.exists(path):
+            with open(path + ".tmp", "wb") as f:
+                f.write(_source.getbuffer())
+            os.replace(path + ".tmp", path)
+    elif path.startswith(("http://", "https://")):
+        # Cloud-optimized GeoTIFFs are read with HTTP range requests
+        path = f"/vsicurl/{path}"
+    return raster.RasterLayer(path)
+
+
+@cached(st.cache_resource, show_spinner=False, max_entries=32)
+def layer_geojson(key, _gdf):
+    return json.loads(_gdf.to_json())
+
+
+def get_files(show_error=False, rasters=False):
+    extensions = list(io.DATA_EXTENSIONS) + (sorted(raster.RASTER_EXTENSIONS) if rasters and raster.available() else [])
+    uploaded_files = st.file_uploader("Upload one or more files", type=extensions, accept_multiple_files=True)
+    st.write("Or")
+    selected_files = []
+    file_options, error = github_files_or_error()
+    if error and show_error:
+        st.error(f"Failed to fetch GitHub files. {error}")
+    # Files bundled under data/ are served from the local catalog instead of GitHub
+    file_options = {**file_options, **{name: entry.path for name, entry in local_catalog().entries.items()}}
+    if file_options:
+        selected = st.multiselect("Choose one or more options", list(file_options.keys()))
+        selected_files = [file_options[file_name] for file_name in selected]
+    return uploaded_files or [], selected_files
+
+
+def _column_index(columns, column, pattern):
+    if column is not None and column in columns:
+        return columns.get_loc(column)
+    return io.guess_column_index(columns, pattern)
+
+
+def select_lat_long_columns(df, key=None):
+    # Columns are guessed from a sample of the values, falling back to their names
+    latitude_guess, longitude_guess = detect_lat_long(key, df) if key and len(df) else (None, None)
+    col1, col2 = st.columns(2)
+
+    with col1:
+        lat_index = _column_index(df.columns, latitude_guess, io.LATITUDE_PATTERN)
+        latitude_column = st.selectbox(
+            "Choose latitude column:", df.columns, index=lat_index, key=f"lat_{key}" if key else None
+        )
+    with col2:
+        lng_index = _column_index(df.columns, longitude_guess, io.LONGITUDE_PATTERN)
+        longitude_column = st.selectbox(
+            "Choose longitude column:", df.columns, index=lng_index, key=f"lng_{key}" if key else None
+        )
+
+    return latitude_column, longitude_column
+
+
+def coordinate_report(report, key=None):
+    issues = {
+        "unparseable": report["unparseable"],
+        "out of range": report["out_of_range"],
+        "at (0, 0)": report["null_island"],
+    }
+    invalid = report["rows"] - report["valid"]
+    if report["swapped"]:
+        st.info(f"Swapped latitude and longitude back on {report['swapped']:,} rows.")
+    if not invalid:
+        return True
+    details = ", ".join(f"{count:,} {issue}" for issue, count in issues.items() if count)
+    st.warning(f"{invalid:,} of {report['rows']:,} rows have invalid coordinates ({details}).")
+    return st.radio(
+        "Invalid rows:", ("Drop", "Keep and flag"), horizontal=True, key=f"invalid_{key}" if key else None
+    ) == "Drop"
+
+
+def _background_path(key, source, extension):
+    # Remote files and large uploads are read on the job pool; bundled and
+    # small files are quicker to read inline. Uploads are spilled to the job
+    # directory so the worker can open them by path.
+    if isinstance(source, str):
+        return source if source.startswith(("http://", "https://")) and not _local_entry(source) else None
+    if source.size < BACKGROUND_BYTES:
+        return None
+    path = os.path.join(background.job_manager().job_dir, f"{hashlib.sha1(key.encode()).hexdigest()}.{extension}")
+    if not os.path.exists(path):
+        with open(path + ".tmp", "wb") as f:
+            f.write(source.getbuffer())
+        os.replace(path + ".tmp", path)
+    return path
+
+
+def load_tabular_layer(source, extension):
+    # Returns None while a background read is still running
+    key = source_key(source)
+    path = _background_path(key, source, extension)
+    if path is None:
+        df = load_tabular(key, source, extension)
+    else:
+        df = background.run(f"ingest:{key}", f"Reading {io.layer_name(source_name(source))}", io.read_tabular, path, extension)
+        if df is None:
+            return None
+    latitude_column, longitude_column = select_lat_long_columns(df, key)
+    drop_invalid = st.session_state.get(f"invalid_{key}", "Drop") == "Drop"
+    gdf, report = load_points(key, df, latitude_column, longitude_column, drop_invalid)
+    coordinate_report(report, key)
+    return gdf, latitude_column, longitude_column
+
+
+def load_vector_layer(source):
+    key = source_key(source)
+    path = _background_path(key, source, io.file_extension(source_name(source)))
+    if path is None:
+        gdf = load_vector(key, source)
+    else:
+        gdf = background.run(f"ingest:{key}", f"Reading {io.layer_name(source_name(source))}", io.read_vector, path)
+        if gdf is None:
+            return None
+    return gdf, layer_geojson(key, gdf)
+
+
+def vector_sources(source, extension, layer_name):
+    if extension != "zip":
+        return [(source, layer_name)]
+    return [(path, io.layer_name(path)) for path in load_archive(source_key(source), source)]
+
+
+@cached(st.cache_resource, show_spinner=False)
+def service_snapshots():
+    return services.SnapshotStore()
+
+
+def load_service_layer(url, kind, max_age=None):
+    # Returns None while the layer is being fetched, as a background job.
+    # With max_age, the layer comes from its local snapshot, which is asked
+    # for the features changed since once it is older than max_age seconds.
+    label = f"Loading {url.split('?')[0]}"
+    if max_age is None:
+        # Fetched again at most every SERVICE_TTL seconds
+        job_key = f"service:{kind}:{url}:{int(time.time() // SERVICE_TTL)}"
+        gdf = background.run(job_key, label, io.read_wfs if kind == "wfs" else io.read_arcrest, url)
+        if gdf is None:
+            return None
+        return gdf, layer_geojson(f"{kind}:{url}", gdf), f"{kind}:{url}"
+    # A fetch or refresh, once due, keeps its job key across the reruns
+    # that poll it; the snapshot store is shared by this process's sessions,
+    # so the job runs on one of its threads
+    store = service_snapshots()
+    snapshot = store.snapshots.get((kind, url))
+    state_key = f"service_job:{kind}:{url}"
+    if snapshot is None or time.time() - snapshot.state["checked"] >= max_age:
+        checked = None if snapshot is None else snapshot.state["checked"]
+        st.session_state.setdefault(state_key, f"service:{kind}:{url}:{checked}")
+    job_key = st.session_state.get(state_key)
+    if job_key is not None:
+        with metrics.span("service_refresh"):
+            snapshot = background.run(job_key, label, store.get, url, kind, max_age, in_process=True)
+        if snapshot is None:
+            return None
+        del st.session_state[state_key]
+    refresh = snapshot.last_refresh or {}
+    if refresh.get("seconds") is not None and refresh is not st.session_state.get(f"service_refresh:{kind}:{url}"):
+        # Counted once per refresh, not on every rerun that reuses it
+        st.session_state[f"service_refresh:{kind}:{url}"] = refresh
+        metrics.count("service_refresh", refresh["strategy"])
+    st.sidebar.caption(f"{url.split('?')[0]}: {services.describe(refresh)}")
+    data_key = f"{kind}:{url}:{snapshot.version}"
+    return snapshot.gdf, layer_geojson(data_key, snapshot.gdf), data_key
@@ -0,0 +1,173 @@
+import json
+
+import pandas as pd
+import streamlit as st
+from streamlit_folium import st_folium
+
+from core import aggregate, io, layers, mapcache, metrics, raster, topology
+from core.views.common import cached, source_key
+from core.views.loaders import load_raster, load_tabular_layer, load_vector_layer
+
+POINT_RENDERINGS = ("Markers", "Hexagon bins", "Grid cells", "Heatmap")
+MARKER_LIMIT = 50000
+
+
+@cached(st.cache_resource, show_spinner="Rendering raster...", max_entries=32)
+def raster_image(key, _layer, zoom, bands, colormap):
+    return _layer.render(zoom, list(bands), colormap)
+
+
+@cached(st.cache_resource, show_spinner=False, max_entries=32)
+def layer_transport(key, _json_data_frame):
+    # The smallest of plain GeoJSON, TopoJSON and their gzipped forms
+    return topology.encode_layer(_json_data_frame, overhead=len(layers.COMPACT_LAYER_SCRIPT))
+
+
+@cached(st.cache_resource, show_spinner=False, max_entries=32)
+def layer_markers(key, _gdf, latitude_column, longitude_column):
+    return layers.marker_data(_gdf, latitude_column, longitude_column)
+
+
+@cached(st.cache_resource, show_spinner="Binning points...", max_entries=64)
+def aggregate_points(key, _gdf, latitude_column, longitude_column, zoom, kind, value_column, how):
+    located = _gdf[_gdf.geometry.notna()]
+    values = located[value_column] if value_column else None
+    return aggregate.bin_points(located[longitude_column], located[latitude_column], zoom, kind, values, how)
+
+
+def add_marker_layer(map_, source, gdf, latitude_column, longitude_column, layer_name):
+    key = source_key(source)
+    rows = layer_markers(key, gdf, latitude_column, longitude_column)
+    metrics.size(f"markers:{layer_name}", lambda: len(json.dumps(rows)))
+    # The rows are whatever layer_markers caches under these arguments
+    return layers.add_markers(map_, rows, layer_name, (key, latitude_column, longitude_column), key=key)
+
+
+def point_rendering_options(gdf, key, layer_name):
+    # Dense layers default to server-side bins instead of one marker per row
+    dense = len(gdf) > MARKER_LIMIT
+    with st.sidebar.expander(f"Point rendering: {layer_name}", expanded=dense):
+        mode = st.radio("Render points as:", POINT_RENDERINGS, index=1 if dense else 0, key=f"render_{key}")
+        if mode == "Markers":
+            return mode, None, None, "count"
+        zoom = st.slider("Bin zoom level", 2, 16, 8, key=f"zoom_{key}")
+        column = st.selectbox("Aggregate column:", ["None"] + aggregate.numeric_columns(gdf), key=f"agg_column_{key}")
+        if column == "None":
+            return mode, zoom, None, "count"
+        how = st.selectbox("Aggregate:", aggregate.AGGREGATIONS[1:], key=f"agg_{key}")
+    return mode, zoom, column, how
+
+
+def add_point_layer(map_, source, gdf, latitude_column, longitude_column, layer_name):
+    key = source_key(source)
+    mode, zoom, value_column, how = point_rendering_options(gdf, key, layer_name)
+    if mode == "Markers":
+        return add_marker_layer(map_, source, gdf, latitude_column, longitude_column, layer_name)
+    kind = "grid" if mode == "Grid cells" else "hexagon"
+    bins = aggregate_points(key, gdf, latitude_column, longitude_column, zoom, kind, value_column, how)
+    fingerprint = (key, latitude_column, longitude_column, zoom, kind, value_column, how)
+    return layers.add_aggregate_layer(map_, bins, how, layer_name, heatmap=mode == "Heatmap", fingerprint=fingerprint)
+
+
+def add_geojson_layer(map_, source, json_data_frame, layer_name, data_key=None):
+    # data_key is the layer_geojson key the features were cached under, when
+    # it is not the source's own key (e.g. a service snapshot's version)
+    key = source_key(source)
+    data_key = data_key or key
+    encoding, payload, sizes = layer_transport(data_key, json_data_frame)
+    metrics.size(f"geojson:{layer_name}", sizes["geojson"])
+    metrics.size(f"transport:{layer_name}", sizes[encoding])
+    metrics.count("transport", encoding)
+    return layers.add_geojson_layer(map_, json_data_frame, layer_name, data_key, (encoding, payload), key=key)
+
+
+def raster_options(layer, key, layer_name):
+    with st.sidebar.expander(f"Raster: {layer_name}"):
+        if layer.count >= 3:
+            mode = st.radio("Display:", ["RGB", "Single band"], key=f"raster_mode_{key}")
+        else:
+            mode = "Single band"
+        if mode == "RGB":
+            bands = tuple(
+                st.selectbox(f"{channel} band:", range(1, layer.count + 1), index=i, key=f"raster_{channel}_{key}")
+                for i, channel in enumerate(("Red", "Green", "Blue"))
+            )
+            colormap = "gray"
+        else:
+            bands = (st.selectbox("Band:", range(1, layer.count + 1), key=f"raster_band_{key}"),)
+            colormap = st.selectbox("Colour map:", raster.COLORMAPS, index=1, key=f"raster_colormap_{key}")
+        # Capped where the mosaic of the whole raster reaches the pixel budget
+        max_zoom = max(1, layer.auto_zoom(raster.MAX_DETAIL_PIXELS))
+        zoom = st.slider("Detail (tile zoom):", 0, max_zoom, min(layer.auto_zoom(), max_zoom), key=f"raster_zoom_{key}")
+        opacity = st.slider("Opacity:", 0.0, 1.0, 0.8, key=f"raster_opacity_{key}")
+        if not layer.overviews and max(layer.dataset.width, layer.dataset.height) > raster.MAX_OVERLAY_PIXELS:
+            st.caption("This raster has no overviews, so every view reads it at full resolution. Build them (e.g. with gdaladdo) to display large files instantly.")
+    return bands, colormap, zoom, opacity
+
+
+def add_raster_layer(map_, source, layer_name):
+    key = source_key(source)
+    layer = load_raster(key, source)
+    bands, colormap, zoom, opacity = raster_options(layer, key, layer_name)
+    hits, misses = raster.TILE_CACHE.hits, raster.TILE_CACHE.misses
+    with metrics.span(f"raster:{layer_name}"):
+        image, bounds = raster_image(key, layer, zoom, bands, colormap)
+    metrics.count("raster_tiles", "hits", raster.TILE_CACHE.hits - hits)
+    metrics.count("raster_tiles", "misses", raster.TILE_CACHE.misses - misses)
+    metrics.size(f"raster:{layer_name}", len(image))
+    layers.add_image_layer(map_, image, bounds, layer_name, opacity)
+    return layer
+
+
+def raster_statistics(layer):
+    stats = layer.statistics()
+    st.dataframe(pd.DataFrame(stats["bands"]).round(3), hide_index=True)
+    height, width = stats["sample_shape"]
+    st.caption(f"Statistics from a {width} x {height} sample (1:{stats['decimation']:.0f} of full resolution).")
+
+
+def render_map(map_, feature_groups=None, key="map", width=700, height=500):
+    # The browser only redraws the base map when its layers change; filter
+    # masks travel as feature groups, so it keeps its layers and viewport.
+    # Every rerun still sends the full map script to the browser, as
+    # Streamlit re-sends a component's arguments each time it runs: changing
+    # any widget outside a fragment, not just a filter, sends every layer
+    # again. Layers rendered before (by any session) are cached as rendered
+    # text, so at least they aren't rendered again.
+    rendered = [layer for layer in map_._children.values() if isinstance(layer, mapcache.RenderedLayer)]
+    metrics.count("map_cache", "hits", sum(layer.cached for layer in rendered))
+    metrics.count("map_cache", "misses", sum(not layer.cached for layer in rendered))
+    with metrics.span("render_map"):
+        result = st_folium(
+            map_,
+            key=key,
+            width=width,
+            height=height,
+            feature_group_to_add=feature_groups or None,
+            returned_objects=[],
+        )
+    metrics.size(f"map_html:{key}", lambda: _rendered_size(map_))
+    return result
+
+
+def _rendered_size(map_):
+    # st_folium left each element's rendered text on the figure; these are
+    # fixed strings, so this adds up the page without rendering the map again
+    figure = map_.get_root()
+    return sum(len(element.render()) for part in (figure.header, figure.html, figure.script) for element in part._children.values())
+
+
+def add_layer(map_, source, extension, layer_name):
+    if extension in io.TABULAR_EXTENSIONS:
+        loaded = load_tabular_layer(source, extension)
+        if loaded is None:
+            return None, None, None
+        gdf, latitude_column, longitude_column = loaded
+        add_point_layer(map_, source, gdf, latitude_column, longitude_column, layer_name)
+        return gdf, latitude_column, longitude_column
+    loaded = load_vector_layer(source)
+    if loaded is None:
+        return None, None, None
+    gdf, json_data_frame = loaded
+    add_geojson_layer(map_, source, json_data_frame, layer_name)
+    return gdf, None, None
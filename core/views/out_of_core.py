@@ -0,0 +1,171 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+import requests
+import streamlit as st
+
+from core import background, backend, combine, coords, io
+from core.views.common import cached, rewind, source_key
+from core.views.loaders import select_lat_long_columns
+from core.views.tables import data_table
+
+PAGE_SIZE = 1000
+
+
+# Out-of-core mode: files stay on disk and are queried through DuckDB; only
+# the page of rows being shown is materialized as a frame.
+@cached(st.cache_resource)
+def query_backend():
+    return backend.DuckDBBackend(tempfile.mkdtemp(prefix="os_st_gis_"))
+
+
+@cached(st.cache_resource, show_spinner="Copying data to disk...", max_entries=64)
+def spill_to_disk(key, _source, extension):
+    if isinstance(_source, str) and not _source.startswith(("http://", "https://")):
+        return _source
+    path = os.path.join(query_backend().cache_dir, f"{hashlib.sha1(key.encode()).hexdigest()}.{extension}")
+    if isinstance(_source, str):
+        with requests.get(_source, stream=True) as response:
+            response.raise_for_status()
+            with open(path, "wb") as f:
+                shutil.copyfileobj(response.raw, f)
+    else:
+        with open(path, "wb") as f:
+            shutil.copyfileobj(rewind(_source), f)
+    return path
+
+
+@cached(st.cache_resource, show_spinner="Indexing data...", max_entries=64)
+def register_table(name, path, latitude_column=None, longitude_column=None):
+    query_backend().register(name, path, latitude_column, longitude_column)
+    return name
+
+
+@cached(st.cache_data, show_spinner=False, max_entries=256)
+def table_columns(name):
+    return query_backend().columns(name)
+
+
+@cached(st.cache_data, show_spinner=False, max_entries=256)
+def table_distinct(name, column):
+    return query_backend().distinct(name, column)
+
+
+@cached(st.cache_data, show_spinner=False, max_entries=256)
+def table_range(name, column):
+    return query_backend().value_range(name, column)
+
+
+@cached(st.cache_data, show_spinner=False, max_entries=256)
+def table_count(name, predicates):
+    return query_backend().count(name, predicates)
+
+
+def load_out_of_core_layer(source, extension):
+    key = source_key(source)
+    path = spill_to_disk(key, source, extension)
+    if extension not in io.TABULAR_EXTENSIONS:
+        return register_table(key, path), None, None
+    sample = query_backend().page(register_table(key, path), (), 0, coords.SAMPLE_ROWS)
+    latitude_column, longitude_column = select_lat_long_columns(sample, key)
+    name = register_table(f"{key}|{latitude_column}|{longitude_column}", path, latitude_column, longitude_column)
+    return name, latitude_column, longitude_column
+
+
+def area_filter(name, key=None):
+    # Rows inside a longitude/latitude box, for tables with geometries or
+    # coordinate columns
+    table = query_backend().tables[name]
+    if not table.has_geometry and not (table.latitude_column and table.longitude_column):
+        return []
+    text = st.sidebar.text_input("Limit to area (min lon, min lat, max lon, max lat):", key=f"bbox_{key}" if key else None)
+    if not text.strip():
+        return []
+    try:
+        minx, miny, maxx, maxy = (float(value) for value in text.split(","))
+    except ValueError:
+        st.sidebar.error("Enter the area as four numbers separated by commas.")
+        return []
+    return [("bbox", min(minx, maxx), min(miny, maxy), max(minx, maxx), max(miny, maxy))]
+
+
+def out_of_core_filters(name, key=None):
+    st.sidebar.markdown("## Data Manipulation")
+    area = area_filter(name, key)
+    columns = table_columns(name)
+    options = ["Select column"] + list(columns)
+    input_column = st.sidebar.selectbox("Choose column:", options, key=f"column_{key}" if key else None)
+    if input_column == options[0]:
+        return area
+    if columns[input_column].startswith(backend.NUMERIC_TYPES):
+        low, high = table_range(name, input_column)
+        uvalue = st.sidebar.slider(
+            "Select a range of values",
+            float(low),
+            float(high),
+            (float(low), float(high)),
+            key=f"range_{key}" if key else None,
+        )
+        return area + [("between", input_column, uvalue[0], uvalue[1])]
+    uvalue = st.sidebar.multiselect("Select value:", table_distinct(name, input_column), key=f"value_{key}" if key else None)
+    return area + [("in", input_column, uvalue)] if uvalue else area
+
+
+def out_of_core_preview(name, predicates, limit=PAGE_SIZE):
+    return query_backend().page(name, predicates, 0, limit), table_count(name, predicates)
+
+
+def out_of_core_table(key, name, predicates):
+    def fetch(offset, limit, sort_by, descending, search_column, search_text):
+        query = list(predicates)
+        if search_text:
+            query.append(("contains", search_column, search_text))
+        window = query_backend().page(name, query, offset, limit, sort_by, descending)
+        return pd.DataFrame(window.drop(columns="geometry", errors="ignore")), table_count(name, query)
+
+    data_table(key, list(table_columns(name)), fetch)
+
+
+def _export_table(query, name, predicates, path, extension):
+    with open(path, "wb") as sink:
+        query.export(name, sink, predicates, extension)
+    return path
+
+
+def export_out_of_core(name, predicates, layer_name, key=None):
+    # The export runs as a background job, on a thread of this process as
+    # the tables are registered with its DuckDB connection
+    file_format = st.sidebar.selectbox("Export format:", list(combine.EXPORT_FORMATS), key=f"export_format_{key}" if key else None)
+    extension, mime = combine.EXPORT_FORMATS[file_format]
+    job_key = f"export:{name}:{extension}:{predicates!r}"
+    state_key = f"export_job_{key}"
+    if st.sidebar.button("Export filtered data", key=f"export_{key}" if key else None):
+        st.session_state[state_key] = job_key
+    if st.session_state.get(state_key) != job_key:
+        return
+    path = os.path.join(background.job_manager().job_dir, f"{hashlib.sha1(job_key.encode()).hexdigest()}.{extension}")
+    path = background.run(
+        job_key,
+        f"Exporting {layer_name}.{extension}",
+        _export_table,
+        query_backend(),
+        name,
+        predicates,
+        path,
+        extension,
+        container=st.sidebar,
+        in_process=True,
+    )
+    if path is None:
+        return
+    with open(path, "rb") as f:
+        st.sidebar.download_button(
+            label=f"Download filtered data as {file_format}",
+            data=f,
+            file_name=f"{layer_name}.{extension}",
+            mime=mime,
+            key=f"download_{key}" if key else None,
+        )
@@ -0,0 +1,135 @@
+import hashlib
+import math
+import os
+
+import pandas as pd
+import streamlit as st
+
+from core import background, combine, metrics
+from core.table import TableIndex
+from core.views.common import cached
+
+TABLE_PAGE_SIZES = (50, 100, 500, 1000)
+# Reruns only the table when its own widgets change, so paging, sorting and
+# searching don't re-send the map; Streamlit before 1.37 has no fragments
+_fragment = getattr(st, "fragment", None) or (lambda func: func)
+
+
+@cached(st.cache_resource, show_spinner="Indexing table...", max_entries=32)
+def table_index(key, _df):
+    return TableIndex(_df)
+
+
+@_fragment
+def data_table(key, columns, fetch):
+    # Rows are requested one page at a time; sorting and searching happen on
+    # the server and only the visible window is sent to the browser
+    col1, col2, col3 = st.columns([2, 2, 1])
+    with col1:
+        search_column = st.selectbox("Search column:", columns, key=f"search_column_{key}")
+        search_text = st.text_input("Search:", key=f"search_{key}")
+    with col2:
+        sort_by = st.selectbox("Sort by:", ["None"] + list(columns), key=f"sort_{key}")
+        descending = st.checkbox("Descending", key=f"descending_{key}")
+    with col3:
+        page_size = st.selectbox("Rows per page:", TABLE_PAGE_SIZES, index=1, key=f"page_size_{key}")
+
+    page_key = f"table_page_{key}"
+    page = st.session_state.get(page_key, 1)
+    with metrics.span("table_page"):
+        window, total = fetch((page - 1) * page_size, page_size, None if sort_by == "None" else sort_by, descending, search_column, search_text)
+    pages = max(1, math.ceil(total / page_size))
+    if page > pages:
+        st.session_state[page_key] = page = pages
+        with metrics.span("table_page"):
+            window, total = fetch((page - 1) * page_size, page_size, None if sort_by == "None" else sort_by, descending, search_column, search_text)
+
+    st.dataframe(window, use_container_width=True)
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, key=page_key)
+    with col2:
+        first = (page - 1) * page_size
+        st.caption(f"Rows {min(first + 1, total)}-{min(first + page_size, total)} of {total}")
+
+
+def frame_table(key, gdf, rows=None):
+    # The cached index keeps its frame alive, so id() cannot be reused while it is cached
+    index = table_index(f"{key}:{id(gdf)}", gdf)
+
+    def fetch(offset, limit, sort_by, descending, search_column, search_text):
+        return index.window(offset, limit, rows, sort_by, descending, search_column, search_text)
+
+    data_table(key, index.columns, fetch)
+
+
+def frame_fingerprint(df):
+    # Which rows and columns a frame holds: filters keep a subset of the
+    # loaded layer's index, so this tells filtered exports of a layer apart
+    digest = hashlib.sha1(pd.util.hash_array(df.index.to_numpy()).tobytes())
+    digest.update(repr(list(df.columns)).encode())
+    return digest.hexdigest()
+
+
+def export_combined(view, file_name, keys, container=st.sidebar, label="Export combined data"):
+    # Nothing is combined until the user asks; the export then runs as a
+    # background job that streams the layers batch by batch into a file.
+    # The job key names the layers (keys, one per frame), their filtered rows
+    # and the format, so changing any of them needs a new export.
+    file_format = container.selectbox("Export format:", list(combine.EXPORT_FORMATS), key=f"export_format_{file_name}")
+    extension, mime = combine.EXPORT_FORMATS[file_format]
+    fingerprint = hashlib.sha1(
+        repr([(key, frame_fingerprint(frame)) for key, frame in zip(keys, view.frames)] + [view.names, view.crs]).encode()
+    ).hexdigest()
+    job_key = f"export:{file_name}:{extension}:{fingerprint}"
+    state_key = f"export_job_{file_name}"
+    if container.button(label, key=f"export_button_{file_name}"):
+        st.session_state[state_key] = job_key
+    if st.session_state.get(state_key) != job_key:
+        return
+    path = os.path.join(background.job_manager().job_dir, f"{fingerprint}.{extension}")
+    with metrics.span(f"export:{extension}"):
+        # On a thread of this process: the frames are already in memory here,
+        # and copying them into a worker would double the peak
+        path = background.run(
+            job_key, f"Exporting {file_name}.{extension}", combine.export_file, view, path, extension, container=container, in_process=True
+        )
+    if path is None:
+        return
+    metrics.size(f"export:{file_name}.{extension}", os.path.getsize(path))
+    with open(path, "rb") as f:
+        container.download_button(
+            label=f"Download {file_name}.{extension}",
+            data=f,
+            file_name=f"{file_name}.{extension}",
+            mime=mime,
+            key=f"download_{file_name}",
+        )
+
+
+def filter_dataframe(df: pd.DataFrame, key=None) -> pd.DataFrame:
+    st.sidebar.markdown("## Data Manipulation")
+    options = ["Select column"]
+    unique_values = ["Select value"]
+
+    for column in df.columns:
+        options.append(column)
+
+    input_column = st.sidebar.selectbox("Choose column:", options, key=f"column_{key}" if key else None)
+
+    if input_column != options[0]:
+        if not pd.api.types.is_numeric_dtype(df[input_column]):
+            unique_values.extend(df[input_column].unique())
+            uvalue = st.sidebar.multiselect("Select value:", unique_values, key=f"value_{key}" if key else None)
+            if uvalue:
+                df = df[df[input_column].isin(uvalue)]
+        else:
+            uvalue = st.sidebar.slider(
+                "Select a range of values",
+                float(df[input_column].min()),
+                float(df[input_column].max()),
+                (float(df[input_column].min()), float(df[input_column].max())),
+                key=f"range_{key}" if key else None,
+            )
+            df = df[(df[input_column] >= uvalue[0]) & (df[input_column] <= uvalue[1])]
+    return df
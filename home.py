@@ -36,6 +36,7 @@ st.write(
     - **Select Pre-uploaded Files**: Users can choose from a set of pre-uploaded files available via a dropdown menu.
     - **Add URLs**: Enter WFS (Web Feature Service) or ArcREST URLs to load data directly from web services.
     - **View Interactive Map**: The map updates automatically to display data from the selected or uploaded files.
+    - **Raster Layers**: GeoTIFF and Cloud-Optimized GeoTIFF files are shown alongside vector layers, with per-band statistics. Large files display quickly when they have overviews.
     - **Data Table**: The data associated with the map is displayed in a table below the map for easy viewing and analysis.
 
     ### Data Manipulation 📊
@@ -63,6 +64,16 @@ st.write(
     - **Geocode Addresses**: The application geocodes each address to obtain latitude and longitude coordinates.
     - **View Geocoded Data**: The geocoded data, including latitude and longitude, is displayed in a table.
     - **Download Geocoded Data**: Users can download the geocoded dataset as a CSV file.
+    - **Reverse Geocoding**: Users can upload a CSV file with coordinates to find the nearest named place for every row, using the bundled US cities or their own gazetteer, without any network requests.
+
+    ### Spatial Analysis 🧭
+    **Purpose**: The Spatial Analysis page compares two loaded layers, for example geocoded addresses against US cities.
+
+    **Key Features**:
+    - **Spatial Joins**: Join the attributes of one layer to another where their geometries intersect, contain or fall within each other.
+    - **Buffers and Distances**: Buffer a layer by a distance in metres, or find every feature within a distance of another layer.
+    - **Nearest Neighbours**: Find the k nearest features of another layer, with an optional maximum distance.
+    - **Background Processing**: Large analyses run in the background, and their results are reused when the same analysis is run again.
 
     ### How to Use
     1. **Uploading Files**: Navigate to the desired page and use the file uploader to add your data files. Supported formats include CSV, XLSX, ZIP, and GEOJSON.
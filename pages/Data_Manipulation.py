@@ -1,24 +1,24 @@
 import json
 import streamlit as st
-import pandas as pd
-import geopandas as gpd
 import folium
-from streamlit_folium import folium_static
-from folium.plugins import MarkerCluster
-import requests
-import tempfile
+from core import background, backend, io, layers, metrics, monitor, views
+from core.combine import CombinedView
 
 class GeoDataManipulator:
     def __init__(self):
-        self.map = folium.Map([0, 0], zoom_start=2)
-        self.marker_cluster = MarkerCluster().add_to(self.map)
+        self.map = layers.new_map([0, 0], zoom_start=2)
         self.uploaded_files = None
         self.selected_files = None
         self.data_frames = []
+        self.layer_names = []
+        self.layer_keys = []
+        self.data_frame = None
+        self.table = None
+        self.filter_masks = []
+        self.out_of_core = False
+        self.out_of_core_tables = []
         self.latitude_column = None
         self.longitude_column = None
-        self.github_files = {}
-        self.temp_dir = tempfile.TemporaryDirectory()
         self._setup_page()
 
     def _setup_page(self):
@@ -34,237 +34,116 @@ class GeoDataManipulator:
             5. **Download Data**: Download the combined and filtered data as a CSV file using the download button.
             6. **Data Table**: The data associated with the map will be displayed below the map.
             """)
+        if backend.available():
+            self.out_of_core = st.sidebar.toggle(
+                "Out-of-core mode (DuckDB)",
+                help="Query CSV, GeoJSON and ZIP files from disk and only load the page of rows being shown.",
+            )
         self._get_files()
-        self._load_data()
-        self._save_data()
+        with metrics.span("load_data"):
+            self._load_data()
+        with metrics.span("save_data"):
+            self._save_data()
 
     def _get_files(self):
-        uploaded_files = st.file_uploader("Upload one or more files", type=["csv", "xlsx", "zip", "geojson"], accept_multiple_files=True)
-        if uploaded_files:
-            self.uploaded_files = uploaded_files
-        st.write("Or")
-        file_options = self._fetch_github_files()
-        if file_options:
-            selected_files = st.multiselect("Choose one or more options", list(file_options.keys()))
-            self.selected_files = [file_options[file_name] for file_name in selected_files]
-
-    def _fetch_github_files(self):
-        url = "https://api.github.com/repos/rmkenv/OS-ST-GIS/contents/data"
-        response = requests.get(url)
-        if response.status_code == 200:
-            self.github_files = {file_info['name']: file_info['download_url'] for file_info in response.json() if file_info['name'].endswith(('.csv', '.geojson', '.xlsx', '.zip'))}
-            return self.github_files
-        else:
-            st.error(f"Failed to fetch GitHub files. Status code: {response.status_code}")
-            return {}
-
-    def _add_basemaps(self):
-        folium.TileLayer(
-            "https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}",
-            name="ESRI Satellite",
-            attr="ESRI",
-        ).add_to(self.map)
-        folium.TileLayer("CartoDB dark_matter", name="CartoDB Dark").add_to(self.map)
+        self.uploaded_files, self.selected_files = views.get_files(show_error=True)
 
     def _load_data(self):
-        if self.uploaded_files:
-            for uploaded_file in self.uploaded_files:
-                extension = uploaded_file.name.split(".")[-1]
-                if extension in {"csv", "xlsx"}:
-                    self._load_tabular_data(uploaded_file, extension)
-                else:
-                    self._load_geospatial_data(uploaded_file)
-        elif self.selected_files:
-            for file_url in self.selected_files:
-                self._load_data_from_url(file_url)
-
-    def _load_data_from_url(self, url):
-        extension = url.split(".")[-1]
-        layer_name = url.split('/')[-1].split('.')[0]
-        if extension == "geojson":
-            self.data_frame = gpd.read_file(url)
-            json_data_frame = json.loads(self.data_frame.to_json())
-            self._apply_filters(self.data_frame)
-            self._fit_map_to_bounds(self.data_frame.total_bounds)
-            self._add_geojson_layer(json_data_frame, layer_name)
-        elif extension in {"csv", "xlsx"}:
-            self._load_tabular_data_from_url(url, extension)
-        else:
-            st.write("Unsupported URL format or unable to load data.")
-
-    def _load_tabular_data(self, file, extension):
-        if extension == "csv":
-            df = pd.read_csv(file)
-        else:
-            df = pd.read_excel(file, engine="openpyxl")
-
-        self.latitude_column, self.longitude_column = self._select_lat_long_columns(df)
-        gdf = gpd.GeoDataFrame(
-            df,
-            geometry=gpd.points_from_xy(
-                df[self.longitude_column],
-                df[self.latitude_column],
-            ),
-            crs="wgs84",
-        ).dropna(subset=[self.longitude_column, self.latitude_column])
-
+        sources = self.uploaded_files or self.selected_files
+        for source in sources:
+            name = source if isinstance(source, str) else source.name
+            extension = io.file_extension(name)
+            if self.out_of_core and extension != "xlsx":
+                self._load_out_of_core_data(source, extension, io.layer_name(name))
+            elif extension in io.TABULAR_EXTENSIONS:
+                self._load_tabular_data(source, extension, io.layer_name(name))
+            elif isinstance(source, str) and extension != "geojson":
+                st.write("Unsupported URL format or unable to load data.")
+            else:
+                for layer_source, layer_name in views.vector_sources(source, extension, io.layer_name(name)):
+                    self._load_geospatial_data(layer_source, layer_name)
+
+    def _load_tabular_data(self, source, extension, layer_name):
+        loaded = views.load_tabular_layer(source, extension)
+        if loaded is None:
+            return
+        gdf, self.latitude_column, self.longitude_column = loaded
         self.data_frames.append(gdf)
-        self._apply_filters(gdf)
-        self._fit_map_to_bounds(gdf.total_bounds)
-        self._add_markers(gdf)
+        self.layer_names.append(layer_name)
+        self.layer_keys.append(views.source_key(source))
+        self._apply_filters(gdf, views.source_key(source))
+        layers.fit_bounds(self.map, gdf.total_bounds)
+        views.add_point_layer(self.map, source, gdf, self.latitude_column, self.longitude_column, layer_name)
         folium.LayerControl().add_to(self.map)
 
-    def _load_tabular_data_from_url(self, url, extension):
-        if extension == "csv":
-            df = pd.read_csv(url)
-        else:
-            df = pd.read_excel(url, engine="openpyxl")
-
-        self.latitude_column, self.longitude_column = self._select_lat_long_columns(df)
-        gdf = gpd.GeoDataFrame(
-            df,
-            geometry=gpd.points_from_xy(
-                df[self.longitude_column],
-                df[self.latitude_column],
-            ),
-            crs="wgs84",
-        ).dropna(subset=[self.longitude_column, self.latitude_column])
-
+    def _load_geospatial_data(self, source, layer_name):
+        loaded = views.load_vector_layer(source)
+        if loaded is None:
+            return
+        gdf, json_data_frame = loaded
         self.data_frames.append(gdf)
-        self._apply_filters(gdf)
-        self._fit_map_to_bounds(gdf.total_bounds)
-        self._add_markers(gdf)
+        self.layer_names.append(layer_name)
+        self.layer_keys.append(views.source_key(source))
+        self._apply_filters(gdf, views.source_key(source))
+        layers.fit_bounds(self.map, gdf.total_bounds)
+        views.add_geojson_layer(self.map, source, json_data_frame, layer_name)
         folium.LayerControl().add_to(self.map)
 
-    def _select_lat_long_columns(self, df):
-        col1, col2 = st.columns(2)
-
-        with col1:
-            lat_index = self._get_column_index(df, "lat|latitude")
-            latitude_column = st.selectbox(
-                "Choose latitude column:", df.columns, index=lat_index
-            )
-        with col2:
-            lng_index = self._get_column_index(df, "lng|long|longitude")
-            longitude_column = st.selectbox(
-                "Choose longitude column:", df.columns, index=lng_index
-            )
-
-        return latitude_column, longitude_column
-
-    def _get_column_index(self, df, pattern):
-        column_guess = df.columns.str.contains(pattern, case=False)
-        if column_guess.any():
-            return df.columns.get_loc(df.columns[column_guess][0])
-        return 0
-
-    def _load_geospatial_data(self, file):
-        gdf = gpd.read_file(file)
-        self.data_frames.append(gdf)
-        layer_name = file.name.split(".")[0]
-        json_data_frame = json.loads(gdf.to_json())
-        self._apply_filters(gdf)
-        self._fit_map_to_bounds(gdf.total_bounds)
-        self._add_geojson_layer(json_data_frame, layer_name)
-
-    def _fit_map_to_bounds(self, bounds):
-        self.map.fit_bounds([[bounds[1], bounds[0]], [bounds[3], bounds[2]]])
-
-    def _add_markers(self, gdf):
-        for _, row in gdf.iterrows():
-            popup_html = self.create_popup_html(row.drop("geometry"))
-            folium.Marker(
-                location=[row[self.latitude_column], row[self.longitude_column]],
-                popup=folium.Popup(popup_html, max_width=300),
-            ).add_to(self.marker_cluster)
-
-    def _add_geojson_layer(self, json_data_frame, layer_name):
-        if "features" in json_data_frame and json_data_frame["features"]:
-            property_keys = list(json_data_frame["features"][0]["properties"].keys())
-            folium.GeoJson(
-                json_data_frame,
-                name=layer_name,
-                zoom_on_click=True,
-                highlight_function=lambda feature: {"fillColor": "dark gray"},
-                popup=folium.GeoJsonPopup(
-                    fields=property_keys,
-                    aliases=property_keys,
-                    localize=True,
-                    style="max-height: 200px; overflow-y: auto;",
-                ),
-            ).add_to(self.map)
+    def _load_out_of_core_data(self, source, extension, layer_name):
+        key = views.source_key(source)
+        name, self.latitude_column, self.longitude_column = views.load_out_of_core_layer(source, extension)
+        predicates = views.out_of_core_filters(name, key)
+        gdf, total = views.out_of_core_preview(name, predicates)
+        self.out_of_core_tables.append((name, predicates, layer_name, key))
+        self.data_frame = gdf
+        self.table = (views.out_of_core_table, key, name, predicates)
+        st.sidebar.caption(f"{layer_name}: {total} matching rows, showing {len(gdf)}")
+        if gdf.empty:
+            return
+        layers.fit_bounds(self.map, gdf.total_bounds)
+        # The preview is fixed by the table and its predicates
+        fingerprint = (name, repr(predicates))
+        if self.latitude_column:
+            layers.add_markers(self.map, layers.marker_data(gdf, self.latitude_column, self.longitude_column), layer_name, fingerprint)
         else:
-            folium.GeoJson(json_data_frame, name=layer_name, zoom_on_click=True).add_to(self.map)
+            layers.add_geojson_layer(self.map, json.loads(gdf.to_json()), layer_name, fingerprint)
         folium.LayerControl().add_to(self.map)
 
-    def filter_dataframe(self, df: pd.DataFrame) -> pd.DataFrame:
-        st.sidebar.markdown("## Data Manipulation")
-        options = ["Select column"]
-        unique_values = ["Select value"]
-
-        for column in df.columns:
-            options.append(column)
-
-        input_column = st.sidebar.selectbox("Choose column:", options)
-
-        if input_column != options[0]:
-            if df[input_column].dtype == "O":
-                unique_values.extend(df[input_column].unique())
-                uvalue = st.sidebar.multiselect("Select value:", unique_values)
-                if uvalue != unique_values[0]:
-                    df = df[df[input_column].isin(uvalue)]
-            else:
-                uvalue = st.sidebar.slider(
-                    "Select a range of values",
-                    float(df[input_column].min()),
-                    float(df[input_column].max()),
-                    (float(df[input_column].min()), float(df[input_column].max())),
-                )
-                df = df[(df[input_column] >= uvalue[0]) & (df[input_column] <= uvalue[1])]
-        return df
-
-    def _apply_filters(self, gdf):
-        self.data_frame = self.filter_dataframe(gdf)
-
-    def create_popup_html(self, properties):
-        html = "<div style='max-height: 200px; overflow-y: auto;'>"
-        for key, value in properties.items():
-            html += f"<b>{key}</b>: {value}<br>"
-        html += "</div>"
-        return html
+    def _apply_filters(self, gdf, key):
+        with metrics.span("filter"):
+            self.data_frame = views.filter_dataframe(gdf, key)
+        rows = None if self.data_frame is gdf else self.data_frame.index
+        self.table = (views.frame_table, key, gdf, rows)
+        self.filter_masks.append(layers.filter_mask(key, gdf.index, self.data_frame.index))
 
     def _save_data(self):
+        for name, predicates, layer_name, key in self.out_of_core_tables:
+            views.export_out_of_core(name, predicates, layer_name, key)
         if self.data_frames:
-            combined_data = pd.concat(self.data_frames, ignore_index=True)
-            save_path = f"{self.temp_dir.name}/combined_data.csv"
-            combined_data.to_csv(save_path, index=False)
-            st.sidebar.download_button(
-                label="Download combined data as CSV",
-                data=open(save_path, 'rb').read(),
-                file_name="combined_data.csv",
-                mime="text/csv"
-            )
+            views.export_combined(CombinedView(self.data_frames, self.layer_names), "combined_data", self.layer_keys)
 
     def _display_layout(self):
         col1, col2 = st.columns([1, 1])
 
         with col1:
             st.markdown("## Map")
-            folium_static(self.map, width=700, height=500)
+            views.render_map(self.map, self.filter_masks, key="explorer_map", width=700, height=500)
 
         with col2:
             st.markdown("## DataFrame")
-            if not self.data_frames:
+            if self.data_frame is None:
                 st.write("No data available")
             else:
-                st.dataframe(self.data_frame.drop(columns="geometry"))
-                st.download_button(
-                    label="Download data as CSV",
-                    data=self.data_frame.to_csv().encode("utf-8"),
-                    file_name="Streamlit_df.csv",
-                    mime="text/csv",
-                )
+                show_table, *arguments = self.table
+                show_table(*arguments)
+                if show_table is views.frame_table:
+                    views.export_combined(
+                        CombinedView([self.data_frame], self.layer_names[-1:]), "Streamlit_df", self.layer_keys[-1:], container=st, label="Export data"
+                    )
 
 if __name__ == "__main__":
-    app = GeoDataManipulator()
-    app._display_layout()
+    with monitor.recording("Data_Manipulation"):
+        app = GeoDataManipulator()
+        with metrics.span("display"):
+            app._display_layout()
+    background.poll()
@@ -1,55 +1,136 @@
 import streamlit as st
-from geopy.geocoders import Nominatim
-import pandas as pd
-
-# Function to geocode an address
-def geocode_address(address):
-    geolocator = Nominatim(user_agent="streamlit_geocoder")
-    location = geolocator.geocode(address)
-    if location:
-        return location.latitude, location.longitude
+from core import background, geocode, metrics, monitor
+
+MODES = ("Addresses to coordinates", "Coordinates to places")
+
+
+@st.cache_resource(show_spinner="Indexing places...", max_entries=8)
+def place_index(key, _source, extension):
+    from core import coords, io
+
+    if extension in io.TABULAR_EXTENSIONS:
+        df = io.read_tabular(_source, extension)
+        latitude_column, longitude_column = coords.detect_lat_long(df)
+        if latitude_column is None or longitude_column is None:
+            raise ValueError("The gazetteer needs latitude and longitude columns.")
+        places = io.points_from_columns(df, latitude_column, longitude_column)
     else:
-        return None, None
+        places = io.read_vector(_source)
+    return geocode.PlaceIndex(places)
 
-# Streamlit app
-st.title("Batch Geocoding App")
-st.write("Upload a CSV file with columns for street, city, and zip to get the geocoded latitude and longitude.")
 
-# File uploader
-uploaded_file = st.file_uploader("Upload CSV", type=["csv"])
+@st.cache_resource(show_spinner="Finding nearest places...", max_entries=8)
+def nearest_places(key, _df, _index, latitude_column, longitude_column, max_distance, columns, name_column):
+    return geocode.reverse_geocode(_df, _index, latitude_column, longitude_column, max_distance, columns, name_column)
 
-if uploaded_file is not None:
-    # Read CSV file
-    df = pd.read_csv(uploaded_file)
-    
-    # Check if necessary columns are present
-    if all(col in df.columns for col in ['street', 'city', 'zip']):
-        st.write("CSV file uploaded successfully. Here is a preview:")
-        st.dataframe(df.head())
-        
-        if st.button("Geocode"):
-            # Create new columns for latitude and longitude
-            df['latitude'] = None
-            df['longitude'] = None
-            
-            # Geocode each address
-            for i, row in df.iterrows():
-                address = f"{row['street']}, {row['city']}, {row['zip']}"
-                lat, lon = geocode_address(address)
-                df.at[i, 'latitude'] = lat
-                df.at[i, 'longitude'] = lon
-            
-            st.success("Geocoding completed.")
-            st.write("Here is a preview of the geocoded data:")
+
+def address_geocoding():
+    st.write("Upload a CSV file with columns for street, city, and zip to get the geocoded latitude and longitude.")
+
+    # File uploader
+    uploaded_file = st.file_uploader("Upload CSV", type=["csv"])
+
+    if uploaded_file is not None:
+        import pandas as pd
+
+        # Read CSV file
+        df = pd.read_csv(uploaded_file)
+
+        # Check if necessary columns are present
+        if all(col in df.columns for col in geocode.ADDRESS_COLUMNS):
+            st.write("CSV file uploaded successfully. Here is a preview:")
             st.dataframe(df.head())
-            
-            # Option to download the geocoded data
-            csv = df.to_csv(index=False)
-            st.download_button(
-                label="Download geocoded CSV",
-                data=csv,
-                file_name="geocoded_addresses.csv",
-                mime="text/csv"
-            )
+
+            # Geocoding runs as a background job; the page polls until it is done
+            job_key = f"geocode:{uploaded_file.name}:{getattr(uploaded_file, 'file_id', uploaded_file.size)}"
+            if st.button("Geocode"):
+                st.session_state["geocode_job"] = job_key
+
+            if st.session_state.get("geocode_job") == job_key:
+                df = background.run(job_key, "Geocoding addresses", geocode.geocode_addresses, df)
+                if df is not None:
+                    st.success("Geocoding completed.")
+                    st.write("Here is a preview of the geocoded data:")
+                    st.dataframe(df.head())
+
+                    # Option to download the geocoded data
+                    csv = df.to_csv(index=False)
+                    st.download_button(
+                        label="Download geocoded CSV",
+                        data=csv,
+                        file_name="geocoded_addresses.csv",
+                        mime="text/csv"
+                    )
+        else:
+            st.error("CSV file must contain 'street', 'city', and 'zip' columns.")
+
+
+def reverse_geocoding():
+    st.write("Upload a CSV file with latitude and longitude columns to find the nearest named place for every row. No requests are sent to a geocoding service.")
+
+    # Reference places: the bundled US cities or an uploaded gazetteer
+    reference = st.radio("Reference places:", ["US cities", "Upload a gazetteer"], horizontal=True)
+    if reference == "US cities":
+        places_key, places_source, places_extension = geocode.DEFAULT_PLACES, geocode.DEFAULT_PLACES, "geojson"
     else:
-        st.error("CSV file must contain 'street', 'city', and 'zip' columns.")
+        gazetteer = st.file_uploader("Upload gazetteer (CSV with coordinates or GeoJSON)", type=["csv", "geojson"], key="gazetteer_file")
+        if gazetteer is None:
+            return
+        places_key = f"{gazetteer.name}:{getattr(gazetteer, 'file_id', gazetteer.size)}"
+        places_source, places_extension = gazetteer, gazetteer.name.split(".")[-1].lower()
+    try:
+        index = place_index(places_key, places_source, places_extension)
+    except ValueError as e:
+        st.error(str(e))
+        return
+
+    uploaded_file = st.file_uploader("Upload CSV", type=["csv"], key="reverse_file")
+    if uploaded_file is None:
+        return
+
+    import pandas as pd
+    from core import coords
+
+    df = pd.read_csv(uploaded_file)
+    columns = list(df.columns)
+    latitude_guess, longitude_guess = coords.detect_lat_long(df)
+    col1, col2 = st.columns(2)
+    latitude_column = col1.selectbox("Latitude column:", columns, index=columns.index(latitude_guess) if latitude_guess in columns else 0)
+    longitude_column = col2.selectbox("Longitude column:", columns, index=columns.index(longitude_guess) if longitude_guess in columns else min(1, len(columns) - 1))
+
+    place_columns = list(index.places.columns)
+    name_column = st.selectbox("Place name column:", place_columns, index=place_columns.index(index.name_column) if index.name_column in place_columns else 0)
+    extra_columns = st.multiselect("Other place columns to add:", [column for column in place_columns if column != name_column])
+    max_distance_km = st.number_input("Maximum distance in km (0 for no limit):", min_value=0.0, value=0.0, step=10.0)
+
+    job_key = f"reverse:{uploaded_file.name}:{getattr(uploaded_file, 'file_id', uploaded_file.size)}:{places_key}"
+    if st.button("Find nearest places"):
+        st.session_state["reverse_job"] = job_key
+    if st.session_state.get("reverse_job") != job_key:
+        return
+
+    with metrics.span("reverse_geocode"):
+        df = nearest_places(
+            job_key, df, index, latitude_column, longitude_column, max_distance_km * 1000 or None, tuple(extra_columns), name_column
+        )
+    found = int(df["nearest_place"].notna().sum()) if "nearest_place" in df else 0
+    st.success(f"Found a place for {found} of {len(df)} rows.")
+    st.dataframe(df.head())
+    st.download_button(
+        label="Download CSV with places",
+        data=df.to_csv(index=False),
+        file_name="reverse_geocoded.csv",
+        mime="text/csv"
+    )
+
+
+if __name__ == "__main__":
+    # Streamlit app
+    with monitor.recording("Geocoder"):
+        st.title("Batch Geocoding App")
+        mode = st.radio("Mode:", MODES, horizontal=True)
+        if mode == MODES[0]:
+            address_geocoding()
+        else:
+            reverse_geocoding()
+    background.poll()
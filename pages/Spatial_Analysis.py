@@ -0,0 +1,119 @@
+import streamlit as st
+import folium
+from core import background, io, layers, metrics, monitor, views
+from core.combine import CombinedView
+
+class SpatialAnalyzer:
+    def __init__(self):
+        self.map = layers.new_map([0, 0], zoom_start=2)
+        self.uploaded_files = None
+        self.selected_files = None
+        self.layers = {}
+        self.result = None
+        self.result_key = None
+        self.result_name = None
+        self.latitude_column = None
+        self.longitude_column = None
+        self._setup_page()
+
+    def _setup_page(self):
+        st.set_page_config(page_title="Spatial Analysis", layout="wide", page_icon="🧭")
+        st.sidebar.markdown("# Spatial Analysis 🧭")
+        with st.sidebar.expander("User Instructions"):
+            st.markdown("""
+            ### Instructions:
+            1. **Upload Files**: Use the uploader to add your own files in CSV, XLSX, ZIP, or GEOJSON formats.
+            2. **Select Files**: Alternatively, select from pre-uploaded files using the dropdown menu.
+            3. **Choose an Analysis**: Pick a spatial join, buffer, within-distance or nearest-neighbour analysis and the layers to compare.
+            4. **Run**: Results are computed in the background and reused when the same layers and options are run again.
+            5. **Data Table**: The result is shown on the map and in the table below it, and can be exported.
+            """)
+        self._get_files()
+        with metrics.span("load_data"):
+            self._load_data()
+        if not self.layers:
+            st.info("Upload or select at least one layer to analyse.")
+            return
+        with metrics.span("analysis"):
+            self._run_analysis()
+        with metrics.span("display"):
+            self._display_layout()
+
+    def _get_files(self):
+        self.uploaded_files, self.selected_files = views.get_files(show_error=True)
+
+    def _load_data(self):
+        sources = self.uploaded_files or self.selected_files
+        for source in sources:
+            name = source if isinstance(source, str) else source.name
+            extension = io.file_extension(name)
+            if extension in io.TABULAR_EXTENSIONS:
+                loaded = views.load_tabular_layer(source, extension)
+                if loaded is not None:
+                    gdf, latitude_column, longitude_column = loaded
+                    self.layers[io.layer_name(name)] = (views.source_key(source), gdf, latitude_column, longitude_column)
+            elif isinstance(source, str) and extension != "geojson":
+                st.write("Unsupported URL format or unable to load data.")
+            else:
+                for layer_source, layer_name in views.vector_sources(source, extension, io.layer_name(name)):
+                    loaded = views.load_vector_layer(layer_source)
+                    if loaded is not None:
+                        self.layers[layer_name] = (views.source_key(layer_source), loaded[0], None, None)
+
+    def _analysis_options(self, operation):
+        from core import analysis
+
+        if operation == "Spatial join":
+            predicate = st.sidebar.selectbox("Relationship:", analysis.PREDICATES, key="analysis_predicate")
+            how = st.sidebar.selectbox("Keep:", analysis.JOIN_TYPES, format_func={"inner": "Matched rows", "left": "All rows"}.get, key="analysis_how")
+            return {"predicate": predicate, "how": how}
+        if operation in ("Buffer", "Within distance"):
+            distance = st.sidebar.number_input("Distance (metres):", min_value=0.0, value=1000.0, step=100.0, key="analysis_distance")
+            return {"distance": distance}
+        k = st.sidebar.number_input("Neighbours (k):", min_value=1, max_value=20, value=1, key="analysis_k")
+        max_distance = st.sidebar.number_input("Maximum distance in metres (0 for none):", min_value=0.0, value=0.0, step=1000.0, key="analysis_max_distance")
+        return {"k": int(k), "max_distance": max_distance or None}
+
+    def _run_analysis(self):
+        from core import analysis
+
+        names = list(self.layers)
+        operation = st.sidebar.selectbox("Analysis:", analysis.OPERATIONS, key="analysis_operation")
+        left_name = st.sidebar.selectbox("Layer:" if operation == "Buffer" else "Target layer:", names, key="analysis_left")
+        right_name = None
+        if operation != "Buffer":
+            right_name = st.sidebar.selectbox("Join layer:", names, index=min(1, len(names) - 1), key="analysis_right")
+        options = self._analysis_options(operation)
+
+        # The job key identifies the input pair and options, so a finished
+        # result is reused by any session that asks for the same analysis
+        left_key, left_gdf, self.latitude_column, self.longitude_column = self.layers[left_name]
+        right_key, right_gdf = self.layers[right_name][:2] if right_name else (None, None)
+        job_key = f"analysis:{operation}:{left_key}:{right_key}:{sorted(options.items())}"
+        if st.sidebar.button("Run analysis"):
+            st.session_state["analysis_job"] = job_key
+        if st.session_state.get("analysis_job") != job_key and background.job_manager().get(job_key) is None:
+            return
+        self.result = background.run(job_key, f"{operation} of {left_name}", analysis.run, operation, left_gdf, right_gdf, **options)
+        self.result_key = job_key
+        self.result_name = f"{left_name}_{operation.lower().replace(' ', '_')}"
+
+    def _display_layout(self):
+        if self.result is None:
+            return
+        st.markdown(f"## Result: {len(self.result)} rows")
+        if len(self.result):
+            layers.fit_bounds(self.map, self.result.total_bounds)
+            if self.latitude_column and self.result.geom_type.eq("Point").all():
+                views.add_point_layer(self.map, self.result_key, self.result, self.latitude_column, self.longitude_column, self.result_name)
+            else:
+                views.add_geojson_layer(self.map, self.result_key, views.layer_geojson(self.result_key, self.result), self.result_name)
+            folium.LayerControl().add_to(self.map)
+        views.render_map(self.map, key="analysis_map", width=1000)
+        views.frame_table(self.result_key, self.result)
+        views.export_combined(CombinedView([self.result], [self.result_name]), self.result_name, [self.result_key], container=st, label="Export result")
+
+if __name__ == "__main__":
+    with monitor.recording("Spatial_Analysis"):
+        SpatialAnalyzer()
+    background.poll()
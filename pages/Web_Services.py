@@ -1,24 +1,18 @@
-import json
 import requests
 import streamlit as st
-import pandas as pd
-import geopandas as gpd
 import folium
-from streamlit_folium import folium_static
-from folium.plugins import MarkerCluster
-import tempfile
+from core import background, io, layers, metrics, monitor, services, views
 
 class GeoDataVisualizer:
     def __init__(self):
-        self.map = folium.Map(location=[39.0458, -76.6413], zoom_start=7)  # Centered on Maryland
-        self.marker_cluster = MarkerCluster().add_to(self.map)
+        self.map = layers.new_map(location=[39.0458, -76.6413], zoom_start=7)  # Centered on Maryland
         self.uploaded_files = []
         self.selected_files = []
         self.data_frames = []
+        self.layer_keys = []
         self.latitude_column = None
         self.longitude_column = None
-        self.github_files = {}
-        self.temp_dir = tempfile.TemporaryDirectory()
+        self.refresh_age = None
         self._setup_page()
 
     def _setup_page(self):
@@ -33,20 +27,28 @@ class GeoDataVisualizer:
             4. **View Map**: The map will automatically update to display the data from the selected or uploaded files.
             5. **Data Table**: The data associated with the map will be displayed below the map.
             """)
+        self._refresh_options()
         self._get_files()
         if self.uploaded_files or self.selected_files:
-            self._load_data()
-            self._display_layout()
+            with metrics.span("load_data"):
+                self._load_data()
+            with metrics.span("display"):
+                self._display_layout()
+
+    def _refresh_options(self):
+        with st.sidebar.expander("Service refresh"):
+            incremental = st.toggle(
+                "Keep local snapshots",
+                value=True,
+                help="Fetch each WFS and ArcREST layer once, then only the features changed since.",
+            )
+            interval = st.number_input("Check for changes every (seconds)", 5, 3600, services.REFRESH_SECONDS, step=5)
+            refresh_now = st.button("Refresh now", disabled=not incremental)
+        if incremental:
+            self.refresh_age = 0 if refresh_now else interval
 
     def _get_files(self):
-        uploaded_files = st.file_uploader("Upload one or more files", type=["csv", "xlsx", "zip", "geojson"], accept_multiple_files=True)
-        if uploaded_files:
-            self.uploaded_files = uploaded_files
-        st.write("Or")
-        file_options = self._fetch_github_files()
-        if file_options:
-            selected_files = st.multiselect("Choose one or more options", list(file_options.keys()))
-            self.selected_files = [file_options[file_name] for file_name in selected_files]
+        self.uploaded_files, self.selected_files = views.get_files()
         
         st.write("Or")
         wfs_url = st.text_input("Enter WFS URL")
@@ -58,15 +60,6 @@ class GeoDataVisualizer:
         if arcrest_url:
             self.selected_files.append(arcrest_url)
 
-    def _fetch_github_files(self):
-        url = "https://api.github.com/repos/rmkenv/OS-ST-GIS/contents/data"
-        response = requests.get(url)
-        if response.status_code == 200:
-            self.github_files = {file_info['name']: file_info['download_url'] for file_info in response.json() if file_info['name'].endswith(('.csv', '.geojson', '.xlsx', '.zip'))}
-            return self.github_files
-        else:
-            return {}
-
     def _load_data(self):
         all_files = self.uploaded_files + self.selected_files
         if all_files:
@@ -80,169 +73,75 @@ class GeoDataVisualizer:
                         self._load_data_from_url(file)
                 else:
                     self._load_data_from_file(file)
-            self._fit_map_to_all_bounds()
+            if self.data_frames:
+                layers.fit_bounds(self.map, layers.combined_bounds(self.data_frames))
             folium.LayerControl().add_to(self.map)
-            folium_static(self.map, width=1000)
-            self._display_all_data()
 
     def _load_data_from_url(self, url):
-        extension = url.split(".")[-1]
-        layer_name = url.split('/')[-1].split('.')[0]
-        if extension == "geojson":
-            data_frame = gpd.read_file(url)
-            self.data_frames.append(data_frame)
-            json_data_frame = json.loads(data_frame.to_json())
-            self._add_geojson_layer(json_data_frame, layer_name)
-        elif extension in {"csv", "xlsx"}:
-            data_frame = self._load_tabular_data(url, extension)
-            self.data_frames.append(data_frame)
-            self._add_markers(data_frame)
+        extension = io.file_extension(url)
+        if extension in {"geojson", "csv", "xlsx"}:
+            self._load_layer(url, extension, io.layer_name(url))
         else:
             st.write("Unsupported URL format or unable to load data.")
 
     def _load_wfs_data(self, url):
-        wfs_gdf = gpd.read_file(url)
+        loaded = views.load_service_layer(url, "wfs", self.refresh_age)
+        if loaded is None:
+            return
+        wfs_gdf, json_data_frame, data_key = loaded
         self.data_frames.append(wfs_gdf)
-        self._add_geojson_layer(json.loads(wfs_gdf.to_json()), "WFS Layer")
+        self.layer_keys.append(f"wfs:{url}")
+        views.add_geojson_layer(self.map, url, json_data_frame, "WFS Layer", data_key)
 
     def _load_arcrest_data(self, url):
-        response = requests.get(url)
-        if response.status_code == 200:
-            arcrest_gdf = gpd.GeoDataFrame.from_features(response.json()["features"])
-            self.data_frames.append(arcrest_gdf)
-            self._add_geojson_layer(json.loads(arcrest_gdf.to_json()), "ArcREST Layer")
-        else:
+        try:
+            loaded = views.load_service_layer(url, "arcrest", self.refresh_age)
+        except (requests.RequestException, services.ServiceError):
             st.write("Failed to load ArcREST data")
+            return
+        if loaded is None:
+            return
+        arcrest_gdf, json_data_frame, data_key = loaded
+        self.data_frames.append(arcrest_gdf)
+        self.layer_keys.append(f"arcrest:{url}")
+        views.add_geojson_layer(self.map, url, json_data_frame, "ArcREST Layer", data_key)
 
     def _load_data_from_file(self, uploaded_file):
-        extension = uploaded_file.name.split(".")[-1]
-        if extension in {"csv", "xlsx"}:
-            data_frame = self._load_tabular_data(uploaded_file, extension)
-            self.data_frames.append(data_frame)
-            self._add_markers(data_frame)
-        else:
-            data_frame = gpd.read_file(uploaded_file)
-            self.data_frames.append(data_frame)
-            layer_name = uploaded_file.name.split(".")[0]
-            json_data_frame = json.loads(data_frame.to_json())
-            self._add_geojson_layer(json_data_frame, layer_name)
-
-    def _load_tabular_data(self, file, extension):
-        if extension == "csv":
-            data_frame = pd.read_csv(file)
-        else:
-            data_frame = pd.read_excel(file, engine="openpyxl")
-
-        self.latitude_column, self.longitude_column = self._select_lat_long_columns(data_frame)
-
-        data_frame = gpd.GeoDataFrame(
-            data_frame,
-            geometry=gpd.points_from_xy(
-                data_frame[self.longitude_column],
-                data_frame[self.latitude_column],
-            ),
-            crs="wgs84",
-        ).dropna(subset=[self.longitude_column, self.latitude_column])
-
-        return data_frame
-
-    def _select_lat_long_columns(self, data_frame):
-        col1, col2 = st.columns(2)
-
-        with col1:
-            lat_index = self._get_column_index(data_frame, "lat|latitude")
-            latitude_column = st.selectbox(
-                "Choose latitude column:", data_frame.columns, index=lat_index
-            )
-        with col2:
-            lng_index = self._get_column_index(data_frame, "lng|long|longitude")
-            longitude_column = st.selectbox(
-                "Choose longitude column:", data_frame.columns, index=lng_index
-            )
-
-        return latitude_column, longitude_column
-
-    def _get_column_index(self, data_frame, pattern):
-        column_guess = data_frame.columns.str.contains(pattern, case=False)
-        if column_guess.any():
-            return data_frame.columns.get_loc(data_frame.columns[column_guess][0])
-        return 0
-
-    def _add_geojson_layer(self, json_data_frame, layer_name):
-        if "features" in json_data_frame and json_data_frame["features"]:
-            property_keys = list(json_data_frame["features"][0]["properties"].keys())
-            folium.GeoJson(
-                json_data_frame,
-                name=layer_name,
-                zoom_on_click=True,
-                highlight_function=lambda feature: {"fillColor": "dark gray"},
-                popup=folium.GeoJsonPopup(
-                    fields=property_keys,
-                    aliases=property_keys,
-                    localize=True,
-                    style="max-height: 200px; overflow-y: auto;",
-                ),
-            ).add_to(self.map)
-        else:
-            folium.GeoJson(json_data_frame, name=layer_name, zoom_on_click=True).add_to(self.map)
-
-    def _fit_map_to_bounds(self, bounds):
-        self.map.fit_bounds([[bounds[1], bounds[0]], [bounds[3], bounds[2]]])
-
-    def _fit_map_to_all_bounds(self):
-        if self.data_frames:
-            combined_bounds = None
-            for data_frame in self.data_frames:
-                if combined_bounds is None:
-                    combined_bounds = data_frame.total_bounds
-                else:
-                    combined_bounds[0] = min(combined_bounds[0], data_frame.total_bounds[0])
-                    combined_bounds[1] = min(combined_bounds[1], data_frame.total_bounds[1])
-                    combined_bounds[2] = max(combined_bounds[2], data_frame.total_bounds[2])
-                    combined_bounds[3] = max(combined_bounds[3], data_frame.total_bounds[3])
-            self._fit_map_to_bounds(combined_bounds)
-
-    def _add_markers(self, data_frame):
-        for _, row in data_frame.iterrows():
-            popup_html = self.create_popup_html(row[:-1])
-            folium.Marker(
-                location=[row[self.latitude_column], row[self.longitude_column]],
-                popup=folium.Popup(popup_html, max_width=300),
-            ).add_to(self.marker_cluster)
-
-    def _display_data(self, data_frame):
-        st.dataframe(data_frame.drop(columns="geometry"))
+        extension = io.file_extension(uploaded_file.name)
+        for source, layer_name in views.vector_sources(uploaded_file, extension, io.layer_name(uploaded_file.name)):
+            self._load_layer(source, extension if source is uploaded_file else io.file_extension(source), layer_name)
+
+    def _load_layer(self, source, extension, layer_name):
+        data_frame, latitude_column, longitude_column = views.add_layer(self.map, source, extension, layer_name)
+        if data_frame is None:
+            return
+        self.data_frames.append(data_frame)
+        self.layer_keys.append(views.source_key(source))
+        if latitude_column is not None:
+            self.latitude_column, self.longitude_column = latitude_column, longitude_column
+
+    def _display_data(self, key, data_frame):
+        views.frame_table(key, data_frame)
 
     def _display_all_data(self):
-        for data_frame in self.data_frames:
-            self._display_data(data_frame)
-
-    def create_popup_html(self, properties):
-        html = "<div style='max-height: 200px; overflow-y: auto;'>"
-        for key, value in properties.items():
-            html += f"<b>{key}</b>: {value}<br>"
-        html += "</div>"
-        return html
+        for key, data_frame in zip(self.layer_keys, self.data_frames):
+            self._display_data(key, data_frame)
 
     def _display_layout(self):
         col1, col2 = st.columns([1, 1])
 
         with col1:
             st.markdown("## Map")
-            folium_static(self.map, width=1000)
+            views.render_map(self.map, key="layers_map", width=1000)
 
         with col2:
             st.markdown("## Data Table")
             if not self.data_frames:
                 st.write("No data available")
             else:
-                st.dataframe(self.data_frame.drop(columns="geometry"))
-                st.download_button(
-                    label="Download data as CSV",
-                    data=self.data_frame.to_csv().encode("utf-8"),
-                    file_name="Streamlit_df.csv",
-                    mime="text/csv",
-                )
+                self._display_all_data()
 
 if __name__ == "__main__":
-    GeoDataVisualizer()
+    with monitor.recording("Web_Services"):
+        GeoDataVisualizer()
+    background.poll()